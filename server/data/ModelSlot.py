@@ -26,6 +26,9 @@ class RVCModelSlot(ModelSlot):
     modelFile: str = ""
     modelFileOnnx: str = ""
     indexFile: str = ""
+    # Compressed index and its vector table written by compress_index. Used instead of indexFile if set.
+    indexFileCompressed: str = ""
+    indexTableFile: str = ""
     defaultTune: int = 0
     defaultFormantShift: float = 0
     defaultIndexRatio: float = 0
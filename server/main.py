@@ -33,6 +33,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 settings = get_settings()
+# torch.compile kernels are cached on disk and reused across restarts.
+os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.abspath(settings.compile_cache_dir))
 
 def setupArgParser():
     parser = argparse.ArgumentParser()
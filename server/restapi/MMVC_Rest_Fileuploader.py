@@ -22,6 +22,7 @@ class MMVC_Rest_Fileuploader:
         self.router.add_api_route("/update_settings", self.post_update_settings, methods=["POST"])
         self.router.add_api_route("/load_model", self.post_load_model, methods=["POST"])
         self.router.add_api_route("/onnx", self.get_onnx, methods=["GET"])
+        self.router.add_api_route("/compress_index", self.post_compress_index, methods=["POST"])
         self.router.add_api_route("/merge_model", self.post_merge_models, methods=["POST"])
         self.router.add_api_route("/update_model_default", self.post_update_model_default, methods=["POST"])
         self.router.add_api_route("/update_model_info", self.post_update_model_info, methods=["POST"])
@@ -43,9 +44,9 @@ class MMVC_Rest_Fileuploader:
         except Exception as e:
             logger.exception(e)
 
-    def post_update_settings(self, key: str = Form(...), val: Union[int, str, float] = Form(...)):
+    def post_update_settings(self, key: str = Form(...), val: Union[int, str, float] = Form(...), sessionId: str | None = Form(None)):
         try:
-            info = self.voiceChangerManager.update_settings(key, val)
+            info = self.voiceChangerManager.update_settings(key, val, sessionId)
             json_compatible_item_data = jsonable_encoder(info)
             return JSONResponse(content=json_compatible_item_data)
         except Exception as e:
@@ -78,6 +79,14 @@ class MMVC_Rest_Fileuploader:
         except Exception as e:
             logger.exception(e)
 
+    def post_compress_index(self, mode: str = Form(...), tableDtype: str = Form(...)):
+        try:
+            info = self.voiceChangerManager.compress_index(mode, tableDtype)
+            json_compatible_item_data = jsonable_encoder(info)
+            return JSONResponse(content=json_compatible_item_data)
+        except Exception as e:
+            logger.exception(e)
+
     async def post_merge_models(self, request: str = Form(...)):
         try:
             logger.info(request)
@@ -36,7 +36,9 @@ class MMVC_Rest_VoiceChanger:
 
             unpackedData = np.frombuffer(voice, dtype=np.int16).astype(np.float32) / 32768
 
-            out_audio, vol, perf, err = self.voiceChangerManager.change_voice(unpackedData)
+            # Clients that identify themselves get their own conversion session.
+            client_id = req.headers.get("x-client-id")
+            out_audio, vol, perf, err = await self.voiceChangerManager.change_voice_async(unpackedData, client_id)
             out_audio = (out_audio * 32767).astype(np.int16).tobytes()
 
             if err is not None:
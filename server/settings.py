@@ -23,6 +23,9 @@ class ServerSettings(BaseSettings):
     rmvpe_onnx: str = 'pretrain/rmvpe.onnx'
     fcpe: str = 'pretrain/fcpe.pt'
     fcpe_onnx: str = 'pretrain/fcpe.onnx'
+    compile_cache_dir: str = 'compile_cache'
+    # Memory cap (MB) for loaded embedders and pitch extractors. Unused ones are unloaded, least recently used first.
+    shared_model_memory: int = 1024
     host: str = '127.0.0.1'
     port: int = 18888
     allowed_origins: Literal['*'] | list[str] = []
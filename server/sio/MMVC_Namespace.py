@@ -45,7 +45,7 @@ class MMVC_Namespace(socketio.AsyncNamespace):
         # Receive and send int16 instead of float32 to reduce bandwidth requirement over websocket
         input_audio = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768
 
-        out_audio, vol, perf, err = self.voiceChangerManager.change_voice(input_audio)
+        out_audio, vol, perf, err = await self.voiceChangerManager.change_voice_async(input_audio, sid)
         if err is not None:
             error_code, error_message = err
             await self.emit("error", [error_code, error_message], to=sid)
@@ -56,5 +56,7 @@ class MMVC_Namespace(socketio.AsyncNamespace):
             await self.emit("response", [send_timestamp, out_audio, ping, vol, perf], to=sid)
 
     def on_disconnect(self, sid):
-        self.sid = None
+        if self.sid == sid:
+            self.sid = None
+        self.voiceChangerManager.close_session(sid)
         logger.info(f"Disconnected SID: {sid}")
@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Server modules import each other relative to the server directory (see main.py).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def manager():
+    """VoiceChangerManager without a loaded model, server audio or stored settings."""
+    try:
+        VoiceChangerManager = pytest.importorskip('voice_changer.VoiceChangerManager').VoiceChangerManager
+    except OSError as e:
+        # sounddevice raises OSError when the PortAudio library is missing.
+        pytest.skip(str(e))
+    from voice_changer.VoiceChangerSettings import VoiceChangerSettings
+    from voice_changer.VoiceChangerV2 import VoiceChangerV2
+
+    manager = VoiceChangerManager.__new__(VoiceChangerManager)
+    manager.settings = VoiceChangerSettings()
+    manager.vc = VoiceChangerV2(manager.settings, record_io=False)
+    manager.sessions = {}
+    manager.sessions_lock = threading.Lock()
+    manager.closed_sessions = OrderedDict()
+    manager.session_queues = {}
+    manager.executor = ThreadPoolExecutor(max_workers=1)
+    manager.get_info = lambda: {}
+    yield manager
+    manager.executor.shutdown()
+
+
+@pytest.fixture
+def device_manager(monkeypatch):
+    """DeviceManager on CPU in fp32."""
+    torch = pytest.importorskip('torch')
+    DeviceManager = pytest.importorskip('voice_changer.common.deviceManager.DeviceManager').DeviceManager
+
+    device_manager = DeviceManager.get_instance()
+    monkeypatch.setattr(device_manager, 'device', torch.device('cpu'))
+    monkeypatch.setattr(device_manager, 'device_metadata', {'id': -1, 'name': 'CPU', 'backend': 'cpu'}, raising=False)
+    monkeypatch.setattr(device_manager, 'fp16_available', False)
+    monkeypatch.setattr(device_manager, 'force_fp32', False)
+    return device_manager
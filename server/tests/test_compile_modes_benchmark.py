@@ -0,0 +1,69 @@
+import json
+import os
+import statistics
+import time
+
+import pytest
+
+torch = pytest.importorskip('torch')
+safetensors_torch = pytest.importorskip('safetensors.torch')
+RVCInferencerv2 = pytest.importorskip('voice_changer.RVC.inferencer.RVCInferencerv2').RVCInferencerv2
+from voice_changer.RVC.inferencer.rvc_models.infer_pack.models import SynthesizerTrnMs768NSFsid  # noqa: E402
+from voice_changer.common.rmvpe.rmvpe import E2E, RMVPE  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not os.environ.get('RUN_BENCHMARKS'), reason='set RUN_BENCHMARKS=1 to compare compile modes')
+
+MODES = ('eager', 'jit', 'compile')
+# v2 40k generator.
+CONFIG = [1025, 32, 192, 192, 768, 2, 6, 3, 0, '1', [3, 7, 11], [[1, 3, 5]] * 3, [10, 10, 2, 2], 512, [16, 16, 4, 4], 109, 256, 40000]
+# One second of 16 kHz audio, 100 feature frames.
+SAMPLES, FRAMES = 16000, 100
+
+
+def median_time(fn, runs: int = 10) -> float:
+    # The first calls script or compile the model, they are not timed.
+    for _ in range(3):
+        fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+@pytest.fixture
+def cpu(device_manager, monkeypatch):
+    monkeypatch.setattr(device_manager, 'disable_jit', False, raising=False)
+    return device_manager
+
+
+def test_stage_times_per_compile_mode(tmp_path, cpu, monkeypatch):
+    torch.manual_seed(0)
+    generator = str(tmp_path / 'generator.safetensors')
+    safetensors_torch.save_file(SynthesizerTrnMs768NSFsid(*CONFIG, is_half=False).state_dict(), generator, metadata={'config': json.dumps(CONFIG)})
+    rmvpe = str(tmp_path / 'rmvpe.pt')
+    torch.save(E2E(4, 1, (2, 2)).state_dict(), rmvpe)
+
+    audio = torch.randn(SAMPLES)
+    feats = torch.randn(1, FRAMES, 768)
+    pitch = torch.randint(1, 255, (1, FRAMES))
+    pitchf = torch.rand(1, FRAMES) * 400
+    lengths, sid = torch.tensor([FRAMES]), torch.tensor([0])
+
+    times = {}
+    for mode in MODES:
+        monkeypatch.setattr(cpu, 'compile_mode', mode)
+        extractor = RMVPE(rmvpe, False, mode, cpu.device)
+        inferencer = RVCInferencerv2().load_model(generator)
+        with torch.no_grad():
+            times[mode] = (
+                median_time(lambda: extractor.infer_from_audio_t(audio)),
+                median_time(lambda: inferencer.infer(feats, lengths, pitch, pitchf, sid, 0, FRAMES, FRAMES)),
+            )
+
+    print(f'\nCPU, {torch.get_num_threads()} threads, median per 1 s window (ms)')
+    print(f'{"mode":<8} {"pitch (RMVPE)":>14} {"inference (v2)":>15}')
+    for mode, (pitch_time, infer_time) in times.items():
+        print(f'{mode:<8} {pitch_time * 1000:>14.1f} {infer_time * 1000:>15.1f}')
+    assert times.keys() == set(MODES)
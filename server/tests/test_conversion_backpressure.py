@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+
+
+def run_chunks(manager, policy: str, max_pending: int, chunks: int) -> list[tuple[str, int, bool | None]]:
+    manager.settings.staleChunkPolicy = policy
+    manager.settings.maxPendingChunks = str(max_pending)
+    calls = []
+
+    def change_voice(data, session_id):
+        calls.append(('convert', data, None))
+        return data
+
+    def skip_voice(data, session_id, merge):
+        calls.append(('skip', data, merge))
+        return -data
+
+    manager.change_voice = change_voice
+    manager.skip_voice = skip_voice
+
+    async def send():
+        # All chunks arrive while the first one is converted.
+        return await asyncio.gather(*(manager.change_voice_async(i, 'a') for i in range(chunks)))
+
+    results = asyncio.run(send())
+    # Every chunk is answered, in arrival order.
+    assert [abs(r) for r in results] == list(range(chunks))
+    return calls
+
+
+@pytest.mark.parametrize('policy,merge', [('drop', False), ('merge', True)])
+def test_stale_chunks_are_not_converted(manager, policy: str, merge: bool):
+    calls = run_chunks(manager, policy, max_pending=2, chunks=5)
+
+    # Chunks 1 and 2 have more than 2 chunks waiting behind them when their turn comes.
+    assert calls == [
+        ('convert', 0, None),
+        ('skip', 1, merge),
+        ('skip', 2, merge),
+        ('convert', 3, None),
+        ('convert', 4, None),
+    ]
+
+
+def test_no_back_pressure(manager):
+    calls = run_chunks(manager, 'none', max_pending=2, chunks=5)
+
+    assert calls == [('convert', i, None) for i in range(5)]
+
+
+def test_sessions_do_not_hold_back_each_other(manager):
+    manager.settings.maxPendingChunks = '1'
+    manager.change_voice = lambda data, session_id: data
+    manager.skip_voice = lambda data, session_id, merge: None
+
+    async def send():
+        return await asyncio.gather(*(manager.change_voice_async(i, f'client{i}') for i in range(4)))
+
+    # One chunk per session is never stale, however many sessions are busy.
+    assert asyncio.run(send()) == [0, 1, 2, 3]
+
+
+def test_event_loop_stays_responsive_under_load(manager):
+    # Conversion blocks its thread for a whole chunk, as when waiting on the device worker.
+    conversion_time = 0.2
+    manager.change_voice = lambda data, session_id: time.sleep(conversion_time) or data
+
+    async def tick(lateness: list[float], done: asyncio.Event):
+        interval = 0.005
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lateness.append(time.perf_counter() - start - interval)
+
+    async def send():
+        lateness, done = [], asyncio.Event()
+        ticker = asyncio.create_task(tick(lateness, done))
+        # More sessions than conversion threads keep the executor saturated.
+        await asyncio.gather(*(manager.change_voice_async(i, f'client{i % 4}') for i in range(8)))
+        done.set()
+        await ticker
+        return lateness
+
+    lateness = asyncio.run(send())
+
+    assert len(lateness) > 100
+    assert max(lateness) < conversion_time / 4
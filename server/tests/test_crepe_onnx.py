@@ -0,0 +1,42 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+torch = pytest.importorskip('torch')
+onnx = pytest.importorskip('onnx')
+helper = pytest.importorskip('onnx.helper')
+onnxruntime = pytest.importorskip('onnxruntime')
+CrepeOnnxPitchExtractor = pytest.importorskip('voice_changer.pitch_extractor.CrepeOnnxPitchExtractor').CrepeOnnxPitchExtractor
+onnxcrepe = pytest.importorskip('voice_changer.pitch_extractor.onnxcrepe')
+const = pytest.importorskip('const')
+
+
+def make_crepe_model(path: str):
+    # Same IO as the exported CREPE models: (time, 1024) frames to (time, 360) probabilities.
+    rng = np.random.default_rng(0)
+    weight = helper.make_tensor('weight', onnx.TensorProto.FLOAT, [1024, 360], rng.standard_normal((1024, 360)).astype(np.float32).ravel() * 4)
+    frames = helper.make_tensor_value_info('frames', onnx.TensorProto.FLOAT, ['time', 1024])
+    probabilities = helper.make_tensor_value_info('probabilities', onnx.TensorProto.FLOAT, ['time', 360])
+    nodes = [
+        helper.make_node('MatMul', ['frames', 'weight'], ['logits']),
+        helper.make_node('Sigmoid', ['logits'], ['probabilities']),
+    ]
+    graph = helper.make_graph(nodes, 'crepe', [frames], [probabilities], initializer=[weight])
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)], ir_version=9), path)
+
+
+def test_matches_numpy_onnxcrepe(tmp_path, device_manager):
+    path = str(tmp_path / 'crepe.onnx')
+    make_crepe_model(path)
+    extractor = CrepeOnnxPitchExtractor('crepe_tiny_onnx', path)
+    audio = torch.randn(16000 // 4)
+
+    session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+    f0, pd = onnxcrepe.predict(session, audio.numpy(), 16000, precision=10.0, fmin=const.F0_MIN, fmax=const.F0_MAX,
+                               return_periodicity=True, decoder=onnxcrepe.decode.weighted_argmax)
+    f0 = onnxcrepe.filter.median(f0, 3)
+    pd = onnxcrepe.filter.median(pd, 3)
+    f0[pd < 0.1] = 0
+    assert (f0 > 0).any()
+
+    for _ in range(2):
+        torch.testing.assert_close(extractor.extract(audio, 16000, 160), torch.from_numpy(f0).squeeze().float(), rtol=1e-4, atol=1e-3)
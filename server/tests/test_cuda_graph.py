@@ -0,0 +1,67 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from voice_changer.common.CudaGraph import MAX_WARMUPS, WARMUP_RUNS, CudaGraphRunner, graph_key  # noqa: E402
+
+
+def test_graph_key_depends_on_geometry_and_static_args():
+    x = torch.zeros(1, 10)
+    key = graph_key((x, None), (1,))
+
+    # Values do not matter, only what a captured graph depends on.
+    assert key == graph_key((torch.ones(1, 10), None), (1,))
+    assert key != graph_key((torch.zeros(1, 11), None), (1,))
+    assert key != graph_key((x.half(), None), (1,))
+    assert key != graph_key((x, x), (1,))
+    assert key != graph_key((x, None), (2,))
+
+
+def test_cpu_inputs_run_eagerly():
+    runner = CudaGraphRunner(lambda x, scale: x * scale)
+
+    out = runner((torch.ones(3),), 2)
+
+    assert torch.equal(out, torch.full((3,), 2.0))
+    assert not runner.graphs
+    assert not runner.warmups
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason='requires CUDA')
+def test_geometry_changes_and_invalidate_recapture():
+    runner = CudaGraphRunner(lambda x, scale: x * scale)
+    x = torch.ones(4, device='cuda')
+
+    for _ in range(WARMUP_RUNS):
+        runner((x,), 2)
+    assert not runner.graphs
+
+    assert torch.equal(runner((x,), 2), x * 2)
+    assert graph_key((x,), (2,)) in runner.graphs
+    # Replays read the new input values.
+    assert torch.equal(runner((x * 3,), 2), x * 6)
+
+    # A new static argument or shape is a new geometry and warms up again.
+    assert torch.equal(runner((x,), 3), x * 3)
+    assert graph_key((x,), (3,)) not in runner.graphs
+    y = torch.ones(5, device='cuda')
+    assert torch.equal(runner((y,), 2), y * 2)
+    assert graph_key((y,), (2,)) not in runner.graphs
+
+    runner.invalidate()
+    assert not runner.graphs
+    assert not runner.warmups
+    assert torch.equal(runner((x,), 2), x * 2)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason='requires CUDA')
+def test_warmup_counts_are_bounded():
+    runner = CudaGraphRunner(lambda x, scale: x * scale)
+    x = torch.ones(4, device='cuda')
+
+    for scale in range(MAX_WARMUPS * 2):
+        runner((x,), scale)
+
+    assert len(runner.warmups) == MAX_WARMUPS
+    assert graph_key((x,), (MAX_WARMUPS * 2 - 1,)) in runner.warmups
+    assert graph_key((x,), (0,)) not in runner.warmups
@@ -0,0 +1,150 @@
+import math
+import statistics
+import time
+
+import pytest
+
+torch = pytest.importorskip('torch')
+faiss = pytest.importorskip('faiss')
+from voice_changer.RVC.pipeline.IndexSearcher import (  # noqa: E402
+    CPU_EXACT_SEARCH_MAX_SIZE,
+    FaissSearcher,
+    TorchExactSearcher,
+    TorchIVFSearcher,
+    create_index_searcher,
+)
+
+DIM = 32
+TOP_K = 8
+
+
+def random_vectors(n: int, seed: int) -> torch.Tensor:
+    return torch.randn(n, DIM, generator=torch.Generator().manual_seed(seed))
+
+
+def faiss_search(index: faiss.Index, feats: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    score, ix = index.search(feats.numpy(), TOP_K)
+    return torch.as_tensor(score), torch.as_tensor(ix)
+
+
+def assert_same_results(actual: tuple[torch.Tensor, torch.Tensor], expected: tuple[torch.Tensor, torch.Tensor]):
+    torch.testing.assert_close(actual[0], expected[0], atol=1e-3, rtol=1e-4)
+    assert torch.equal(actual[1], expected[1])
+
+
+def test_exact_search_matches_flat_index():
+    vectors, feats = random_vectors(1000, 0), random_vectors(50, 1)
+    index = faiss.IndexFlatL2(DIM)
+    index.add(vectors.numpy())
+
+    assert_same_results(TorchExactSearcher(vectors).search(feats, TOP_K), faiss_search(index, feats))
+
+
+@pytest.mark.parametrize('nprobe', [1, 4])
+def test_ivf_search_matches_faiss_ivf(nprobe: int):
+    vectors, feats = random_vectors(4000, 0), random_vectors(50, 1)
+    index = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIM), DIM, 16)
+    index.train(vectors.numpy())
+    index.add(vectors.numpy())
+    index.nprobe = nprobe
+
+    assert_same_results(TorchIVFSearcher(index, vectors).search(feats, TOP_K), faiss_search(index, feats))
+
+
+def test_backend_selection_on_cpu():
+    cpu = torch.device('cpu')
+    small = faiss.IndexFlatL2(DIM)
+    small.add(random_vectors(100, 0).numpy())
+    large_vectors = random_vectors(CPU_EXACT_SEARCH_MAX_SIZE + 1, 0)
+    large = faiss.IndexFlatL2(DIM)
+    large.add(large_vectors.numpy())
+
+    assert isinstance(create_index_searcher(small, random_vectors(100, 0), cpu), TorchExactSearcher)
+    assert isinstance(create_index_searcher(large, large_vectors, cpu), FaissSearcher)
+    # Compressed indexes are searched in their compressed form, however small.
+    assert isinstance(create_index_searcher(small, random_vectors(100, 0), cpu, compressed=True), FaissSearcher)
+    # IVF indexes only probe a few lists, FAISS beats brute force on CPU.
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIM), DIM, 4)
+    ivf.train(large_vectors[:1000].numpy())
+    ivf.add(large_vectors[:1000].numpy())
+    assert isinstance(create_index_searcher(ivf, large_vectors[:1000], cpu), FaissSearcher)
+
+
+@pytest.mark.parametrize('top_k', [1, TOP_K])
+def test_missing_results_of_compressed_indexes_are_ignored(top_k: int):
+    Pipeline = pytest.importorskip('voice_changer.RVC.pipeline.Pipeline').Pipeline
+    vectors, feats = random_vectors(64, 0), random_vectors(50, 1)
+    index = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIM), DIM, 16)
+    index.train(vectors.numpy())
+    # Most lists stay empty and the others hold fewer than TOP_K vectors, so FAISS pads its results with -1.
+    vectors = vectors[:8]
+    index.add(vectors.numpy())
+    searcher = FaissSearcher(index, torch.device('cpu'))
+    score, ix = searcher.search(feats, top_k)
+    found = ix >= 0
+    assert found.any() and not found.all()
+
+    pipeline = Pipeline.__new__(Pipeline)
+    pipeline.index_searcher = searcher
+    pipeline.index_reconstruct = vectors
+    res = pipeline._search_index(feats, top_k)
+
+    weight = torch.where(found, torch.square(1 / score), 0)
+    expected = torch.stack([
+        (vectors[ix[i][found[i]]] * (weight[i][found[i]] / weight[i].sum()).unsqueeze(1)).sum(dim=0) if found[i].any() else feats[i]
+        for i in range(feats.shape[0])
+    ])
+    torch.testing.assert_close(res, expected)
+
+
+def test_index_result_cache_needs_both_hashes_to_collide():
+    IndexResultCache = pytest.importorskip('voice_changer.RVC.pipeline.IndexResultCache').IndexResultCache
+    cache = IndexResultCache(DIM, torch.device('cpu'))
+    # Every frame collides on the first hash.
+    cache.coefficients[:, 0] = 0
+    feats = random_vectors(4, 0)
+
+    torch.testing.assert_close(cache.search(feats[:2], 1, lambda x: x * 2), feats[:2] * 2)
+    torch.testing.assert_close(cache.search(feats, 1, lambda x: x * 2), feats * 2)
+    assert cache.hit_rate() == 2 / 6
+
+
+def median_time(fn, runs: int = 20) -> float:
+    for _ in range(3):
+        fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def test_search_latency_on_cpu():
+    # 100 HuBERT frames (768 dims) per chunk, k=8, an index at the CPU exact search limit.
+    cpu = torch.device('cpu')
+    vectors, feats = torch.randn(CPU_EXACT_SEARCH_MAX_SIZE, 768), torch.randn(100, 768)
+    flat = faiss.IndexFlatL2(768)
+    flat.add(vectors.numpy())
+    # IVF list count as in RVC index training.
+    nlist = min(int(16 * math.sqrt(vectors.shape[0])), vectors.shape[0] // 39)
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(768), 768, nlist)
+    ivf.train(vectors.numpy())
+    ivf.add(vectors.numpy())
+
+    exact, flat_searcher, ivf_searcher = TorchExactSearcher(vectors), FaissSearcher(flat, cpu), FaissSearcher(ivf, cpu)
+    exact_time = median_time(lambda: exact.search(feats, TOP_K))
+    times = {
+        'IndexFlatL2': (exact_time, median_time(lambda: flat_searcher.search(feats, TOP_K))),
+        'IndexIVFFlat': (exact_time, median_time(lambda: ivf_searcher.search(feats, TOP_K))),
+    }
+
+    print(f'\n{vectors.shape[0]} vectors, {torch.get_num_threads()} threads (ms per search)')
+    print(f'{"index":<13} {"torch-exact":>11} {"faiss":>8}')
+    for name, (torch_time, faiss_time) in times.items():
+        print(f'{name:<13} {torch_time * 1000:>11.2f} {faiss_time * 1000:>8.2f}')
+    # The backend picked by create_index_searcher is the faster one.
+    assert isinstance(create_index_searcher(flat, vectors, cpu), TorchExactSearcher)
+    assert times['IndexFlatL2'][0] < times['IndexFlatL2'][1]
+    assert isinstance(create_index_searcher(ivf, vectors, cpu), FaissSearcher)
+    assert times['IndexIVFFlat'][1] < times['IndexIVFFlat'][0]
@@ -0,0 +1,109 @@
+import json
+import statistics
+import time
+
+import pytest
+
+torch = pytest.importorskip('torch')
+safetensors_torch = pytest.importorskip('safetensors.torch')
+inferencer_module = pytest.importorskip('voice_changer.RVC.inferencer.RVCInferencer')
+from voice_changer.RVC.inferencer.rvc_models.infer_pack.models import SynthesizerTrnMs256NSFsid  # noqa: E402
+
+# Smallest configuration that builds every submodule of the synthesizer.
+CONFIG = [17, 8, 8, 8, 16, 2, 1, 3, 0, '1', [3], [[1, 3, 5]], [2, 2], 8, [4, 4], 2, 8, 16000]
+
+
+@pytest.fixture
+def model_file(tmp_path) -> str:
+    torch.manual_seed(0)
+    model = SynthesizerTrnMs256NSFsid(*CONFIG, is_half=False)
+    path = tmp_path / 'model.safetensors'
+    # Checkpoints are usually saved in fp16.
+    weights = {k: v.half() if v.is_floating_point() else v for k, v in model.state_dict().items()}
+    safetensors_torch.save_file(weights, str(path), metadata={'config': json.dumps(CONFIG)})
+    return str(path)
+
+
+@pytest.fixture
+def inferencer(model_file, device_manager):
+    return inferencer_module.RVCInferencer().load_model(model_file)
+
+
+def state(model: torch.nn.Module) -> dict[str, torch.Tensor]:
+    return {k: v.detach().clone() for k, v in model.state_dict().items()}
+
+
+def test_master_keeps_checkpoint_dtype_and_weight_norm(inferencer):
+    master = inferencer.master.state_dict()
+
+    assert master['dec.ups.0.weight_g'].dtype == torch.float16
+    assert 'dec.ups.0.weight_g' not in inferencer.model.state_dict()
+    assert all(v.dtype == torch.float32 for v in inferencer.model.state_dict().values() if v.is_floating_point())
+    # Weight norm is folded from the fp16 checkpoint at full precision.
+    folded = torch._weight_norm(master['dec.ups.0.weight_v'].float(), master['dec.ups.0.weight_g'].float(), 0)
+    torch.testing.assert_close(inferencer.model.dec.ups[0].weight, folded)
+
+
+def test_retarget_does_not_read_the_model_file(inferencer, device_manager, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('model file was read again')
+
+    monkeypatch.setattr(inferencer_module, 'MappedSafetensors', fail)
+    monkeypatch.setattr(inferencer_module, 'load_checkpoint', fail)
+    fp32_model = inferencer.model
+    fp32_state = state(fp32_model)
+    master_state = state(inferencer.master)
+
+    monkeypatch.setattr(device_manager, 'fp16_available', True)
+    half = inferencer.retarget()
+
+    assert half is not inferencer and half.master is inferencer.master
+    assert inferencer.model is fp32_model
+    half_state = half.model.state_dict()
+    assert half_state.keys() == fp32_state.keys()
+    for k, v in fp32_state.items():
+        assert half_state[k].dtype == (torch.float16 if v.is_floating_point() else v.dtype), k
+        torch.testing.assert_close(half_state[k], v.to(half_state[k].dtype), rtol=0, atol=0)
+    assert all(module.is_half for module in half.model.modules() if hasattr(module, 'is_half'))
+
+    # Going back to fp32 places the same weights again, and master is never modified.
+    monkeypatch.setattr(device_manager, 'force_fp32', True)
+    full = half.retarget()
+
+    for k, v in state(full.model).items():
+        assert torch.equal(v, fp32_state[k]), k
+    for k, v in state(inferencer.master).items():
+        assert v.dtype == master_state[k].dtype and torch.equal(v, master_state[k]), k
+
+
+def test_retarget_is_faster_than_loading(model_file, inferencer):
+    def median_time(fn) -> float:
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+
+    load = median_time(lambda: inferencer_module.RVCInferencer().load_model(model_file))
+    retarget = median_time(inferencer.retarget)
+
+    # Building the synthesizer and reading the checkpoint are skipped. Measured about 4x on CPU.
+    assert retarget < load / 2
+
+
+def test_models_without_folding_are_cast_directly(device_manager, monkeypatch):
+    Inferencer = pytest.importorskip('voice_changer.RVC.inferencer.Inferencer').Inferencer
+
+    class Unfolded(Inferencer):
+        pass
+
+    inferencer = Unfolded()
+    inferencer.master = torch.nn.Linear(4, 4).half()
+    monkeypatch.setattr(device_manager, 'fp16_available', True)
+
+    model = inferencer.place().model
+
+    # No fp32 copy in between: fp16 tensors of master are placed as they are.
+    assert model.weight.dtype == torch.float16
+    assert model.weight.data_ptr() == inferencer.master.weight.data_ptr()
@@ -0,0 +1,50 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+WebUIInferencer = pytest.importorskip('voice_changer.RVC.inferencer.WebUIInferencer').WebUIInferencer
+WebUIInferencerNono = pytest.importorskip('voice_changer.RVC.inferencer.WebUIInferencerNono').WebUIInferencerNono
+
+LENGTH = 320
+
+
+class Synthesizer(torch.nn.Module):
+    # Returns (audio, ...) shaped [batch, 1, length] like the RVC synthesizers.
+    def infer(self, feats: torch.Tensor, *args, **kwargs):
+        return (feats.mean(dim=2, keepdim=True).transpose(1, 2).repeat_interleave(LENGTH // feats.shape[1], dim=2) * 4,)
+
+
+@pytest.fixture(params=[WebUIInferencer, WebUIInferencerNono])
+def inferencer(request):
+    inferencer = request.param()
+    inferencer.model = Synthesizer()
+    return inferencer
+
+
+def infer(inferencer, batch_size: int) -> torch.Tensor:
+    frames = 32
+    pitch = torch.zeros(batch_size, frames, dtype=torch.int64)
+    return inferencer.infer(
+        torch.randn(batch_size, frames, 16),
+        torch.full((batch_size,), frames),
+        pitch,
+        pitch.float(),
+        torch.zeros(batch_size, dtype=torch.int64),
+        0,
+        frames,
+        frames,
+    )
+
+
+def test_single_request_returns_audio(inferencer):
+    # Pipeline.exec slices, crossfades and resamples a 1-D waveform.
+    audio = infer(inferencer, 1)
+
+    assert audio.shape == (LENGTH,)
+    assert audio.abs().max() <= 1
+
+
+def test_batch_returns_audio_per_request(inferencer):
+    audio = infer(inferencer, 3)
+
+    assert audio.shape == (3, LENGTH)
+    assert audio.abs().max() <= 1
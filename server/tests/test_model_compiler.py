@@ -0,0 +1,65 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+compile_model = pytest.importorskip('voice_changer.common.ModelCompiler').compile_model
+PipelineScheduler = pytest.importorskip('voice_changer.RVC.pipeline.PipelineScheduler').PipelineScheduler
+
+
+class Model(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(8, 8)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.relu(self.linear(x)) * 2
+
+    def infer(self, x: torch.Tensor) -> torch.Tensor:
+        return self.forward(x) + 1
+
+
+@pytest.fixture
+def model() -> Model:
+    torch.manual_seed(0)
+    return Model().eval()
+
+
+def test_eager_keeps_the_model(model: Model):
+    assert compile_model(model, 'eager') is model
+
+
+def test_jit_scripts_the_model(model: Model):
+    x = torch.randn(4, 8)
+    expected = model(x)
+
+    scripted = compile_model(model, 'jit')
+
+    assert isinstance(scripted, torch.jit.ScriptModule)
+    with torch.no_grad():
+        torch.testing.assert_close(scripted(x), expected)
+
+
+def test_compile_wraps_every_method(model: Model):
+    x = torch.randn(4, 8)
+    expected_forward, expected_infer = model(x), model.infer(x)
+
+    compiled = compile_model(model, 'compile', methods=('forward', 'infer'))
+
+    assert compiled is model
+    # Compiled methods shadow the class methods on the instance.
+    assert {'forward', 'infer'} <= vars(compiled).keys()
+    with torch.no_grad():
+        torch.testing.assert_close(compiled(x), expected_forward)
+        torch.testing.assert_close(compiled.infer(x), expected_infer)
+
+
+def test_worker_calls_run_without_autograd():
+    scheduler = PipelineScheduler('test-no-grad')
+
+    def nested():
+        # Submissions from the worker run inline.
+        return scheduler.submit(torch.is_grad_enabled).result()
+
+    assert torch.is_grad_enabled()
+    assert scheduler.submit(torch.is_grad_enabled).result() is False
+    assert scheduler.submit(nested).result() is False
+    assert torch.is_grad_enabled()
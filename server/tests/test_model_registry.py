@@ -0,0 +1,92 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+registry_module = pytest.importorskip('voice_changer.common.ModelRegistry')
+ModelRegistry = registry_module.ModelRegistry
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return object()
+
+
+def test_switching_slots_with_the_same_key_loads_once():
+    registry = ModelRegistry('embedder', capacity=0)
+    load = Loader()
+    key = ('content_vec_500.onnx', 'cpu')
+
+    active = registry.acquire(key, load, 100)
+    # The next slot loads while the active one still holds its reference, then the active one is released.
+    loaded = registry.acquire(key, load, 100)
+    registry.release(active)
+    # And back.
+    switched_back = registry.acquire(key, load, 100)
+    registry.release(loaded)
+
+    assert active is loaded is switched_back
+    assert load.calls == 1
+    assert registry.get_info()["loads"] == 1
+    assert registry.get_info()["referenced"] == 1
+
+
+def test_unreferenced_instances_are_evicted_over_capacity():
+    registry = ModelRegistry('pitch extractor', capacity=150)
+    load = Loader()
+
+    first = registry.acquire(('rmvpe',), load, 100)
+    registry.release(first)
+    assert registry.get_info()["loaded"] == 1
+
+    # Referenced instances are kept even over capacity, unreferenced ones are unloaded in LRU order.
+    second = registry.acquire(('fcpe',), load, 100)
+    assert registry.get_info()["loaded"] == 1
+    registry.release(second)
+    assert registry.acquire(('rmvpe',), load, 100) is not first
+    assert load.calls == 3
+
+
+def test_concurrent_acquire_and_release_keep_counts():
+    registry = ModelRegistry('embedder', capacity=0)
+    load = Loader()
+    key = ('content_vec_500.onnx', 'cpu')
+    holder = registry.acquire(key, load, 100)
+
+    def worker():
+        for _ in range(1000):
+            registry.release(registry.acquire(key, load, 100))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert registry.entries[key].refs == 1
+    registry.release(holder)
+    assert registry.get_info()["loaded"] == 0
+    assert load.calls == 1
+
+
+def test_hubert_base_and_contentvec_slots_share_one_embedder(monkeypatch):
+    manager_module = pytest.importorskip('voice_changer.embedder.EmbedderManager')
+    EmbedderManager = manager_module.EmbedderManager
+    load = Loader()
+    monkeypatch.setattr(manager_module, 'device_key', lambda: ('cpu',))
+    monkeypatch.setattr(EmbedderManager, 'params', SimpleNamespace(content_vec_500_onnx='content_vec_500.onnx', spin_onnx='spin.onnx'), raising=False)
+    monkeypatch.setattr(EmbedderManager, 'registry', ModelRegistry('embedder', capacity=0))
+    monkeypatch.setattr(EmbedderManager, 'load_embedder', classmethod(lambda cls, embedder_type, file: load()))
+
+    # Slot switch: hubert_base slot -> contentvec slot -> hubert_base slot.
+    active = EmbedderManager.get_embedder('hubert_base')
+    for embedder_type in ('contentvec', 'hubert_base'):
+        loaded = EmbedderManager.get_embedder(embedder_type)
+        EmbedderManager.release_embedder(active)
+        active = loaded
+
+    assert load.calls == 1
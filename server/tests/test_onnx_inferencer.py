@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+torch = pytest.importorskip('torch')
+onnx = pytest.importorskip('onnx')
+helper = pytest.importorskip('onnx.helper')
+OnnxRVCInferencerNono = pytest.importorskip('voice_changer.RVC.inferencer.OnnxRVCInferencerNono').OnnxRVCInferencerNono
+
+
+def make_nono_model(path: str):
+    # Inputs of an exported no-f0 model. audio is the mean of each feature frame.
+    inputs = [
+        helper.make_tensor_value_info('feats', onnx.TensorProto.FLOAT, ['batch', 'frames', 256]),
+        helper.make_tensor_value_info('p_len', onnx.TensorProto.INT64, ['batch']),
+        helper.make_tensor_value_info('sid', onnx.TensorProto.INT64, ['batch']),
+        helper.make_tensor_value_info('skip_head', onnx.TensorProto.INT64, []),
+        helper.make_tensor_value_info('return_length', onnx.TensorProto.INT64, []),
+        helper.make_tensor_value_info('formant_length', onnx.TensorProto.INT64, []),
+    ]
+    audio = helper.make_tensor_value_info('audio', onnx.TensorProto.FLOAT, ['batch', 1, 'frames'])
+    axes = helper.make_tensor('axes', onnx.TensorProto.INT64, [1], [1])
+    nodes = [
+        helper.make_node('ReduceMean', ['feats'], ['mean'], axes=[2], keepdims=0),
+        helper.make_node('Unsqueeze', ['mean', 'axes'], ['audio']),
+    ]
+    graph = helper.make_graph(nodes, 'nono', inputs, [audio], initializer=[axes])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)], ir_version=9)
+    helper.set_model_props(model, {'metadata': json.dumps({'version': '2', 'f0': 0})})
+    onnx.save(model, path)
+
+
+def test_nono_model_runs_without_pitch(tmp_path, device_manager):
+    path = str(tmp_path / 'nono.onnx')
+    make_nono_model(path)
+    inferencer = OnnxRVCInferencerNono().load_model(path)
+    feats = torch.randn(1, 40, 256)
+
+    for _ in range(2):
+        audio = inferencer.infer(feats, torch.tensor([40]), None, None, torch.tensor([0]), 0, 40, 40)
+
+        assert audio.shape == (40,)
+        torch.testing.assert_close(audio, torch.clip(feats.mean(dim=2)[0], -1.0, 1.0))
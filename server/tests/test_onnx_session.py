@@ -0,0 +1,74 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+helper = pytest.importorskip('onnx.helper')
+onnx = pytest.importorskip('onnx')
+onnx_session = pytest.importorskip('voice_changer.common.OnnxSession')
+
+
+def make_model() -> 'onnx.ModelProto':
+    # y = x * 2 with a dynamic batch and length.
+    x = helper.make_tensor_value_info('x', onnx.TensorProto.FLOAT, ['batch', 'length'])
+    y = helper.make_tensor_value_info('y', onnx.TensorProto.FLOAT, ['batch', 'length'])
+    two = helper.make_tensor('two', onnx.TensorProto.FLOAT, [], [2.0])
+    node = helper.make_node('Mul', ['x', 'two'], ['y'])
+    graph = helper.make_graph([node], 'double', [x], [y], initializer=[two])
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid('', 17)], ir_version=9)
+
+
+def make_session():
+    return onnx_session.StaticShapeSession(make_model(), ['CPUExecutionProvider'], [{}])
+
+
+def test_steady_state_runs_reuse_bound_buffers(monkeypatch):
+    session = make_session()
+    session.run({'x': torch.randn(1, 16)})
+    binding, = session.bindings.values()
+    pointers = [buffer.data_ptr() for buffer in binding.buffers]
+
+    allocations = []
+    allocate = onnx_session.OutputBinding._allocate
+    monkeypatch.setattr(onnx_session.OutputBinding, '_allocate', lambda self, like: allocations.append(like.shape) or allocate(self, like))
+
+    allocated = 0
+    for _ in range(5):
+        x = torch.randn(1, 16)
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True) as profiler:
+            y, = session.run({'x': x})
+        allocated += sum(event.cpu_memory_usage for event in profiler.events() if event.cpu_memory_usage > 0)
+        torch.testing.assert_close(y, x * 2)
+        # Results are the bound buffers, valid until the next run.
+        assert y.data_ptr() in pointers
+
+    # Neither outputs nor inputs are copied.
+    assert allocated == 0
+    assert allocations == []
+    assert list(session.bindings.values()) == [binding]
+    assert [buffer.data_ptr() for buffer in binding.buffers] == pointers
+
+def test_new_geometry_gets_its_own_binding():
+    session = make_session()
+
+    session.run({'x': torch.randn(1, 16)})
+    y, = session.run({'x': torch.ones(1, 20)})
+
+    assert len(session.bindings) == 2
+    torch.testing.assert_close(y, torch.full((1, 20), 2.0))
+
+
+def test_sessions_are_specialized_only_at_warmup():
+    session = make_session()
+
+    session.run({'x': torch.randn(1, 16)})
+    assert not session.sessions
+
+    with onnx_session.specialize_sessions():
+        session.run({'x': torch.randn(1, 16)})
+    assert list(session.sessions) == [(('length', 16),)]
+
+    # The warmed-up geometry uses its session, any other one the dynamic session.
+    assert session.get({'x': (1, 16)}) is session.sessions[(('length', 16),)]
+    assert session.get({'x': (1, 12)}) is session.dynamic
+    y, = session.run({'x': torch.ones(1, 12)})
+    torch.testing.assert_close(y, torch.full((1, 12), 2.0))
+    assert len(session.sessions) == 1
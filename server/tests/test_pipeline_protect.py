@@ -0,0 +1,42 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+Pipeline = pytest.importorskip('voice_changer.RVC.pipeline.Pipeline').Pipeline
+
+import torch.nn.functional as F  # noqa: E402
+
+
+def upscale(feats: torch.Tensor) -> torch.Tensor:
+    return F.interpolate(feats.permute(0, 2, 1), scale_factor=2, mode='nearest').permute(0, 2, 1).contiguous()
+
+
+def blend_baseline(feats: torch.Tensor, feats_orig: torch.Tensor, pitchf: torch.Tensor, protect: float, length: int) -> torch.Tensor:
+    # Protect path before features were blended at the input rate.
+    feats = upscale(feats)[:, :length, :]
+    feats_orig = upscale(feats_orig)[:, :length, :]
+    pitchff = pitchf.detach().clone()
+    pitchff[pitchf > 0] = 1
+    pitchff[pitchf < 1] = protect
+    pitchff = pitchff.unsqueeze(-1)
+    return feats * pitchff + feats_orig * (1 - pitchff)
+
+
+@pytest.mark.parametrize('batch_size', [1, 3])
+@pytest.mark.parametrize('odd', [False, True])
+def test_upscale_protect_matches_baseline(batch_size: int, odd: bool):
+    generator = torch.Generator().manual_seed(0)
+    frames, channels, protect = 40, 16, 0.33
+    length = frames * 2 - int(odd)
+    feats = torch.randn(batch_size, frames, channels, generator=generator)
+    feats_orig = torch.randn(batch_size, frames, channels, generator=generator)
+    pitchf = torch.rand(batch_size, length, generator=generator) * 400
+    # Unvoiced frames and frames with pitch below 1.
+    pitchf[:, ::3] = 0
+    pitchf[:, 1::7] = 0.5
+
+    pipeline = Pipeline.__new__(Pipeline)
+    pitchff = torch.where(pitchf < 1, protect, torch.ones_like(pitchf))
+    fused = pipeline._upscale_protect(feats, feats_orig, pitchff, length)
+
+    assert fused.shape == (batch_size, length, channels)
+    assert torch.equal(fused, blend_baseline(feats, feats_orig, pitchf, protect, length))
@@ -0,0 +1,84 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torchaudio')
+import torch.nn.functional as F  # noqa: E402
+from voice_changer.common.Resampler import StreamingResampler, get_resampler  # noqa: E402
+
+CPU = torch.device('cpu')
+
+
+def stream(resampler: StreamingResampler, signal: torch.Tensor, chunk_sizes: list[int]) -> list[torch.Tensor]:
+    outputs, start = [], 0
+    for chunk_size in chunk_sizes:
+        outputs.append(resampler(signal[start:start + chunk_size]))
+        start += chunk_size
+    return outputs
+
+
+def resample_whole(signal: torch.Tensor, resampler: StreamingResampler, orig_freq: int, new_freq: int) -> torch.Tensor:
+    # The stream lags by the filter width plus one sample.
+    delay = resampler.weights.shape[1] // 2
+    return get_resampler(orig_freq, new_freq, torch.float32, CPU)(F.pad(signal, (delay, 0)))
+
+
+@pytest.mark.parametrize('orig_freq,new_freq,chunk_size', [(48000, 16000, 480), (44100, 16000, 4410), (16000, 48000, 512), (22050, 16000, 2205)])
+def test_chunked_output_matches_whole_signal(orig_freq: int, new_freq: int, chunk_size: int):
+    signal = torch.randn(chunk_size * 20, generator=torch.Generator().manual_seed(0))
+    resampler = StreamingResampler(orig_freq, new_freq, torch.float32, CPU)
+
+    outputs = stream(resampler, signal, [chunk_size] * 20)
+    streamed = torch.cat(outputs)
+
+    assert {output.shape[0] for output in outputs} == {chunk_size * new_freq // orig_freq}
+    whole = resample_whole(signal, resampler, orig_freq, new_freq)
+    # Filter taps are computed in float64 here, in float32 by torchaudio.
+    torch.testing.assert_close(streamed, whole[:streamed.shape[0]], atol=2e-4, rtol=1e-4)
+
+
+def test_inexact_rate_emits_a_fixed_length():
+    # 4096 samples at 44.1 kHz are 1486.08 samples at 16 kHz.
+    signal = torch.randn(4096 * 20, generator=torch.Generator().manual_seed(0))
+    resampler = StreamingResampler(44100, 16000, torch.float32, CPU)
+
+    outputs = stream(resampler, signal, [4096] * 20)
+    streamed = torch.cat(outputs)
+
+    assert {output.shape[0] for output in outputs} == {1486}
+    # Chunks continue each other, resampled at 4096 -> 1486.
+    whole = resample_whole(signal, resampler, 4096, 1486)
+    torch.testing.assert_close(streamed, whole[:streamed.shape[0]], atol=1e-3, rtol=1e-3)
+
+
+def test_chunk_size_does_not_change_output():
+    signal = torch.randn(48000, generator=torch.Generator().manual_seed(1))
+
+    def resample(chunk_sizes: list[int]) -> torch.Tensor:
+        return torch.cat(stream(StreamingResampler(48000, 16000, torch.float32, CPU), signal, chunk_sizes))
+
+    small = resample([480] * 100)
+    torch.testing.assert_close(resample([4800] * 10), small)
+    # History carries over when the chunk size changes mid-stream.
+    torch.testing.assert_close(resample([480] * 50 + [4800] * 5), small)
+
+
+def test_streaming_removes_chunk_edge_errors():
+    # Before: every chunk resampled on its own, zero-padded at both edges.
+    signal = torch.sin(torch.arange(48000) * 2 * torch.pi * 440 / 48000)
+    chunks = signal.split(480)
+    stateless = torch.cat([get_resampler(48000, 16000, torch.float32, CPU)(chunk) for chunk in chunks])
+    whole = get_resampler(48000, 16000, torch.float32, CPU)(signal)
+    assert (stateless - whole).abs().max() > 0.1
+
+    # After: every output sample has its full filter support.
+    resampler = StreamingResampler(48000, 16000, torch.float32, CPU)
+    streamed = torch.cat(stream(resampler, signal, [480] * 100))
+    whole = resample_whole(signal, resampler, 48000, 16000)
+    assert (streamed - whole[:streamed.shape[0]]).abs().max() < 1e-5
+
+
+def test_same_rate_is_passthrough():
+    resampler = StreamingResampler(16000, 16000, torch.float32, CPU)
+    chunk = torch.randn(100)
+
+    assert resampler(chunk) is chunk
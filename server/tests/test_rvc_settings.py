@@ -0,0 +1,21 @@
+from types import SimpleNamespace
+
+import pytest
+
+RVCr2 = pytest.importorskip('voice_changer.RVC.RVCr2').RVCr2
+PitchCache = pytest.importorskip('voice_changer.RVC.pipeline.PitchCache').PitchCache
+
+
+@pytest.mark.parametrize('shared', [None, object()])
+def test_changing_the_pitch_extractor_clears_cached_pitch(monkeypatch, shared):
+    model = RVCr2.__new__(RVCr2)
+    model.settings = SimpleNamespace(f0Detector='rmvpe')
+    model.shared = shared
+    model._pipeline = SimpleNamespace(setPitchExtractor=lambda extractor: None)
+    model.pitch_cache = PitchCache()
+    model.pitch_cache.prime()
+    monkeypatch.setattr(RVCr2, 'change_pitch_extractor', lambda self: None)
+
+    model.update_settings('f0Detector', 'rmvpe', 'crepe_full')
+
+    assert not model.pitch_cache.primed
@@ -0,0 +1,171 @@
+import ctypes
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+torch = pytest.importorskip('torch')
+safetensors_torch = pytest.importorskip('safetensors.torch')
+utils = pytest.importorskip('voice_changer.common.SafetensorsUtils')
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    tensors = {
+        'linear.weight': torch.randn(8, 4).half(),
+        'linear.bias': torch.randn(8),
+        'steps': torch.tensor(3, dtype=torch.int64),
+        'mask': torch.tensor([True, False, True]),
+        'empty': torch.zeros(0, 4),
+    }
+    path = tmp_path / 'model.safetensors'
+    safetensors_torch.save_file(tensors, str(path), metadata={'config': json.dumps([1, 2])})
+    return str(path), tensors
+
+
+def test_mapped_safetensors_round_trip(checkpoint):
+    path, tensors = checkpoint
+
+    with utils.MappedSafetensors(path) as f:
+        assert sorted(f.keys()) == sorted(tensors)
+        assert json.loads(f.metadata()['config']) == [1, 2]
+        for name, tensor in tensors.items():
+            loaded = f.get_tensor(name)
+            assert loaded.dtype == tensor.dtype
+            assert loaded.shape == tensor.shape
+            assert torch.equal(loaded, tensor)
+
+
+def test_mapped_tensors_are_views_of_the_file(checkpoint):
+    path, _ = checkpoint
+    f = utils.MappedSafetensors(path)
+    start = ctypes.addressof(ctypes.c_char.from_buffer(f.map))
+
+    weight = f.get_tensor('linear.weight')
+
+    assert start <= weight.data_ptr() < start + len(f.map)
+    # Copy-on-write: writes do not reach the file.
+    weight.zero_()
+    assert not torch.equal(utils.MappedSafetensors(path).get_tensor('linear.weight'), weight)
+
+
+def test_assign_without_cast_keeps_checkpoint_tensors(checkpoint):
+    path, tensors = checkpoint
+    model = torch.nn.Sequential()
+    model.add_module('linear', torch.nn.Linear(4, 8))
+
+    with utils.MappedSafetensors(path) as f:
+        utils.load_model(model, f, strict=False, cast=False)
+        source = f.get_tensor('linear.weight')
+
+    assert isinstance(model.linear.weight, torch.nn.Parameter)
+    assert model.linear.weight.dtype == torch.float16
+    assert torch.equal(model.linear.weight, tensors['linear.weight'])
+    # Assigned, not copied: the parameter uses the mapped file.
+    assert model.linear.weight.untyped_storage().data_ptr() == source.untyped_storage().data_ptr()
+
+
+def test_assign_with_cast_uses_model_dtype(checkpoint):
+    path, tensors = checkpoint
+    model = torch.nn.Sequential()
+    model.add_module('linear', torch.nn.Linear(4, 8))
+
+    with utils.MappedSafetensors(path) as f:
+        utils.load_model(model, f, strict=False)
+
+    assert model.linear.weight.dtype == torch.float32
+    assert torch.equal(model.linear.weight, tensors['linear.weight'].float())
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='reads peak RSS with getrusage')
+def test_peak_rss_while_loading(tmp_path):
+    # 64 MiB of fp16 weights.
+    layers, size = 8, 2048
+    path = tmp_path / 'large.safetensors'
+    safetensors_torch.save_file({f'{i}.weight': torch.randn(size, size).half() for i in range(layers)}, str(path))
+    file_size = path.stat().st_size
+
+    script = textwrap.dedent(f'''
+        import resource, sys, torch
+        sys.path.insert(0, {sys.path[0]!r})
+        from voice_changer.common.SafetensorsUtils import MappedSafetensors, load_model
+        model = torch.nn.Sequential(*[torch.nn.Linear({size}, {size}, bias=False) for _ in range({layers})])
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with MappedSafetensors({str(path)!r}) as f:
+            load_model(model, f, strict=False, cast=False)
+        # Touch every weight once, as moving them to the device does.
+        sum(float(p.float().sum()) for p in model.parameters())
+        print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024)
+    ''')
+    growth = int(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout)
+
+    print(f'peak RSS growth while loading: {growth / 2 ** 20:.1f} MiB for a {file_size / 2 ** 20:.1f} MiB file')
+    # Assigning the mapped fp16 weights adds nothing on top of the constructed model. Casting them into fp32 copies
+    # while the initial parameters are still alive adds twice the file size.
+    assert growth < 1.25 * file_size
+
+
+# v1 40k sized generator: 69 MiB of fp16 weights.
+GENERATOR_CONFIG = [1025, 32, 192, 192, 768, 2, 6, 3, 0, '1', [3, 7, 11], [[1, 3, 5]] * 3, [10, 10, 2, 2], 512, [16, 16, 4, 4], 109, 256, 40000]
+
+
+def save_generator(tmp_path, model_type: str) -> str:
+    from voice_changer.RVC.inferencer.rvc_models.infer_pack.models import SynthesizerTrnMs256NSFsid, SynthesizerTrnMs768NSFsid
+    from voice_changer.RVC.inferencer.rvc_models.infer_pack.models_onnx import SynthesizerTrnMsNSFsidM
+
+    def half(model: torch.nn.Module) -> dict[str, torch.Tensor]:
+        return {k: v.half() if v.is_floating_point() else v for k, v in model.state_dict().items()}
+
+    if model_type == 'webui':
+        names = ['spec_channels', 'segment_size', 'inter_channels', 'hidden_channels', 'filter_channels', 'n_heads', 'n_layers', 'kernel_size', 'p_dropout', 'resblock',
+                 'resblock_kernel_sizes', 'resblock_dilation_sizes', 'upsample_rates', 'upsample_initial_channel', 'upsample_kernel_sizes', 'spk_embed_dim', 'gin_channels', 'sr']
+        params = {**dict(zip(names, GENERATOR_CONFIG)), 'encoder_dim': 768}
+        path = str(tmp_path / 'webui.pth')
+        torch.save({'params': params, 'weight': half(SynthesizerTrnMsNSFsidM(**params, is_half=False))}, path)
+        return path
+    synthesizer = SynthesizerTrnMs256NSFsid if model_type == 'v1' else SynthesizerTrnMs768NSFsid
+    path = str(tmp_path / f'{model_type}.safetensors')
+    safetensors_torch.save_file(half(synthesizer(*GENERATOR_CONFIG, is_half=False)), path, metadata={'config': json.dumps(GENERATOR_CONFIG)})
+    return path
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='resets peak RSS with /proc/self/clear_refs')
+# Measured peak RSS growth while loading, relative to the file size.
+@pytest.mark.parametrize('model_type,inferencer,measured', [('v1', 'RVCInferencer', 4.3), ('v2', 'RVCInferencerv2', 4.3), ('webui', 'WebUIInferencer', 3.7)])
+def test_peak_rss_while_loading_generators(tmp_path, model_type: str, inferencer: str, measured: float):
+    path = save_generator(tmp_path, model_type)
+    file_size = os.path.getsize(path)
+
+    script = textwrap.dedent(f'''
+        import sys, torch
+        sys.path.insert(0, {sys.path[0]!r})
+        from voice_changer.common.deviceManager.DeviceManager import DeviceManager
+        from voice_changer.RVC.inferencer.{inferencer} import {inferencer}
+
+        def status(key):
+            return int(next(line for line in open('/proc/self/status') if line.startswith(key)).split()[1]) * 1024
+
+        # Placed in fp16 as on a GPU, eagerly.
+        device_manager = DeviceManager.get_instance()
+        device_manager.device = torch.device('cpu')
+        device_manager.device_metadata = {{'id': -1, 'name': 'CPU', 'backend': 'cpu'}}
+        device_manager.fp16_available = True
+        device_manager.force_fp32 = False
+        device_manager.compile_mode = 'eager'
+        # Resets the peak RSS to the current RSS.
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        before = status('VmRSS')
+        {inferencer}().load_model({path!r})
+        print(status('VmHWM') - before)
+    ''')
+    growth = int(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout)
+
+    print(f'{model_type}: peak RSS growth while loading: {growth / 2 ** 20:.1f} MiB for a {file_size / 2 ** 20:.1f} MiB file')
+    # Constructing the synthesizer with fp32 initial weights and weight norm caches takes 3.7x before the checkpoint
+    # replaces them. Folding weight norm for v1 and v2 moves weight_g and weight_v in fp32. Another copy of the
+    # weights would add 1x.
+    assert growth < (measured + 0.5) * file_size
@@ -0,0 +1,93 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+
+def test_sessions_are_created_once_per_client(manager):
+    a = manager.get_session('a')
+
+    assert a is manager.get_session('a')
+    assert a is not manager.get_session('b')
+    assert manager.get_session(None) is manager.vc
+    assert set(manager.sessions) == {'a', 'b'}
+
+
+def test_session_overrides_are_isolated(manager):
+    manager.update_session_settings('a', 'tran', 12)
+
+    assert manager.get_session('a').settings.tran == 12
+    assert manager.get_session('b').settings.tran == 0
+    assert manager.settings.tran == 0
+
+
+def test_shared_settings_reach_sessions_that_do_not_override_them(manager):
+    manager.update_session_settings('a', 'tran', 12)
+    b = manager.get_session('b')
+
+    manager.settings.set_property('tran', 5)
+
+    assert manager.get_session('a').settings.tran == 12
+    assert b.settings.tran == 5
+    # Device and model settings are not per session.
+    assert manager.update_session_settings('a', 'gpu', 1) == {}
+    assert not manager.get_session('a').settings.is_overridden('gpu')
+
+
+def test_pass_through_of_one_session(manager):
+    manager.update_session_settings('a', 'passThrough', 'true')
+    audio = np.linspace(-1, 1, 480, dtype=np.float32)
+
+    result, vol, _, error = manager.change_voice(audio, 'a')
+
+    assert error is None
+    assert result is audio
+    assert vol > 0
+    assert not manager.get_session('b').settings.passThrough
+
+
+def test_closed_session_drops_late_chunks(manager):
+    manager.update_session_settings('a', 'passThrough', 'true')
+    manager.close_session('a')
+    audio = np.ones(480, dtype=np.float32)
+
+    result, vol, _, error = manager.change_voice(audio, 'a')
+
+    assert error is None
+    assert vol == 0
+    assert not result.any()
+    # A late chunk does not bring the session back.
+    assert manager.get_session('a') is None
+    assert 'a' not in manager.sessions
+
+
+class Model:
+    def get_session_info(self) -> dict:
+        return {}
+
+
+def test_client_sessions_record_into_the_shared_recorder(manager, tmp_path, monkeypatch):
+    io_recorder = pytest.importorskip('voice_changer.IORecorder')
+    wave = pytest.importorskip('wave')
+    monkeypatch.setattr(io_recorder, 'STREAM_INPUT_FILE', str(tmp_path / 'in.wav'))
+    monkeypatch.setattr(io_recorder, 'STREAM_OUTPUT_FILE', str(tmp_path / 'out.wav'))
+    manager.vc.io_recorder = io_recorder.IORecorder(manager.settings.inputSampleRate, manager.settings.outputSampleRate)
+    manager.vc.owns_io_recorder = True
+    manager.settings.set_property('recordIO', 1)
+    audio = np.full(480, 0.5, dtype=np.float32)
+
+    for session_id in ['a', 'b']:
+        session = manager.get_session(session_id)
+        session.vcmodel = Model()
+        session.process_audio = lambda audio: (audio * 0.5, 0.5, True)
+        manager.change_voice(audio, session_id)
+    # A session at another input rate than the recording files is not recorded.
+    manager.get_session('b').settings.set_property('inputSampleRate', 44100)
+    manager.change_voice(audio, 'b')
+    manager.vc.io_recorder.close()
+
+    with wave.open(str(tmp_path / 'in.wav')) as f:
+        assert f.getnframes() == 2 * 480
+        assert np.all(np.frombuffer(f.readframes(480), dtype=np.int16) == int(0.5 * 32767))
+    with wave.open(str(tmp_path / 'out.wav')) as f:
+        assert f.getnframes() == 2 * 480
+        assert np.all(np.frombuffer(f.readframes(480), dtype=np.int16) == int(0.25 * 32767))
@@ -0,0 +1,44 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+np = pytest.importorskip('numpy')
+VoiceChangerV2 = pytest.importorskip('voice_changer.VoiceChangerV2').VoiceChangerV2
+VoiceChangerSettings = pytest.importorskip('voice_changer.VoiceChangerSettings').VoiceChangerSettings
+
+
+class Model:
+    """Returns the next output of outputs, None for silence."""
+
+    def __init__(self, outputs: list[torch.Tensor | None]):
+        self.outputs = outputs
+
+    def inference(self, audio_in):
+        return self.outputs.pop(0), 0
+
+
+def test_speech_fades_out_into_silence_and_back_in(device_manager, monkeypatch):
+    vc = VoiceChangerV2(VoiceChangerSettings(), record_io=False)
+    block, crossfade, search = vc.block_frame, vc.crossfade_frame, vc.sola_search_frame
+    first, second = torch.rand(block + crossfade + search), torch.rand(block + crossfade + search)
+    vc.vcmodel = Model([first.clone(), None, second.clone()])
+    audio_in = np.zeros(block, dtype=np.float32)
+
+    out, _, converted = vc.process_audio(audio_in)
+    assert converted
+    tail = first[block:block + crossfade] * vc.fade_out_window
+
+    # Silence plays out the faded tail of the last converted block.
+    out, _, converted = vc.process_audio(audio_in)
+    assert not converted
+    np.testing.assert_allclose(out[:crossfade], tail.numpy(), rtol=1e-6)
+    assert not out[crossfade:].any()
+
+    # Speech fades in from silence, without searching for an alignment to the played out tail.
+    conv1d = torch.nn.functional.conv1d
+    searches = []
+    monkeypatch.setattr(torch.nn.functional, 'conv1d', lambda *args, **kwargs: searches.append(args) or conv1d(*args, **kwargs))
+    out, _, converted = vc.process_audio(audio_in)
+    assert converted
+    assert searches == []
+    np.testing.assert_allclose(out[:crossfade], (second[:crossfade] * vc.fade_in_window).numpy(), rtol=1e-6)
+    np.testing.assert_allclose(out[crossfade:], second[crossfade:block].numpy(), rtol=1e-6)
@@ -0,0 +1,72 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip('torch')
+RVCr2 = pytest.importorskip('voice_changer.RVC.RVCr2').RVCr2
+PipelineScheduler = pytest.importorskip('voice_changer.RVC.pipeline.PipelineScheduler').PipelineScheduler
+
+
+class Model:
+    voiceChangerType = 'RVC'
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def create_session(self, settings) -> 'Model':
+        return Model(f'{self.name}-session')
+
+    def realloc(self, *frames):
+        pass
+
+    def initialize(self):
+        pass
+
+    def handover(self, previous: 'Model'):
+        pass
+
+    def release(self):
+        pass
+
+
+def test_slot_activation_waits_for_the_chunk_in_flight(manager):
+    manager.vc.vcmodel = Model('old')
+    session = manager.get_session('a')
+    session.vcmodel = Model('old-session')
+    manager.slot_generation = 1
+    manager.slot_state = 'warming'
+    slot_info = SimpleNamespace(slotIndex=1, defaultTune=0, defaultFormantShift=0, defaultIndexRatio=0, defaultProtect=0.5)
+
+    # A chunk of the session is being converted.
+    with session.lock:
+        thread = threading.Thread(target=manager._activate_slot, args=(slot_info, Model('new'), manager.vc.frames(), 1))
+        thread.start()
+        time.sleep(0.1)
+        assert session.vcmodel.name == 'old-session'
+        assert manager.slot_state == 'warming'
+
+    thread.join(timeout=5)
+    assert manager.vc.vcmodel.name == 'new'
+    assert session.vcmodel.name == 'new-session'
+    assert manager.slot_state == 'active'
+
+
+def test_idle_kernel_runs_on_the_device_worker(monkeypatch):
+    model = RVCr2.__new__(RVCr2)
+    model.settings = SimpleNamespace(idleStrategy='kernel', idleKernelInterval=0)
+    model.shared = None
+    model._pipeline = SimpleNamespace(device=torch.device('cpu'))
+    model.dtype = torch.float32
+    model.idle_kernel_input = None
+    model.last_idle_kernel_at = 0
+
+    threads = []
+    idle_kernel = RVCr2._idle_kernel
+    monkeypatch.setattr(RVCr2, '_idle_kernel', lambda self, device: threads.append(threading.current_thread()) or idle_kernel(self, device))
+
+    model._idle()
+
+    assert threads == [PipelineScheduler.get_instance(torch.device('cpu')).thread]
+    assert model.idle_kernel_input is not None
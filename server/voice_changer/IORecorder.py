@@ -1,3 +1,4 @@
+import threading
 import wave
 import os
 import logging
@@ -12,6 +13,10 @@ class IORecorder:
     def __init__(self, input_sampling_rate: int, output_sampling_rate: int):
         self.fi = None
         self.fo = None
+        # Client sessions convert on several threads and share the recording files.
+        self.lock = threading.Lock()
+        self.input_sampling_rate = input_sampling_rate
+        self.output_sampling_rate = output_sampling_rate
         self.open(input_sampling_rate, output_sampling_rate)
 
     def _clear(self):
@@ -25,7 +30,13 @@ class IORecorder:
             os.remove(filename)
 
     def open(self, input_sampling_rate: int, output_sampling_rate: int):
+        with self.lock:
+            self._open(input_sampling_rate, output_sampling_rate)
+
+    def _open(self, input_sampling_rate: int, output_sampling_rate: int):
         self._clear()
+        self.input_sampling_rate = input_sampling_rate
+        self.output_sampling_rate = output_sampling_rate
 
         self.fi = wave.open(STREAM_INPUT_FILE, "wb")
         self.fi.setnchannels(1)
@@ -48,6 +59,15 @@ class IORecorder:
             raise Exception('IO recorder is closed.')
         self.fo.writeframes(wav)
 
+    def write(self, input_wav, output_wav, input_sampling_rate: int, output_sampling_rate: int) -> bool:
+        """Records a pair of input and output chunks. Chunks at other sampling rates than the files are not recorded."""
+        with self.lock:
+            if input_sampling_rate != self.input_sampling_rate or output_sampling_rate != self.output_sampling_rate:
+                return False
+            self.write_input(input_wav)
+            self.write_output(output_wav)
+            return True
+
     def close(self):
         if self.fi is not None:
             self.fi.close()
@@ -2,6 +2,8 @@
 VoiceChangerV2向け
 """
 import torch
+from collections import deque
+from time import perf_counter
 from data.ModelSlot import RVCModelSlot, saveSlotInfo
 from const import EnumInferenceTypes
 import logging
@@ -13,12 +15,19 @@ from voice_changer.utils.VoiceChangerModel import (
 )
 from voice_changer.RVC.consts import HUBERT_SAMPLE_RATE, WINDOW_SIZE
 from voice_changer.RVC.onnx_exporter.export2onnx import export2onnx
+from voice_changer.RVC.index_compressor.compress_index import compress_index
 from voice_changer.pitch_extractor.PitchExtractorManager import PitchExtractorManager
-from voice_changer.RVC.pipeline.PipelineGenerator import createPipeline
-from voice_changer.common.TorchUtils import circular_write
+from voice_changer.RVC.pipeline.PipelineGenerator import createPipeline, pipelineKey
+from voice_changer.RVC.pipeline.PipelinePool import PipelinePool
+from voice_changer.common.TorchUtils import RingBuffer
+from voice_changer.common.OnnxSession import specialize_sessions
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
-from voice_changer.RVC.pipeline.Pipeline import Pipeline
+from voice_changer.RVC.pipeline.Pipeline import Pipeline, PipelineRequest
+from voice_changer.RVC.pipeline.FeatureCache import FeatureCache
+from voice_changer.RVC.pipeline.PitchCache import PitchCache
+from voice_changer.RVC.pipeline.PipelineScheduler import PipelineScheduler
 from torchaudio import transforms as tat
+from voice_changer.common.Resampler import StreamingResampler, get_resampler
 from voice_changer.VoiceChangerSettings import VoiceChangerSettings
 from settings import get_settings
 from Exceptions import (
@@ -27,10 +36,14 @@ from Exceptions import (
 
 logger = logging.getLogger(__name__)
 
+IDLE_KERNEL_SIZE = 256
+
 
 class RVCr2(VoiceChangerModel):
-    def __init__(self, slotInfo: RVCModelSlot, settings: VoiceChangerSettings):
+    def __init__(self, slotInfo: RVCModelSlot, settings: VoiceChangerSettings, shared: "RVCr2 | None" = None):
         self.voiceChangerType = "RVC"
+        # Session instances borrow the pipeline of the instance that loaded it and only own streaming state.
+        self.shared = shared
 
         self.device_manager = DeviceManager.get_instance()
         EmbedderManager.initialize()
@@ -38,17 +51,27 @@ class RVCr2(VoiceChangerModel):
         self.settings = settings
         self.params = get_settings()
 
-        self.pipeline: Pipeline | None = None
+        self._pipeline: Pipeline | None = None
+        # Pipeline pinned in PipelinePool while this model is active. Sessions do not pin the pipeline they borrow.
+        self._pinned: Pipeline | None = None
 
-        self.convert_buffer: torch.Tensor | None = None
-        self.pitch_buffer: torch.Tensor | None = None
-        self.pitchf_buffer: torch.Tensor | None = None
+        self.audio_buffer: RingBuffer | None = None
+        self.convert_buffer: RingBuffer | None = None
+        self.pitch_buffer: RingBuffer | None = None
+        self.pitchf_buffer: RingBuffer | None = None
+        self.feats_cache = FeatureCache(self.settings.embedderMargin)
+        self.pitch_cache = PitchCache()
         self.return_length = 0
         self.skip_head = 0
         self.silence_front = 0
         self.slotInfo = slotInfo
+        # Recent time spent waiting for the pipeline scheduler, in seconds.
+        self.queue_delays: deque[float] = deque(maxlen=10)
+
+        self.idle_kernel_input: torch.Tensor | None = None
+        self.last_idle_kernel_at = 0
 
-        self.resampler_in: tat.Resample | None = None
+        self.resampler_in: StreamingResampler | None = None
         self.resampler_out: tat.Resample | None = None
 
         self.input_sample_rate = self.settings.inputSampleRate
@@ -60,68 +83,98 @@ class RVCr2(VoiceChangerModel):
         self.is_half = self.device_manager.use_fp16()
         self.dtype = torch.float16 if self.is_half else torch.float32
 
+    @property
+    def pipeline(self) -> Pipeline | None:
+        if self.shared is not None:
+            return self.shared.pipeline
+        return self._pipeline
+
+    def create_session(self, settings: VoiceChangerSettings) -> "RVCr2":
+        return RVCr2(self.slotInfo, settings, shared=self)
+
     def initialize(self, force_reload: bool = False):
         logger.info("Initializing...")
 
-        if self.settings.useONNX and not self.slotInfo.modelFileOnnx:
-            self.export2onnx()
-
-        # pipelineの生成
-        try:
-            self.pipeline = createPipeline(
-                self.slotInfo, self.settings.f0Detector, self.settings.useONNX, force_reload
-            )
-        except Exception as e:  # NOQA
-            logger.error("Failed to create pipeline.")
-            logger.exception(e)
-            return
+        if self.shared is None:
+            if self.settings.useONNX and not self.slotInfo.modelFileOnnx:
+                self.export2onnx()
+
+            pool = PipelinePool.get_instance()
+            pool.set_budget(self.settings.pipelinePoolMemory * 1024 ** 2)
+            if force_reload:
+                pool.clear()
+
+            # pipelineの生成
+            # On device, precision or compile mode changes the previous inferencer is re-targeted from its CPU master copy.
+            template = self._pipeline.inferencer if self._pipeline is not None else None
+            try:
+                self._pipeline = pool.acquire(
+                    pipelineKey(self.slotInfo, self.settings.useONNX),
+                    lambda: createPipeline(self.slotInfo, self.settings.f0Detector, self.settings.useONNX, force_reload, template),
+                )
+            except Exception as e:  # NOQA
+                logger.error("Failed to create pipeline.")
+                logger.exception(e)
+                return
+            previous, self._pinned = self._pinned, self._pipeline
+            if previous is not None:
+                pool.release(previous)
+            # Pooled pipelines keep the pitch extractor they were built with.
+            self._pipeline.setPitchExtractor(PitchExtractorManager.getPitchExtractor(self.settings.f0Detector, False))
+            self._pipeline.set_cuda_graph(bool(self.settings.cudaGraph))
+
+        # Cached features and pitch belong to the previous model.
+        self.feats_cache.clear()
+        self.pitch_cache.clear()
+        if self.convert_buffer is not None:
+            self._warmup()
 
         # 処理は16Kで実施(Pitch, embed, (infer))
-        self.resampler_in = tat.Resample(
-            orig_freq=self.input_sample_rate,
-            new_freq=HUBERT_SAMPLE_RATE,
-            dtype=torch.float32
-        ).to(self.device_manager.device)
-
-        self.resampler_out = tat.Resample(
-            orig_freq=self.slotInfo.samplingRate,
-            new_freq=self.output_sample_rate,
-            dtype=torch.float32
-        ).to(self.device_manager.device)
+        self.resampler_in = StreamingResampler(self.input_sample_rate, HUBERT_SAMPLE_RATE, torch.float32, self.device_manager.device)
+
+        # Consecutive model outputs overlap (SOLA region) instead of continuing each other, so output resampling stays stateless.
+        self.resampler_out = get_resampler(self.slotInfo.samplingRate, self.output_sample_rate, torch.float32, self.device_manager.device)
 
         logger.info("Initialized.")
 
     def set_sampling_rate(self, input_sample_rate: int, output_sample_rate: int):
         if self.input_sample_rate != input_sample_rate:
             self.input_sample_rate = input_sample_rate
-            self.resampler_in = tat.Resample(
-                orig_freq=self.input_sample_rate,
-                new_freq=HUBERT_SAMPLE_RATE,
-                dtype=torch.float32
-            ).to(self.device_manager.device)
+            self.resampler_in = StreamingResampler(self.input_sample_rate, HUBERT_SAMPLE_RATE, torch.float32, self.device_manager.device)
         if self.output_sample_rate != output_sample_rate:
             self.output_sample_rate = output_sample_rate
-            self.resampler_out = tat.Resample(
-                orig_freq=self.slotInfo.samplingRate,
-                new_freq=self.output_sample_rate,
-                dtype=torch.float32
-            ).to(self.device_manager.device)
+            self.resampler_out = get_resampler(self.slotInfo.samplingRate, self.output_sample_rate, torch.float32, self.device_manager.device)
 
     def change_pitch_extractor(self):
         pitchExtractor = PitchExtractorManager.getPitchExtractor(
-            self.settings.f0Detector, self.settings.gpu
+            self.settings.f0Detector, False
         )
         self.pipeline.setPitchExtractor(pitchExtractor)
 
     def update_settings(self, key: str, val, old_val):
-        if key in {"gpu", "forceFp32", "disableJit"}:
+        if key in {"gpu", "forceFp32", "disableJit", "compileMode"}:
             self.is_half = self.device_manager.use_fp16()
             self.dtype = torch.float16 if self.is_half else torch.float32
-            self.initialize(True)
+            # Pool and shared model keys include device settings, so nothing has to be reloaded from disk.
+            self.initialize()
         elif key == 'useONNX':
             self.initialize()
-        elif key == "f0Detector" and self.pipeline is not None:
-            self.change_pitch_extractor()
+        elif key == "f0Detector":
+            # Cached f0 comes from the previous pitch extractor.
+            self.pitch_cache.clear()
+            if self.shared is None and self.pipeline is not None:
+                self.change_pitch_extractor()
+        elif key == 'pipelinePoolMemory' and self.shared is None:
+            PipelinePool.get_instance().set_budget(self.settings.pipelinePoolMemory * 1024 ** 2)
+        elif key == 'cudaGraph' and self.shared is None and self.pipeline is not None:
+            self.pipeline.set_cuda_graph(bool(self.settings.cudaGraph))
+        elif key == 'embedderMargin':
+            self.feats_cache.margin = self.settings.embedderMargin
+        elif key == 'incrementalEmbedding':
+            self.feats_cache.clear()
+        elif key in {'incrementalPitch', 'tran', 'formantShift'}:
+            # Cached f0 is already shifted by tran and formantShift.
+            self.pitch_cache.clear()
         elif key == 'silentThreshold':
             # Convert dB to RMS
             self.inputSensitivity = 10 ** (self.settings.silentThreshold / 20)
@@ -136,17 +189,31 @@ class RVCr2(VoiceChangerModel):
             data["pipelineInfo"] = pipelineInfo
         else:
             data["pipelineInfo"] = "None"
+        data["pipelinePool"] = PipelinePool.get_instance().get_info()
+        data["sharedModels"] = {
+            "embedder": EmbedderManager.registry.get_info(),
+            "pitchExtractor": PitchExtractorManager.registry.get_info(),
+        }
         return data
 
+    def get_session_info(self) -> dict:
+        buffers = [self.audio_buffer, self.convert_buffer, self.pitch_buffer, self.pitchf_buffer]
+        return {
+            "stateMemory": sum(buffer.nbytes for buffer in buffers if buffer is not None),
+            "queueDelay": sum(self.queue_delays) / len(self.queue_delays) if self.queue_delays else 0,
+            "indexCacheHitRate": self.pipeline.index_result_cache.hit_rate() if self.pipeline is not None else 0,
+        }
+
     def get_processing_sampling_rate(self):
         return self.slotInfo.samplingRate
 
     def realloc(self, block_frame: int, extra_frame: int, crossfade_frame: int, sola_search_frame: int):
         # Calculate frame sizes based on DEVICE sample rate (f.e., 48000Hz) and convert to 16000Hz
-        block_frame_16k = int(block_frame / self.input_sample_rate * HUBERT_SAMPLE_RATE)
-        crossfade_frame_16k = int(crossfade_frame / self.input_sample_rate * HUBERT_SAMPLE_RATE)
-        sola_search_frame_16k = int(sola_search_frame / self.input_sample_rate * HUBERT_SAMPLE_RATE)
-        extra_frame_16k = int(extra_frame / self.input_sample_rate * HUBERT_SAMPLE_RATE)
+        # Integer division, so a block is exactly what resampler_in makes of it.
+        block_frame_16k = block_frame * HUBERT_SAMPLE_RATE // self.input_sample_rate
+        crossfade_frame_16k = crossfade_frame * HUBERT_SAMPLE_RATE // self.input_sample_rate
+        sola_search_frame_16k = sola_search_frame * HUBERT_SAMPLE_RATE // self.input_sample_rate
+        extra_frame_16k = extra_frame * HUBERT_SAMPLE_RATE // self.input_sample_rate
 
         convert_size_16k = block_frame_16k + sola_search_frame_16k + extra_frame_16k + crossfade_frame_16k
         if (modulo := convert_size_16k % WINDOW_SIZE) != 0:  # モデルの出力のホップサイズで切り捨てが発生するので補う。
@@ -159,18 +226,54 @@ class RVCr2(VoiceChangerModel):
 
         # Audio buffer to measure volume between chunks
         audio_buffer_size = block_frame_16k + crossfade_frame_16k
-        self.audio_buffer = torch.zeros(audio_buffer_size, dtype=self.dtype, device=self.device_manager.device)
+        self.audio_buffer = RingBuffer(audio_buffer_size, self.dtype, self.device_manager.device)
 
         # Audio buffer for conversion without silence
-        self.convert_buffer = torch.zeros(convert_size_16k, dtype=self.dtype, device=self.device_manager.device)
+        self.convert_buffer = RingBuffer(convert_size_16k, self.dtype, self.device_manager.device)
         # Additional +1 is to compensate for pitch extraction algorithm
         # that can output additional feature.
-        self.pitch_buffer = torch.zeros(self.convert_feature_size_16k + 1, dtype=torch.int64, device=self.device_manager.device)
-        self.pitchf_buffer = torch.zeros(self.convert_feature_size_16k + 1, dtype=self.dtype, device=self.device_manager.device)
+        self.pitch_buffer = RingBuffer(self.convert_feature_size_16k + 1, torch.int64, self.device_manager.device)
+        self.pitchf_buffer = RingBuffer(self.convert_feature_size_16k + 1, self.dtype, self.device_manager.device)
+        self.feats_cache.clear()
+        self.pitch_cache.clear()
+        if self.pipeline is not None:
+            self._warmup()
         logger.info(f'Allocated audio buffer size: {audio_buffer_size}')
         logger.info(f'Allocated convert buffer size: {convert_size_16k}')
         logger.info(f'Allocated pitchf buffer size: {self.convert_feature_size_16k + 1}')
 
+    def _warmup(self):
+        # torch.compile and ONNX sessions specialize on new shapes. Do it now instead of on the first chunk.
+        if self.device_manager.get_compile_mode() == 'compile' or self.pipeline.onnx_sessions():
+            self.warmup()
+
+    def warmup(self):
+        logger.info('Warming up pipeline...')
+        PipelineScheduler.get_instance(self.pipeline.device).submit(self._warmup_run).result()
+        logger.info('Warm-up done.')
+
+    def _warmup_run(self):
+        # Runs on the worker. Caches are cleared on realloc, so this is the full window geometry.
+        with specialize_sessions():
+            self.pipeline.exec(*self._make_request(self.convert_buffer.as_linear()))
+
+    def release(self):
+        # Chunks already queued keep working with the pipeline, pool eviction only drops its shared model references.
+        if self._pinned is not None:
+            PipelinePool.get_instance().release(self._pinned)
+            self._pinned = None
+
+    def handover(self, previous: "RVCr2"):
+        # Continue the input history of the previous model, so the first chunks are converted with full context.
+        for target, source in ((self.audio_buffer, previous.audio_buffer), (self.convert_buffer, previous.convert_buffer)):
+            if target is not None and source is not None:
+                target.write(source.as_linear())
+        self.feats_cache.clear()
+        self.pitch_cache.clear()
+        # Pitch extractor may have been changed while this model was loading.
+        if self.shared is None and self.pipeline is not None and previous.pipeline is not None:
+            self.pipeline.setPitchExtractor(PitchExtractorManager.getPitchExtractor(self.settings.f0Detector, False))
+
     def convert(self, audio_in: AudioInOutFloat, sample_rate: int) -> torch.Tensor:
         if self.pipeline is None:
             raise PipelineNotInitializedException()
@@ -182,11 +285,7 @@ class RVCr2(VoiceChangerModel):
 
         convert_feature_size_16k = audio_in_t.shape[0] // WINDOW_SIZE
 
-        resampler_temp = tat.Resample(
-            orig_freq=sample_rate,
-            new_freq=HUBERT_SAMPLE_RATE,
-            dtype=self.dtype
-        ).to(self.device_manager.device)
+        resampler_temp = get_resampler(sample_rate, HUBERT_SAMPLE_RATE, self.dtype, self.device_manager.device)
         audio_in_16k = resampler_temp(audio_in_t)
 
         vol_t = torch.sqrt(
@@ -208,6 +307,7 @@ class RVCr2(VoiceChangerModel):
             0,
             convert_feature_size_16k,
             self.settings.protect,
+            index_top_k=self.settings.indexTopK,
         )
 
         # TODO: Need to handle resampling for individual files
@@ -216,63 +316,87 @@ class RVCr2(VoiceChangerModel):
 
         return audio_out
 
-    def inference(self, audio_in: AudioInOutFloat):
-        if self.pipeline is None:
-            raise PipelineNotInitializedException()
+    def _make_request(self, audio: torch.Tensor) -> PipelineRequest:
+        return PipelineRequest(
+            self.settings.dstId,
+            audio,
+            self.pitch_buffer,
+            self.pitchf_buffer,
+            self.settings.tran,
+            self.settings.formantShift,
+            self.settings.indexRatio,
+            self.convert_feature_size_16k,
+            self.silence_front,
+            self.slotInfo.embOutputLayer,
+            self.slotInfo.useFinalProj,
+            self.skip_head,
+            self.return_length,
+            self.settings.protect,
+            self.feats_cache if self.settings.incrementalEmbedding else None,
+            self.pitch_cache if self.settings.incrementalPitch else None,
+            self.settings.indexTopK,
+            bool(self.settings.indexResultCache),
+        )
 
+    def _resample_input(self, audio_in: AudioInOutFloat) -> torch.Tensor:
         # Input audio is always float32
         audio_in_t = torch.as_tensor(audio_in, dtype=torch.float32, device=self.device_manager.device)
         audio_in_16k = self.resampler_in(audio_in_t)
         if self.is_half:
             audio_in_16k = audio_in_16k.half()
+        return audio_in_16k
+
+    def skip(self, audio_in: AudioInOutFloat):
+        audio_in_16k = self._resample_input(audio_in)
+        self.audio_buffer.write(audio_in_16k)
+        self.convert_buffer.write(audio_in_16k)
+        self.feats_cache.advance(audio_in_16k.shape[0])
+        self.pitch_cache.advance(audio_in_16k.shape[0])
+
+    def _idle(self):
+        # Busy wait to keep power manager happy and clocks stable. Running pipeline on-demand seems to lag when the delay between
+        # voice changer activation is too high.
+        # https://forums.developer.nvidia.com/t/why-kernel-calculate-speed-got-slower-after-waiting-for-a-while/221059/9
+        strategy = self.settings.idleStrategy
+        if strategy == 'full':
+            PipelineScheduler.get_instance(self.pipeline.device).exec(self.pipeline, self._make_request(self.convert_buffer.as_linear()))
+        elif strategy == 'kernel':
+            # A small matmul is enough to keep clocks up at a fraction of the cost of the full pipeline.
+            now = perf_counter()
+            if now - self.last_idle_kernel_at < self.settings.idleKernelInterval:
+                return
+            self.last_idle_kernel_at = now
+            # Device work runs on the device worker, in order with inference of other sessions.
+            PipelineScheduler.get_instance(self.pipeline.device).submit(self._idle_kernel, self.pipeline.device).result()
+
+    def _idle_kernel(self, device: torch.device):
+        if self.idle_kernel_input is None or self.idle_kernel_input.device != device:
+            self.idle_kernel_input = torch.rand(IDLE_KERNEL_SIZE, IDLE_KERNEL_SIZE, dtype=self.dtype, device=device)
+        torch.mm(self.idle_kernel_input, self.idle_kernel_input)
+
+    def inference(self, audio_in: AudioInOutFloat):
+        if self.pipeline is None:
+            raise PipelineNotInitializedException()
+
+        audio_in_16k = self._resample_input(audio_in)
 
-        circular_write(audio_in_16k, self.audio_buffer)
+        audio_buffer = self.audio_buffer.write(audio_in_16k)
 
         vol_t = torch.sqrt(
-            torch.square(self.audio_buffer).mean()
+            torch.square(audio_buffer).mean()
         )
         vol = max(vol_t.item(), 0)
 
         if vol < self.inputSensitivity:
-            # Busy wait to keep power manager happy and clocks stable. Running pipeline on-demand seems to lag when the delay between
-            # voice changer activation is too high.
-            # https://forums.developer.nvidia.com/t/why-kernel-calculate-speed-got-slower-after-waiting-for-a-while/221059/9
-            self.pipeline.exec(
-                self.settings.dstId,
-                self.convert_buffer,
-                self.pitch_buffer,
-                self.pitchf_buffer,
-                self.settings.tran,
-                self.settings.formantShift,
-                self.settings.indexRatio,
-                self.convert_feature_size_16k,
-                self.silence_front,
-                self.slotInfo.embOutputLayer,
-                self.slotInfo.useFinalProj,
-                self.skip_head,
-                self.return_length,
-                self.settings.protect,
-            )
+            self._idle()
             return None, vol
 
-        circular_write(audio_in_16k, self.convert_buffer)
+        convert_buffer = self.convert_buffer.write(audio_in_16k)
+        self.feats_cache.advance(audio_in_16k.shape[0])
+        self.pitch_cache.advance(audio_in_16k.shape[0])
 
-        audio_model = self.pipeline.exec(
-            self.settings.dstId,
-            self.convert_buffer,
-            self.pitch_buffer,
-            self.pitchf_buffer,
-            self.settings.tran,
-            self.settings.formantShift,
-            self.settings.indexRatio,
-            self.convert_feature_size_16k,
-            self.silence_front,
-            self.slotInfo.embOutputLayer,
-            self.slotInfo.useFinalProj,
-            self.skip_head,
-            self.return_length,
-            self.settings.protect,
-        )
+        audio_model, queue_delay = PipelineScheduler.get_instance(self.pipeline.device).exec(self.pipeline, self._make_request(convert_buffer))
+        self.queue_delays.append(queue_delay)
 
         # FIXME: Why the heck does it require another sqrt to amplify the volume?
         audio_out: torch.Tensor = self.resampler_out(audio_model * torch.sqrt(vol_t))
@@ -280,7 +404,7 @@ class RVCr2(VoiceChangerModel):
         return audio_out, vol
 
     def __del__(self):
-        del self.pipeline
+        del self._pipeline
 
     def export2onnx(self):
         modelSlot = self.slotInfo
@@ -295,6 +419,22 @@ class RVCr2(VoiceChangerModel):
         self.slotInfo.modelTypeOnnx = EnumInferenceTypes.onnxRVC.value if self.slotInfo.f0 else EnumInferenceTypes.onnxRVCNono.value
         saveSlotInfo(self.params.model_dir, self.slotInfo.slotIndex, self.slotInfo)
 
+    def compress_index(self, mode: str, table_dtype: str) -> dict:
+        if not mode:
+            # Go back to the original index.
+            self.slotInfo.indexFileCompressed = ""
+            self.slotInfo.indexTableFile = ""
+            report = {}
+        else:
+            result = compress_index(self.slotInfo, mode, table_dtype)
+            self.slotInfo.indexFileCompressed = result["indexFileCompressed"]
+            self.slotInfo.indexTableFile = result["indexTableFile"]
+            report = result["report"]
+        saveSlotInfo(self.params.model_dir, self.slotInfo.slotIndex, self.slotInfo)
+        # The pipeline is swapped on the worker, so it never changes under a running conversion.
+        PipelineScheduler.get_instance().submit(self.initialize).result()
+        return report
+
     def get_model_current(self) -> dict:
         return [
             {
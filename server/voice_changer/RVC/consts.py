@@ -1,2 +1,4 @@
 HUBERT_SAMPLE_RATE = 16000
-WINDOW_SIZE = HUBERT_SAMPLE_RATE // 100
\ No newline at end of file
+WINDOW_SIZE = HUBERT_SAMPLE_RATE // 100
+# Embedders output one feature frame per 20ms.
+FEATURE_HOP_SIZE = WINDOW_SIZE * 2
@@ -0,0 +1,136 @@
+import os
+import faiss
+import numpy as np
+from time import perf_counter
+from safetensors.numpy import save_file
+from data.ModelSlot import RVCModelSlot
+from voice_changer.common.IndexLoader import load_index
+from settings import get_settings
+
+import logging
+logger = logging.getLogger(__name__)
+
+INDEX_COMPRESSION_MODES = ['ivfpq', 'hnsw']
+TABLE_DTYPES = ['float32', 'float16', 'int8']
+
+# Product quantization codes 8 dimensions per byte. Training needs about 39 points per centroid of the 8-bit codebooks.
+PQ_DIMS_PER_CODE = 8
+PQ_MIN_TRAINING_SIZE = 39 * 256
+HNSW_NEIGHBORS = 32
+HNSW_EF_SEARCH = 64
+
+# Evaluation of the compressed index against the original one.
+EVAL_QUERIES = 1024
+EVAL_TOP_K = 8
+EVAL_NOISE = 0.1
+
+
+def compress_index(modelSlot: RVCModelSlot, mode: str, table_dtype: str) -> dict:
+    """
+    Rebuilds the slot index as IVF-PQ or HNSW (8-bit scalar quantized) and stores the vectors used for
+    feature blending with the given dtype. Returns the paths of the written files and a report comparing
+    memory, search latency and blended feature error with the original index.
+    """
+    if mode not in INDEX_COMPRESSION_MODES:
+        raise ValueError(f'Unknown index compression mode: {mode}')
+    if table_dtype not in TABLE_DTYPES:
+        raise ValueError(f'Unknown index table dtype: {table_dtype}')
+
+    model_path = os.path.join(get_settings().model_dir, str(modelSlot.slotIndex))
+    index_path = os.path.join(model_path, os.path.basename(modelSlot.indexFile))
+    index, vectors = load_index(index_path)
+    if vectors is None:
+        raise ValueError('Index is untrained or empty.')
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    logger.info(f'Compressing index with {mode} and {table_dtype} table...')
+    compressed = _build_index(index, vectors, mode)
+    table = _make_table(vectors, table_dtype)
+
+    fname, _ = os.path.splitext(os.path.basename(modelSlot.indexFile))
+    compressed_file = f'{fname}.{mode}.index'
+    table_file = f'{fname}.{mode}.{table_dtype}.safetensors'
+    faiss.write_index(compressed, os.path.join(model_path, compressed_file))
+    save_file(table, os.path.join(model_path, table_file))
+
+    report = _evaluate(index, vectors, compressed, table)
+    logger.info(f'Index compression report: {report}')
+    return {
+        'indexFileCompressed': compressed_file,
+        'indexTableFile': table_file,
+        'report': report,
+    }
+
+
+def _build_index(index: faiss.Index, vectors: np.ndarray, mode: str) -> faiss.Index:
+    ntotal, dim = vectors.shape
+    if mode == 'ivfpq':
+        if ntotal < PQ_MIN_TRAINING_SIZE:
+            raise ValueError(f'Index is too small for product quantization ({ntotal} < {PQ_MIN_TRAINING_SIZE} vectors).')
+        ivf = faiss.try_extract_index_ivf(index)
+        # Keep the list count and probes of the original index, so search cost stays comparable.
+        nlist = ivf.nlist if ivf is not None else int(16 * np.sqrt(ntotal))
+        compressed = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, dim // PQ_DIMS_PER_CODE, 8)
+        compressed.train(vectors)
+        compressed.add(vectors)
+        compressed.nprobe = ivf.nprobe if ivf is not None else 1
+        return compressed
+
+    compressed = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_NEIGHBORS)
+    compressed.train(vectors)
+    compressed.add(vectors)
+    compressed.hnsw.efSearch = HNSW_EF_SEARCH
+    return compressed
+
+
+def _make_table(vectors: np.ndarray, table_dtype: str) -> dict[str, np.ndarray]:
+    if table_dtype == 'int8':
+        # Symmetric per-dimension quantization.
+        scale = np.maximum(np.abs(vectors).max(axis=0), np.finfo(np.float32).tiny) / 127
+        codes = np.clip(np.round(vectors / scale), -127, 127).astype(np.int8)
+        return {'table': codes, 'scale': scale.astype(np.float32)}
+    return {'table': vectors.astype(table_dtype)}
+
+
+def _dequantize(table: dict[str, np.ndarray], ix: np.ndarray) -> np.ndarray:
+    rows = table['table'][ix].astype(np.float32)
+    if 'scale' in table:
+        rows *= table['scale']
+    return rows
+
+
+def _blend(dist: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    # Same weighting as Pipeline._search_index.
+    weight = np.square(1 / np.maximum(dist, np.finfo(np.float32).tiny))
+    weight /= weight.sum(axis=1, keepdims=True)
+    return (rows * weight[:, :, np.newaxis]).sum(axis=1)
+
+
+def _search(index: faiss.Index, queries: np.ndarray) -> tuple[np.ndarray, np.ndarray, float]:
+    started = perf_counter()
+    dist, ix = index.search(queries, EVAL_TOP_K)
+    return np.asarray(dist), np.asarray(ix), (perf_counter() - started) / queries.shape[0]
+
+
+def _evaluate(index: faiss.Index, vectors: np.ndarray, compressed: faiss.Index, table: dict[str, np.ndarray]) -> dict:
+    # Index vectors with some noise stand in for embedder output of unseen audio.
+    rng = np.random.default_rng(0)
+    sample = vectors[rng.choice(vectors.shape[0], min(EVAL_QUERIES, vectors.shape[0]), replace=False)]
+    queries = (sample + rng.normal(0, EVAL_NOISE * vectors.std(), sample.shape)).astype(np.float32)
+
+    dist, ix, latency = _search(index, queries)
+    expected = _blend(dist, vectors[ix])
+    compressed_dist, compressed_ix, compressed_latency = _search(compressed, queries)
+    # Missing neighbours are reported as -1. Their weight is zero.
+    compressed_dist[compressed_ix < 0] = np.inf
+    blended = _blend(compressed_dist, _dequantize(table, np.maximum(compressed_ix, 0)))
+
+    error = np.linalg.norm(blended - expected, axis=1) / np.maximum(np.linalg.norm(expected, axis=1), np.finfo(np.float32).tiny)
+    return {
+        'memory': len(faiss.serialize_index(index)) + vectors.nbytes,
+        'compressedMemory': len(faiss.serialize_index(compressed)) + sum(array.nbytes for array in table.values()),
+        'latency': latency,
+        'compressedLatency': compressed_latency,
+        'relativeError': float(error.mean()),
+        'recall': float(np.mean([len(np.intersect1d(a, b)) / EVAL_TOP_K for a, b in zip(ix, compressed_ix)])),
+    }
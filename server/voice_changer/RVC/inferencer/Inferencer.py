@@ -1,15 +1,39 @@
+import copy
 from typing import Any, Protocol
 import torch
 import onnxruntime
+from torch.nn.utils.weight_norm import WeightNorm
 
 from const import EnumInferenceTypes
+from voice_changer.common.deviceManager.DeviceManager import DeviceManager
+
+
+def drop_weight_norm_cache(model: torch.nn.Module):
+    """
+    Drops the weights that weight norm hooks computed at construction. They are stale after loading a checkpoint
+    and are recomputed from weight_g and weight_v on the next forward or when weight norm is removed.
+    """
+    for module in model.modules():
+        for hook in module._forward_pre_hooks.values():
+            if isinstance(hook, WeightNorm):
+                setattr(module, hook.name, None)
 
 
 class Inferencer(Protocol):
     inferencerType: EnumInferenceTypes = EnumInferenceTypes.pyTorchRVC
     file: str
+    # Whether infer() accepts a batch of requests and returns one row of audio per request.
+    supports_batch: bool = False
+    # Whether infer() only runs torch ops on the current stream and can be captured into a CUDA graph.
+    supports_cuda_graph: bool = False
 
     model: onnxruntime.InferenceSession | Any | None = None
+    # Eager model on CPU with the tensors of the checkpoint as loaded: memory mapped and in the checkpoint dtype
+    # (see SafetensorsUtils.MappedSafetensors). Lets torch inferencers move to another device, precision
+    # or compile mode (see retarget) without reading the model file again.
+    master: torch.nn.Module | None = None
+    # Whether weight norm is folded into the weights of placed models (master keeps it).
+    fold_weight_norm: bool = False
 
     def load_model(self, file: str):
         ...
@@ -27,6 +51,42 @@ class Inferencer(Protocol):
     ) -> torch.Tensor:
         ...
 
+    def place(self) -> "Inferencer":
+        """Creates model from master for the current device, precision and compile mode."""
+        self.model = self.copy_master()
+        return self
+
+    def copy_master(self) -> torch.nn.Module:
+        device_manager = DeviceManager.get_instance()
+        is_half = device_manager.use_fp16()
+        # Tensors are cast one by one while they are moved to the device, so no copy of the module is made on CPU.
+        # Weight norm is folded at full precision, so its weight_g and weight_v are moved in fp32 and the folded
+        # weights are cast to the target dtype after. Other tensors are cast to the target dtype directly.
+        # Tensors of the checkpoint that already have the target dtype and device are shared with master.
+        dtype = torch.float16 if is_half else torch.float32
+        memo = {}
+        for name, tensor in (*self.master.named_parameters(), *self.master.named_buffers()):
+            folded = self.fold_weight_norm and name.endswith(('.weight_g', '.weight_v'))
+            moved = tensor.detach().to(device_manager.device, (torch.float32 if folded else dtype) if tensor.is_floating_point() else None)
+            if isinstance(tensor, torch.nn.Parameter):
+                moved = torch.nn.Parameter(moved, requires_grad=tensor.requires_grad)
+            memo[id(tensor)] = moved
+        model = copy.deepcopy(self.master, memo)
+        if self.fold_weight_norm:
+            model.remove_weight_norm()
+            if is_half:
+                model = model.half()
+        for module in model.modules():
+            if hasattr(module, 'is_half'):
+                module.is_half = is_half
+        return model
+
+    def retarget(self) -> "Inferencer | None":
+        """Returns a copy of this inferencer placed for the current device settings, or None if it has no master."""
+        if self.master is None:
+            return None
+        return copy.copy(self).place()
+
     def set_props(
         self,
         inferencerType: EnumInferenceTypes,
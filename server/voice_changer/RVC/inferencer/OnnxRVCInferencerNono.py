@@ -22,37 +22,22 @@ class OnnxRVCInferencerNono(OnnxRVCInferencer):
         return_length: int,
         formant_length: int,
     ) -> torch.Tensor:
-        if feats.device.type == 'cuda':
-            binding = self.model.io_binding()
-
-            binding.bind_input('feats', device_type='cuda', device_id=feats.device.index, element_type=self.fp_dtype_np, shape=tuple(feats.shape), buffer_ptr=feats.float().data_ptr())
-            binding.bind_input('p_len', device_type='cuda', device_id=feats.device.index, element_type=np.int64, shape=tuple(pitch_length.shape), buffer_ptr=pitch_length.data_ptr())
-            binding.bind_input('sid', device_type='cuda', device_id=feats.device.index, element_type=np.int64, shape=tuple(sid.shape), buffer_ptr=sid.data_ptr())
-            binding.bind_cpu_input('skip_head', np.array(skip_head, dtype=np.int64))
-            binding.bind_cpu_input('return_length', np.array(return_length, dtype=np.int64))
-            binding.bind_cpu_input('formant_length', np.array(formant_length, dtype=np.int64))
-
-            binding.bind_output('audio', device_type='cuda', device_id=feats.device.index)
-
-            self.model.run_with_iobinding(binding)
-
-            output = [output.numpy() for output in binding.get_outputs()]
-        else:
-            output = self.model.run(
-                ["audio"],
-                {
-                    "feats": feats.float().detach().cpu().numpy(),
-                    "p_len": pitch_length.detach().cpu().numpy(),
-                    "sid": sid.detach().cpu().numpy(),
-                    "skip_head": np.array(skip_head, dtype=np.int64),
-                    "return_length": np.array(return_length, dtype=np.int64),
-                    "formant_length": np.array(formant_length, dtype=np.int64),
-                },
-            )
-        # self.model.end_profiling()
+        output = self.model.run(
+            {
+                'feats': feats,
+                'p_len': pitch_length,
+                'sid': sid,
+            },
+            {
+                'skip_head': np.array(skip_head, dtype=np.int64),
+                'return_length': np.array(return_length, dtype=np.int64),
+                'formant_length': np.array(formant_length, dtype=np.int64),
+            },
+        )
 
         res = torch.as_tensor(output[0], dtype=self.fp_dtype_t, device=feats.device)
 
         if self.inferencerTypeVersion == "v2.1" or self.inferencerTypeVersion == "v2.2" or self.inferencerTypeVersion == "v1.1":
-            return res
+            # Output buffer of the session. Results leave the device worker, so they are copied.
+            return res.clone()
         return torch.clip(res[0, 0], -1.0, 1.0)
\ No newline at end of file
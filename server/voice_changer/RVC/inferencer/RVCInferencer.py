@@ -1,38 +1,34 @@
 import torch
 import json
 from const import EnumInferenceTypes
-from safetensors import safe_open
-from voice_changer.common.deviceManager.DeviceManager import DeviceManager
-from voice_changer.RVC.inferencer.Inferencer import Inferencer
+from voice_changer.RVC.inferencer.Inferencer import Inferencer, drop_weight_norm_cache
 from .rvc_models.infer_pack.models import SynthesizerTrnMs256NSFsid
-from voice_changer.common.SafetensorsUtils import load_model
+from voice_changer.common.SafetensorsUtils import MappedSafetensors, load_checkpoint, load_model, load_state_dict
 
 
 class RVCInferencer(Inferencer):
+    fold_weight_norm = True
+    supports_batch = True
+    supports_cuda_graph = True
+
     def load_model(self, file: str):
-        device_manager = DeviceManager.get_instance()
-        dev = device_manager.device
-        is_half = device_manager.use_fp16()
         self.set_props(EnumInferenceTypes.pyTorchRVC, file)
 
         # Keep torch.load for backward compatibility, but discourage the use of this loading method
         if file.endswith('.safetensors'):
-            with safe_open(file, 'pt', device=str(dev) if dev.type == 'cuda' else 'cpu') as cpt:
+            with MappedSafetensors(file) as cpt:
                 config = json.loads(cpt.metadata()['config'])
-                model = SynthesizerTrnMs256NSFsid(*config, is_half=is_half).to(dev)
-                load_model(model, cpt, strict=False)
+                model = SynthesizerTrnMs256NSFsid(*config, is_half=False)
+                load_model(model, cpt, strict=False, cast=False)
         else:
-            cpt = torch.load(file, map_location=dev if dev.type == 'cuda' else 'cpu')
-            model = SynthesizerTrnMs256NSFsid(*cpt["config"], is_half=is_half).to(dev)
-            model.load_state_dict(cpt["weight"], strict=False)
-
-        model.eval().remove_weight_norm()
+            cpt = load_checkpoint(file)
+            model = SynthesizerTrnMs256NSFsid(*cpt["config"], is_half=False)
+            load_state_dict(model, cpt["weight"], strict=False, cast=False)
 
-        if is_half:
-            model = model.half()
+        drop_weight_norm_cache(model.eval())
 
-        self.model = model
-        return self
+        self.master = model
+        return self.place()
 
     def infer(
         self,
@@ -57,5 +53,5 @@ class RVCInferencer(Inferencer):
             return_length=return_length,
             formant_length=formant_length
         )
-        res = res[0][0, 0]
-        return torch.clip(res, -1.0, 1.0, out=res)
+        res = res[0][:, 0]
+        return torch.clip(res, -1.0, 1.0, out=res).squeeze(0)
@@ -1,46 +1,43 @@
 import torch
 import json
 import logging
-from safetensors import safe_open
 from const import EnumInferenceTypes
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
-from voice_changer.RVC.inferencer.Inferencer import Inferencer
+from voice_changer.RVC.inferencer.Inferencer import Inferencer, drop_weight_norm_cache
 from .rvc_models.infer_pack.models import SynthesizerTrnMs768NSFsid
-from voice_changer.common.SafetensorsUtils import load_model
+from voice_changer.common.SafetensorsUtils import MappedSafetensors, load_checkpoint, load_model, load_state_dict
+from voice_changer.common.ModelCompiler import compile_model
 
 logger = logging.getLogger(__name__)
 
 class RVCInferencerv2(Inferencer):
+    fold_weight_norm = True
+    supports_batch = True
+    supports_cuda_graph = True
+
     def load_model(self, file: str):
-        device_manager = DeviceManager.get_instance()
-        dev = device_manager.device
-        is_half = device_manager.use_fp16()
-        use_jit_compile = device_manager.use_jit_compile()
         self.set_props(EnumInferenceTypes.pyTorchRVCv2, file)
 
         # Keep torch.load for backward compatibility, but discourage the use of this loading method
         if file.endswith('.safetensors'):
-            with safe_open(file, 'pt', device=str(dev) if dev.type == 'cuda' else 'cpu') as cpt:
+            with MappedSafetensors(file) as cpt:
                 config = json.loads(cpt.metadata()['config'])
-                model = SynthesizerTrnMs768NSFsid(*config, is_half=is_half).to(dev)
-                load_model(model, cpt, strict=False)
+                model = SynthesizerTrnMs768NSFsid(*config, is_half=False)
+                load_model(model, cpt, strict=False, cast=False)
         else:
-            cpt = torch.load(file, map_location=dev if dev.type == 'cuda' else 'cpu')
-            model = SynthesizerTrnMs768NSFsid(*cpt["config"], is_half=is_half).to(dev)
-            model.load_state_dict(cpt["weight"], strict=False)
-        model = model.eval()
-
-        model.remove_weight_norm()
+            cpt = load_checkpoint(file)
+            model = SynthesizerTrnMs768NSFsid(*cpt["config"], is_half=False)
+            load_state_dict(model, cpt["weight"], strict=False, cast=False)
 
-        if is_half:
-            model = model.half()
+        drop_weight_norm_cache(model.eval())
 
-        self.use_jit_eager = not use_jit_compile
-        if use_jit_compile:
-            logger.info('Compiling JIT model...')
-            model = torch.jit.optimize_for_inference(torch.jit.script(model), other_methods=['infer'])
+        self.master = model
+        return self.place()
 
-        self.model = model
+    def place(self):
+        compile_mode = DeviceManager.get_instance().get_compile_mode()
+        self.use_jit_eager = compile_mode != 'jit'
+        self.model = compile_model(self.copy_master(), compile_mode, ('infer',))
         return self
 
     def infer(
@@ -67,5 +64,5 @@ class RVCInferencerv2(Inferencer):
                 return_length=return_length,
                 formant_length=formant_length
             )
-        res = res[0][0, 0]
-        return torch.clip(res, -1.0, 1.0, out=res)
+        res = res[0][:, 0]
+        return torch.clip(res, -1.0, 1.0, out=res).squeeze(0)
@@ -1,31 +1,26 @@
 import torch
 from const import EnumInferenceTypes
-from voice_changer.common.deviceManager.DeviceManager import DeviceManager
 
-from voice_changer.RVC.inferencer.Inferencer import Inferencer
+from voice_changer.common.SafetensorsUtils import load_checkpoint, load_state_dict
+from voice_changer.RVC.inferencer.Inferencer import Inferencer, drop_weight_norm_cache
 from voice_changer.RVC.inferencer.rvc_models.infer_pack.models_onnx import SynthesizerTrnMsNSFsidM
 
 
 class WebUIInferencer(Inferencer):
+    supports_batch = True
+    supports_cuda_graph = True
+
     def load_model(self, file: str):
         self.set_props(EnumInferenceTypes.pyTorchWebUI, file)
 
-        device_manager = DeviceManager.get_instance()
-        dev = device_manager.device
-        is_half = device_manager.use_fp16()
-
-        cpt = torch.load(file, map_location="cpu")
-        model = SynthesizerTrnMsNSFsidM(**cpt["params"], is_half=is_half)
-
-        model.eval()
-        model.load_state_dict(cpt["weight"], strict=False)
+        cpt = load_checkpoint(file)
+        model = SynthesizerTrnMsNSFsidM(**cpt["params"], is_half=False)
 
-        model = model.to(dev)
-        if is_half:
-            model = model.half()
+        load_state_dict(model, cpt["weight"], strict=False, cast=False)
+        drop_weight_norm_cache(model.eval())
 
-        self.model = model
-        return self
+        self.master = model
+        return self.place()
 
     def infer(
         self,
@@ -50,5 +45,5 @@ class WebUIInferencer(Inferencer):
             return_length=return_length,
             formant_length=formant_length
         )
-        res = res[0][0, 0]
-        return torch.clip(res, -1.0, 1.0)
+        res = res[0][:, 0]
+        return torch.clip(res, -1.0, 1.0).squeeze(0)
@@ -0,0 +1,77 @@
+import torch
+
+from voice_changer.RVC.consts import FEATURE_HOP_SIZE
+from voice_changer.embedder.Embedder import Embedder
+
+
+class FeatureCache:
+    """
+    Per-stream cache of embedder output for incremental feature extraction.
+
+    The convert buffer is a sliding window, so most of it was already embedded on the previous chunk.
+    Cached frames are shifted by the number of samples written since, and only the tail of the window
+    (new frames plus margin frames of context) is embedded again. A larger margin gives the embedder
+    more context around the new audio at a higher cost.
+
+    Writes that are not a multiple of the feature hop shift the cached frames by the nearest whole frame.
+    The remainder is carried over to later shifts, so cached frames are never off by more than half a frame.
+    """
+
+    def __init__(self, margin: int):
+        self.margin = margin
+        self.feats: torch.Tensor | None = None
+        self.key: tuple | None = None
+        # Samples written to the convert buffer since feats were computed.
+        self.shift = 0
+        self.residual = 0
+
+    def advance(self, samples: int):
+        self.shift += samples
+
+    def clear(self):
+        self.feats = None
+        self.key = None
+        self.shift = 0
+        self.residual = 0
+
+    def store(self, feats: torch.Tensor, key: tuple, residual: int = 0):
+        self.feats = feats
+        self.key = key
+        self.shift = 0
+        self.residual = residual
+
+    @staticmethod
+    def make_key(audio: torch.Tensor, embOutputLayer: int, useFinalProj: bool) -> tuple:
+        return (audio.shape[-1], audio.dtype, audio.device, embOutputLayer, useFinalProj)
+
+    def _extract_full(self, embedder: Embedder, audio: torch.Tensor, embOutputLayer: int, useFinalProj: bool, key: tuple) -> torch.Tensor:
+        feats = embedder.extract_features(audio.view(1, -1), embOutputLayer, useFinalProj)
+        # ONNX embedders return buffers that their next run overwrites (see StaticShapeSession.run).
+        self.store(feats.clone(), key)
+        return feats
+
+    def extract(self, embedder: Embedder, audio: torch.Tensor, embOutputLayer: int, useFinalProj: bool) -> torch.Tensor:
+        key = self.make_key(audio, embOutputLayer, useFinalProj)
+        if self.feats is None or self.key != key:
+            return self._extract_full(embedder, audio, embOutputLayer, useFinalProj, key)
+
+        if self.shift == 0:
+            return self.feats
+
+        total_frames = self.feats.shape[1]
+        shift = self.shift + self.residual
+        shift_frames = round(shift / FEATURE_HOP_SIZE)
+        new_frames = -(-self.shift // FEATURE_HOP_SIZE) + self.margin
+        # Tail starts on the frame grid of the whole window, so it yields the same frames a full pass would.
+        start_frame = audio.shape[0] // FEATURE_HOP_SIZE - new_frames
+        if start_frame <= 0 or shift_frames + start_frame > total_frames:
+            return self._extract_full(embedder, audio, embOutputLayer, useFinalProj, key)
+
+        tail = embedder.extract_features(audio[start_frame * FEATURE_HOP_SIZE :].view(1, -1), embOutputLayer, useFinalProj)
+        if tail.shape[1] != total_frames - start_frame:
+            # Embedder does not follow the expected frame arithmetic. Fall back to full extraction.
+            return self._extract_full(embedder, audio, embOutputLayer, useFinalProj, key)
+
+        feats = torch.cat((self.feats[:, shift_frames : shift_frames + start_frame], tail), 1)
+        self.store(feats, key, shift - shift_frames * FEATURE_HOP_SIZE)
+        return feats
@@ -0,0 +1,51 @@
+import torch
+from collections import OrderedDict, deque
+from typing import Callable
+
+# Number of frames kept. Enough for the overlapping region of a few sessions.
+INDEX_RESULT_CACHE_SIZE = 8192
+# Number of recent searches the hit rate is computed over.
+HIT_RATE_WINDOW = 50
+
+
+class IndexResultCache:
+    """
+    Blended index vectors of recently searched feature frames, keyed by a hash of the frame contents and top_k.
+
+    Consecutive chunks share most of their frames, so only frames that were not seen recently are searched.
+    Frames hit only if they are bit-identical, e.g. frames kept by incremental embedding.
+    The hashes are integer sums over the frame bits, so they do not depend on reduction order or batch shape.
+    Frames are keyed by two independent 64-bit hashes, so a stale row is returned only if both collide.
+    """
+
+    def __init__(self, dim: int, device: torch.device):
+        generator = torch.Generator().manual_seed(0)
+        self.coefficients = torch.randint(-(2 ** 62), 2 ** 62, (dim, 2), generator=generator, dtype=torch.int64).to(device)
+        self.entries: OrderedDict[tuple[int, int, int], torch.Tensor] = OrderedDict()
+        self.stats: deque[tuple[int, int]] = deque(maxlen=HIT_RATE_WINDOW)
+
+    def hit_rate(self) -> float:
+        lookups = sum(total for _, total in self.stats)
+        return sum(hits for hits, _ in self.stats) / lookups if lookups else 0
+
+    def _hash(self, feats: torch.Tensor) -> list[tuple[int, int]]:
+        bits = feats.view(torch.int16 if feats.element_size() == 2 else torch.int32)
+        return [tuple(key) for key in (bits.long().unsqueeze(2) * self.coefficients).sum(dim=1).tolist()]
+
+    def search(self, feats: torch.Tensor, top_k: int, search: Callable[[torch.Tensor], torch.Tensor]) -> torch.Tensor:
+        keys = [(*key, top_k) for key in self._hash(feats)]
+        rows = [self.entries.get(key) for key in keys]
+        misses = [i for i, row in enumerate(rows) if row is None]
+        self.stats.append((len(keys) - len(misses), len(keys)))
+
+        if misses:
+            searched = search(feats[misses] if len(misses) < len(keys) else feats)
+            for i, row in zip(misses, searched.unbind(0)):
+                rows[i] = row
+                self.entries[keys[i]] = row
+
+        for key in keys:
+            self.entries.move_to_end(key)
+        while len(self.entries) > INDEX_RESULT_CACHE_SIZE:
+            self.entries.popitem(last=False)
+        return torch.stack(rows)
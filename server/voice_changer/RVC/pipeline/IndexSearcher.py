@@ -0,0 +1,141 @@
+import sys
+import faiss
+import faiss.contrib.torch_utils
+import numpy as np
+import torch
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Largest index searched exhaustively with a single matmul. Beyond that, the distance matrix gets too large.
+EXACT_SEARCH_MAX_SIZE = 1 << 16
+# FAISS is well optimized on CPU, so exact search only pays off for tiny flat indexes there.
+# IVF indexes probe a few lists and are faster with FAISS at any size (see test_search_latency_on_cpu).
+CPU_EXACT_SEARCH_MAX_SIZE = 1 << 12
+
+
+def is_faiss_gpu_available(device: torch.device) -> bool:
+    return sys.platform == 'linux' and '+cu' in torch.__version__ and device.type == 'cuda'
+
+
+class Int8Table:
+    """Index vectors quantized to int8 with a per-dimension scale. Rows are dequantized as they are gathered."""
+
+    def __init__(self, codes: torch.Tensor, scale: torch.Tensor):
+        self.codes = codes
+        self.scale = scale
+
+    def __getitem__(self, ix: torch.Tensor) -> torch.Tensor:
+        return self.codes[ix].float() * self.scale
+
+
+class IndexSearcher:
+    """Finds the top_k nearest index vectors (squared L2 distance) for each row of feats."""
+    name: str
+
+    def search(self, feats: torch.Tensor, top_k: int) -> tuple[torch.Tensor, torch.Tensor]:
+        """Returns distances and ids, both shaped [n, top_k] and located on the device of feats."""
+        ...
+
+
+class FaissSearcher(IndexSearcher):
+    name = 'faiss'
+
+    def __init__(self, index: faiss.Index, device: torch.device):
+        # HNSW has no GPU implementation.
+        self.on_device = is_faiss_gpu_available(device) and faiss.try_extract_index_ivf(index) is not None
+        if self.on_device:
+            options = faiss.GpuMultipleClonerOptions()
+            # Float32 lookup tables of IVF-PQ indexes with many sub-quantizers (e.g. 96 for 768 dims) exceed GPU shared memory.
+            options.useFloat16 = True
+            try:
+                index = faiss.index_cpu_to_gpus_list(index, co=options, gpus=[device.index or 0])
+                self.name = 'faiss-gpu'
+            except Exception as e:
+                logger.warning(f'Cannot move index to GPU, searching it on CPU: {e}')
+                self.on_device = False
+        self.index = index
+
+    def search(self, feats: torch.Tensor, top_k: int) -> tuple[torch.Tensor, torch.Tensor]:
+        score, ix = self.index.search(feats if self.on_device else feats.detach().cpu(), k=top_k)
+        return score.to(feats.device), ix.to(feats.device)
+
+
+class TorchExactSearcher(IndexSearcher):
+    name = 'torch-exact'
+
+    def __init__(self, vectors: torch.Tensor):
+        self.vectors = vectors
+        self.norms = torch.square(vectors).sum(dim=1)
+
+    def search(self, feats: torch.Tensor, top_k: int) -> tuple[torch.Tensor, torch.Tensor]:
+        # ||x - y||^2 = ||x||^2 - 2xy + ||y||^2
+        dist = torch.addmm(self.norms.unsqueeze(0), feats, self.vectors.T, alpha=-2)
+        dist += torch.square(feats).sum(dim=1, keepdim=True)
+        score, ix = torch.topk(dist, min(top_k, dist.shape[1]), dim=1, largest=False)
+        return score.clamp_(min=0), ix
+
+
+class TorchIVFSearcher(IndexSearcher):
+    """
+    Searches the inverted lists of a FAISS IVF index with torch ops on the device.
+    Uses the coarse quantizer and nprobe of the index, so results match the FAISS search.
+    """
+    name = 'torch-ivf'
+
+    def __init__(self, index: faiss.IndexIVF, vectors: torch.Tensor):
+        device = vectors.device
+        self.nprobe = index.nprobe
+        self.vectors = vectors
+        self.norms = torch.square(vectors).sum(dim=1)
+        self.centroids = TorchExactSearcher(index.quantizer.reconstruct_n(0, index.nlist).to(device))
+
+        invlists = index.invlists
+        sizes = [invlists.list_size(i) for i in range(index.nlist)]
+        list_ids = np.zeros((index.nlist, max(sizes)), dtype=np.int64)
+        valid = np.zeros(list_ids.shape, dtype=np.bool_)
+        for i, size in enumerate(sizes):
+            if size == 0:
+                continue
+            list_ids[i, :size] = faiss.rev_swig_ptr(invlists.get_ids(i), size)
+            valid[i, :size] = True
+        # Inverted lists are padded to the longest one. Padding points to vector 0 and is masked out.
+        self.list_ids = torch.as_tensor(list_ids, device=device)
+        self.valid = torch.as_tensor(valid, device=device)
+
+    def search(self, feats: torch.Tensor, top_k: int) -> tuple[torch.Tensor, torch.Tensor]:
+        n = feats.shape[0]
+        _, probe = self.centroids.search(feats, self.nprobe)
+        candidates = self.list_ids[probe].view(n, -1)
+        valid = self.valid[probe].view(n, -1)
+
+        dist = torch.bmm(self.vectors[candidates], feats.unsqueeze(2)).squeeze(2)
+        dist = self.norms[candidates] - 2 * dist + torch.square(feats).sum(dim=1, keepdim=True)
+        dist.masked_fill_(~valid, float('inf'))
+
+        score, pos = torch.topk(dist, min(top_k, dist.shape[1]), dim=1, largest=False)
+        return score.clamp_(min=0), torch.gather(candidates, 1, pos)
+
+
+def create_index_searcher(index: faiss.Index, index_reconstruct: torch.Tensor | Int8Table, device: torch.device, compressed: bool = False) -> IndexSearcher:
+    """
+    Picks a search backend by index size and device. Index vectors are already on the device, so torch search avoids host round trips.
+    Compressed indexes (IVF-PQ or HNSW built by compress_index) are always searched with FAISS in their compressed form,
+    whatever the precision of their vector table.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if compressed:
+        searcher = FaissSearcher(index, device)
+    elif device.type == 'cpu':
+        if ivf is None and index.ntotal <= CPU_EXACT_SEARCH_MAX_SIZE:
+            searcher = TorchExactSearcher(index_reconstruct)
+        else:
+            searcher = FaissSearcher(index, device)
+    elif index.ntotal <= EXACT_SEARCH_MAX_SIZE:
+        searcher = TorchExactSearcher(index_reconstruct)
+    elif not is_faiss_gpu_available(device) and ivf is not None:
+        searcher = TorchIVFSearcher(ivf, index_reconstruct)
+    else:
+        searcher = FaissSearcher(index, device)
+    logger.info(f'Index search backend: {searcher.name} ({index.ntotal} vectors)')
+    return searcher
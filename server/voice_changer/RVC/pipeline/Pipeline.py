@@ -1,6 +1,3 @@
-from faiss import IndexIVFFlat
-import faiss.contrib.torch_utils
-
 from onnx import TensorProto
 from onnx.helper import (
     make_model, make_node, make_graph,
@@ -8,33 +5,78 @@ from onnx.helper import (
 )
 
 import numpy as np
-import sys
 import torch
+from typing import NamedTuple
 import torch.nn.functional as F
-import onnxruntime
-from torchaudio import transforms as tat
+from voice_changer.common.OnnxSession import StaticShapeSession
+from voice_changer.common.Resampler import get_resampler
+from voice_changer.common.CudaGraph import CudaGraphRunner
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
 import logging
 
 from voice_changer.RVC.consts import HUBERT_SAMPLE_RATE, WINDOW_SIZE
-from voice_changer.common.TorchUtils import circular_write
+from voice_changer.common.TorchUtils import RingBuffer
+from voice_changer.RVC.pipeline.FeatureCache import FeatureCache
+from voice_changer.RVC.pipeline.PitchCache import PitchCache
+from voice_changer.RVC.pipeline.IndexSearcher import IndexSearcher, Int8Table
+from voice_changer.RVC.pipeline.IndexResultCache import IndexResultCache
 from voice_changer.embedder.Embedder import Embedder
+from voice_changer.embedder.EmbedderManager import EmbedderManager
 from voice_changer.RVC.inferencer.Inferencer import Inferencer
 
 from voice_changer.pitch_extractor.PitchExtractor import PitchExtractor
+from voice_changer.pitch_extractor.PitchExtractorManager import PitchExtractorManager
 from voice_changer.utils.Timer import Timer2
 from const import F0_MEL_MIN, F0_MEL_MAX
 
 logger = logging.getLogger(__name__)
 
+UPSCALE_SCALES = np.array([2], dtype=np.float32)
+
+
+class PipelineRequest(NamedTuple):
+    sid: int
+    audio: torch.Tensor
+    pitch: RingBuffer | None
+    pitchf: RingBuffer | None
+    f0_up_key: int
+    formant_shift: float
+    index_rate: float
+    audio_feats_len: int
+    silence_front: int
+    embOutputLayer: int
+    useFinalProj: bool
+    skip_head: int
+    return_length: int
+    protect: float = 0.5
+    feats_cache: FeatureCache | None = None
+    pitch_cache: PitchCache | None = None
+    index_top_k: int = 8
+    index_cache: bool = False
+
+    def geometry(self) -> tuple:
+        """Requests with equal geometry produce equally shaped tensors at every stage and can be batched."""
+        return (
+            self.audio.shape[0],
+            self.audio_feats_len,
+            self.silence_front,
+            self.embOutputLayer,
+            self.useFinalProj,
+            self.skip_head,
+            self.return_length,
+            self.formant_shift,
+            self.index_top_k,
+            self.index_cache,
+        )
+
 
 class Pipeline:
     embedder: Embedder
     inferencer: Inferencer
     pitchExtractor: PitchExtractor
 
-    index: IndexIVFFlat | None
-    index_reconstruct: torch.Tensor | None
+    index_searcher: IndexSearcher | None
+    index_reconstruct: torch.Tensor | Int8Table | None
     # feature: Any | None
 
     model_sr: int
@@ -46,8 +88,8 @@ class Pipeline:
         embedder: Embedder,
         inferencer: Inferencer,
         pitchExtractor: PitchExtractor,
-        index: IndexIVFFlat | None,
-        index_reconstruct: torch.Tensor | None,
+        index_searcher: IndexSearcher | None,
+        index_reconstruct: torch.Tensor | Int8Table | None,
         use_f0: bool,
         model_sr: int,
         embChannels: int,
@@ -63,10 +105,10 @@ class Pipeline:
         self.device = self.device_manager.device
         self.is_half = self.device_manager.use_fp16()
 
-        self.index = index
-        self.index_reconstruct: torch.Tensor | None = index_reconstruct
-        self.use_index = index is not None and self.index_reconstruct is not None
-        self.use_gpu_index = sys.platform == 'linux' and '+cu' in torch.__version__ and self.device.type == 'cuda'
+        self.index_searcher = index_searcher
+        self.index_reconstruct = index_reconstruct
+        self.use_index = index_searcher is not None and self.index_reconstruct is not None
+        self.index_result_cache = IndexResultCache(embChannels, self.device)
         self.use_f0 = use_f0
 
         self.onnx_upscaler = self.make_onnx_upscaler(embChannels) if self.device.type == 'privateuseone' else None
@@ -76,14 +118,29 @@ class Pipeline:
 
         self.dtype = torch.float16 if self.is_half else torch.float32
 
-        self.resamplers = {}
+        self.infer_graphs = CudaGraphRunner(self.inferencer.infer)
+        self.use_cuda_graph = False
+        self.released = False
+
+    def set_cuda_graph(self, enabled: bool):
+        """Replays inference from captured CUDA graphs. Only for torch inferencers on CUDA devices, others always run eagerly."""
+        self.infer_graphs.invalidate()
+        self.use_cuda_graph = enabled and self.device.type == 'cuda' and self.inferencer.supports_cuda_graph
+        if enabled and not self.use_cuda_graph:
+            logger.info('CUDA graphs are not supported with the current device or inferencer. Running eagerly.')
+
+    def _infer(self, feats, p_len, pitch, pitchf, sid, skip_head: int, return_length: int, formant_length: int) -> torch.Tensor:
+        if self.use_cuda_graph:
+            return self.infer_graphs((feats, p_len, pitch, pitchf, sid), skip_head, return_length, formant_length)
+        return self.inferencer.infer(feats, p_len, pitch, pitchf, sid, skip_head, return_length, formant_length)
+
 
     def make_onnx_upscaler(self, dim_size: int):
         # Inputs
-        input = make_tensor_value_info('in', TensorProto.FLOAT16 if self.is_half else TensorProto.FLOAT, [1, dim_size, None])
+        input = make_tensor_value_info('in', TensorProto.FLOAT16 if self.is_half else TensorProto.FLOAT, [None, dim_size, None])
         scales = make_tensor_value_info('scales', TensorProto.FLOAT, [None])
         # Outputs
-        output = make_tensor_value_info('out', TensorProto.FLOAT16 if self.is_half else TensorProto.FLOAT, [1, dim_size, None])
+        output = make_tensor_value_info('out', TensorProto.FLOAT16 if self.is_half else TensorProto.FLOAT, [None, dim_size, None])
 
         resize_node = make_node(
             "Resize",
@@ -101,23 +158,67 @@ class Pipeline:
             providers,
             provider_options,
         ) = self.device_manager.get_onnx_execution_provider()
-        return onnxruntime.InferenceSession(onnx_model.SerializeToString(), providers=providers, provider_options=provider_options)
+        return StaticShapeSession(onnx_model, providers, provider_options)
+
+    def onnx_sessions(self) -> list[StaticShapeSession]:
+        candidates = (
+            getattr(self.embedder, 'onnx_session', None),
+            getattr(self.pitchExtractor, 'onnx_session', None),
+            self.inferencer.model,
+            self.onnx_upscaler,
+        )
+        return [session for session in candidates if isinstance(session, StaticShapeSession)]
 
     def getPipelineInfo(self):
         inferencerInfo = self.inferencer.getInferencerInfo() if self.inferencer else {}
         embedderInfo = self.embedder.get_embedder_info()
         pitchExtractorInfo = self.pitchExtractor.getPitchExtractorInfo()
-        return {"inferencer": inferencerInfo, "embedder": embedderInfo, "pitchExtractor": pitchExtractorInfo}
+        indexSearcher = self.index_searcher.name if self.index_searcher is not None else None
+        return {"inferencer": inferencerInfo, "embedder": embedderInfo, "pitchExtractor": pitchExtractorInfo, "indexSearcher": indexSearcher}
 
     def setPitchExtractor(self, pitchExtractor: PitchExtractor):
+        # Pipelines own one reference to their embedder and pitch extractor (see ModelRegistry).
+        PitchExtractorManager.releasePitchExtractor(self.pitchExtractor)
         self.pitchExtractor = pitchExtractor
 
-    def extract_pitch(self, audio: torch.Tensor, pitch: torch.Tensor | None, pitchf: torch.Tensor | None, f0_up_key: int, formant_shift: float) -> tuple[torch.Tensor, torch.Tensor]:
-        f0 = self.pitchExtractor.extract(
-            audio,
-            HUBERT_SAMPLE_RATE,
-            WINDOW_SIZE,
-        )
+    def release(self):
+        """Drops the references to shared models. The pipeline keeps working until it is garbage collected."""
+        if self.released:
+            return
+        self.released = True
+        EmbedderManager.release_embedder(self.embedder)
+        PitchExtractorManager.releasePitchExtractor(self.pitchExtractor)
+
+    def extract_pitch(
+        self,
+        audio: torch.Tensor,
+        pitch: RingBuffer | None,
+        pitchf: RingBuffer | None,
+        f0_up_key: int,
+        formant_shift: float,
+        pitch_cache: PitchCache | None = None,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        context_frames = self.pitchExtractor.context_frames
+        streaming = pitch_cache is not None and pitch is not None and pitchf is not None and context_frames is not None
+        if streaming and pitch_cache.primed:
+            frames = pitch_cache.take_frames()
+            if frames == 0:
+                return pitch.as_linear().unsqueeze(0), pitchf.as_linear().unsqueeze(0)
+            # Pitch history is kept in the ring buffers. Extract only new frames, with enough preceding audio for context.
+            tail = (frames + context_frames) * WINDOW_SIZE
+            f0 = self.pitchExtractor.extract(
+                audio[-tail:],
+                HUBERT_SAMPLE_RATE,
+                WINDOW_SIZE,
+            )[-frames:]
+        else:
+            f0 = self.pitchExtractor.extract(
+                audio,
+                HUBERT_SAMPLE_RATE,
+                WINDOW_SIZE,
+            )
+            if streaming:
+                pitch_cache.prime()
         f0 *= 2 ** ((f0_up_key - formant_shift) / 12)
 
         f0_mel = 1127.0 * torch.log(1.0 + f0 / 700.0)
@@ -130,41 +231,58 @@ class Pipeline:
         f0_coarse = torch.round(f0_mel, out=f0_mel).long()
 
         if pitch is not None and pitchf is not None:
-            circular_write(f0_coarse, pitch)
-            circular_write(f0, pitchf)
+            pitch = pitch.write(f0_coarse)
+            pitchf = pitchf.write(f0)
         else:
             pitch = f0_coarse
-            pitchf = f0
+            # f0 can be the output buffer of an ONNX extractor, which the next request of a batch overwrites.
+            pitchf = f0.clone()
 
         return pitch.unsqueeze(0), pitchf.unsqueeze(0)
 
     def _search_index(self, audio: torch.Tensor, top_k: int = 1):
+        score, ix = self.index_searcher.search(audio, top_k)
+        # Compressed indexes return -1 ids when the probed lists hold fewer than top_k vectors.
+        # Those results get no weight, and rows without any result keep their own features.
+        found = ix >= 0
+        ix = ix.clamp(min=0)
         if top_k == 1:
-            _, ix = self.index.search(audio if self.use_gpu_index else audio.detach().cpu(), 1)
-            ix = ix.to(self.device)
-            return self.index_reconstruct[ix.squeeze()]
-
-        score, ix = self.index.search(audio if self.use_gpu_index else audio.detach().cpu(), k=top_k)
-        score, ix = (
-            score.to(self.device),
-            ix.to(self.device),
-        )
-        weight = torch.square(1 / score)
-        weight /= weight.sum(dim=1, keepdim=True)
-        return torch.sum(self.index_reconstruct[ix] * weight.unsqueeze(2), dim=1)
+            return torch.where(found, self.index_reconstruct[ix.squeeze(1)], audio)
+
+        weight = torch.where(found, torch.square(1 / score), 0)
+        total = weight.sum(dim=1, keepdim=True)
+        weight /= total
+        res = torch.sum(self.index_reconstruct[ix] * weight.unsqueeze(2), dim=1)
+        return torch.where(total > 0, res, audio)
+
+    def _upscale_protect(self, feats: torch.Tensor, feats_orig: torch.Tensor, pitchff: torch.Tensor, length: int) -> torch.Tensor:
+        """
+        Same as blending _upscale(feats) and _upscale(feats_orig) with pitchff ([batch, length]), without upsampling either.
+        Nearest 2x upsampling repeats every frame, so frame t is blended with weights 2t and 2t + 1 at the
+        input rate and the result is flattened to the doubled rate. The blend math is unchanged.
+        """
+        batch_size, frames, channels = feats.shape
+        pitchff = F.pad(pitchff, (0, frames * 2 - pitchff.shape[1])).view(batch_size, frames, 2, 1)
+        feats = feats.unsqueeze(2) * pitchff + feats_orig.unsqueeze(2) * (1 - pitchff)
+        return feats.view(batch_size, frames * 2, channels)[:, :length, :]
+
+    def _search_index_cached(self, audio: torch.Tensor, top_k: int, use_cache: bool) -> torch.Tensor:
+        if not use_cache:
+            return self._search_index(audio, top_k)
+        return self.index_result_cache.search(audio, top_k, lambda feats: self._search_index(feats, top_k))
 
     def _upscale(self, feats: torch.Tensor) -> torch.Tensor:
         if self.onnx_upscaler is not None:
-            feats = self.onnx_upscaler.run(['out'], { 'in': feats.permute(0, 2, 1).detach().cpu().numpy(), 'scales': np.array([2], dtype=np.float32) })
-            return torch.as_tensor(feats[0], dtype=self.dtype, device=self.device).permute(0, 2, 1).contiguous()
+            feats, = self.onnx_upscaler.run({ 'in': feats.permute(0, 2, 1) }, { 'scales': UPSCALE_SCALES })
+            return feats.to(dtype=self.dtype).permute(0, 2, 1).contiguous()
         return F.interpolate(feats.permute(0, 2, 1), scale_factor=2, mode='nearest').permute(0, 2, 1).contiguous()
 
     def exec(
         self,
         sid: int,
         audio: torch.Tensor,  # torch.tensor [n]
-        pitch: torch.Tensor | None,  # torch.tensor [m]
-        pitchf: torch.Tensor | None,  # torch.tensor [m]
+        pitch: RingBuffer | None,  # ring buffer [m]
+        pitchf: RingBuffer | None,  # ring buffer [m]
         f0_up_key: int,
         formant_shift: float,
         index_rate: float,
@@ -175,6 +293,10 @@ class Pipeline:
         skip_head: int,
         return_length: int,
         protect: float = 0.5,
+        feats_cache: FeatureCache | None = None,
+        pitch_cache: PitchCache | None = None,
+        index_top_k: int = 8,
+        index_cache: bool = False,
     ) -> torch.Tensor:
         with Timer2("Pipeline-Exec", False) as t:  # NOQA
             # 16000のサンプリングレートで入ってきている。以降この世界は16000で処理。
@@ -185,11 +307,14 @@ class Pipeline:
             t.record("pre-process")
 
             # ピッチ検出
-            pitch, pitchf = self.extract_pitch(audio[silence_front:], pitch, pitchf, f0_up_key, formant_shift) if self.use_f0 else (None, None)
+            pitch, pitchf = self.extract_pitch(audio[silence_front:], pitch, pitchf, f0_up_key, formant_shift, pitch_cache) if self.use_f0 else (None, None)
             t.record("extract-pitch")
 
             # embedding
-            feats = self.embedder.extract_features(audio.view(1, -1), embOutputLayer, useFinalProj)
+            if feats_cache is not None:
+                feats = feats_cache.extract(self.embedder, audio, embOutputLayer, useFinalProj)
+            else:
+                feats = self.embedder.extract_features(audio.view(1, -1), embOutputLayer, useFinalProj)
             feats = torch.cat((feats, feats[:, -1:, :]), 1)
             t.record("extract-feats")
 
@@ -202,49 +327,149 @@ class Pipeline:
             if is_active_index:
                 skip_offset = skip_head // 2
                 index_audio = feats[0][skip_offset :]
-
-                # TODO: kは調整できるようにする
-                index_audio = self._search_index(index_audio.float(), 8).unsqueeze(0)
+                index_audio = self._search_index_cached(index_audio.float(), index_top_k, index_cache).unsqueeze(0)
                 if self.is_half:
                     index_audio = index_audio.half()
 
                 # Recover silent front
                 feats[0][skip_offset :] = index_audio * index_rate + feats[0][skip_offset :] * (1 - index_rate)
 
-            feats = self._upscale(feats)[:, :audio_feats_len, :]
             if self.use_f0:
                 pitch = pitch[:, -audio_feats_len:]
                 pitchf = pitchf[:, -audio_feats_len:] * (formant_length / return_length)
+
+            if self.use_f0 and is_active_index and use_protect:
                 # pitchの推定が上手くいかない(pitchf=0)場合、検索前の特徴を混ぜる
                 # pitchffの作り方の疑問はあるが、本家通りなので、このまま使うことにする。
                 # https://github.com/w-okada/voice-changer/pull/276#issuecomment-1571336929
-                if is_active_index and use_protect:
-                    # FIXME: Another interpolate on feats is a big performance hit.
-                    feats_orig = self._upscale(feats_orig)[:, :audio_feats_len, :]
-                    pitchff = pitchf.detach().clone()
-                    pitchff[pitchf > 0] = 1
-                    pitchff[pitchf < 1] = protect
-                    pitchff = pitchff.unsqueeze(-1)
-                    feats = feats * pitchff + feats_orig * (1 - pitchff)
+                # 1 where pitch is detected, protect otherwise.
+                pitchff = torch.where(pitchf < 1, protect, torch.ones_like(pitchf))
+                feats = self._upscale_protect(feats, feats_orig, pitchff, audio_feats_len)
+            else:
+                feats = self._upscale(feats)[:, :audio_feats_len, :]
 
             p_len = torch.tensor([audio_feats_len], device=self.device, dtype=torch.int64)
 
             sid = torch.tensor([sid], device=self.device, dtype=torch.int64)
             t.record("mid-precess")
             # 推論実行
-            out_audio = self.inferencer.infer(feats, p_len, pitch, pitchf, sid, skip_head, return_length, formant_length).float()
+            out_audio = self._infer(feats, p_len, pitch, pitchf, sid, skip_head, return_length, formant_length).float()
             t.record("infer")
 
             # Formant shift sample rate adjustment
             scaled_window = int(np.floor(formant_factor * self.model_window))
             if scaled_window != self.model_window:
-                if scaled_window not in self.resamplers:
-                    self.resamplers[scaled_window] = tat.Resample(
-                        orig_freq=scaled_window,
-                        new_freq=self.model_window,
-                        dtype=torch.float32,
-                    ).to(self.device)
-                out_audio = self.resamplers[scaled_window](
+                resampler = get_resampler(scaled_window, self.model_window, torch.float32, self.device)
+                out_audio = resampler(
                     out_audio[: return_length * scaled_window]
                 )
         return out_audio
+
+    def exec_batch(self, requests: list[PipelineRequest]) -> list[torch.Tensor]:
+        """
+        Runs requests of equal geometry (see PipelineRequest.geometry) as one batch.
+        Stages that cannot take a batch fall back to running the requests one by one.
+        """
+        if len(requests) == 1:
+            return [self.exec(*requests[0])]
+
+        with Timer2("Pipeline-ExecBatch", False) as t:  # NOQA
+            head = requests[0]
+            assert all(request.geometry() == head.geometry() for request in requests), "Requests have different geometry."
+            batch_size = len(requests)
+            audio_feats_len = head.audio_feats_len
+            skip_head = head.skip_head
+            return_length = head.return_length
+
+            formant_factor = 2 ** (head.formant_shift / 12)
+            formant_length = int(np.ceil(return_length * formant_factor))
+            audio = torch.stack([request.audio for request in requests])
+            t.record("pre-process")
+
+            # ピッチ検出
+            if self.use_f0:
+                pitches = [
+                    self.extract_pitch(request.audio[request.silence_front:], request.pitch, request.pitchf, request.f0_up_key, request.formant_shift, request.pitch_cache)
+                    for request in requests
+                ]
+                pitch = torch.cat([p for p, _ in pitches])
+                pitchf = torch.cat([pf for _, pf in pitches])
+            else:
+                pitch, pitchf = None, None
+            t.record("extract-pitch")
+
+            # embedding
+            if self.embedder.supports_batch:
+                feats = self.embedder.extract_features(audio, head.embOutputLayer, head.useFinalProj)
+            else:
+                feats = torch.cat([
+                    self.embedder.extract_features(row.view(1, -1), head.embOutputLayer, head.useFinalProj)
+                    for row in audio
+                ])
+            # Full extraction is batched. Seed the caches so the next single request can be incremental.
+            for i, request in enumerate(requests):
+                if request.feats_cache is not None:
+                    request.feats_cache.store(feats[i : i + 1].clone(), FeatureCache.make_key(audio, head.embOutputLayer, head.useFinalProj))
+            feats = torch.cat((feats, feats[:, -1:, :]), 1)
+            t.record("extract-feats")
+
+            # Index - feature抽出. Rows with active index are searched in a single call.
+            indexed = [i for i, request in enumerate(requests) if self.use_index and request.index_rate > 0]
+            protected = [i for i in indexed if requests[i].protect < 0.5] if self.use_f0 else []
+            if protected:
+                feats_orig = feats[protected]
+
+            if indexed:
+                skip_offset = skip_head // 2
+                index_feats = feats[indexed, skip_offset:]
+                index_audio = self._search_index_cached(index_feats.reshape(-1, index_feats.shape[-1]).float(), head.index_top_k, head.index_cache).view(index_feats.shape)
+                if self.is_half:
+                    index_audio = index_audio.half()
+                index_rate = torch.tensor([requests[i].index_rate for i in indexed], dtype=feats.dtype, device=self.device).view(-1, 1, 1)
+                feats[indexed, skip_offset:] = index_audio * index_rate + index_feats * (1 - index_rate)
+
+            if self.use_f0:
+                pitch = pitch[:, -audio_feats_len:]
+                pitchf = pitchf[:, -audio_feats_len:] * (formant_length / return_length)
+                if protected:
+                    protect = torch.tensor([requests[i].protect for i in protected], dtype=pitchf.dtype, device=self.device).view(-1, 1)
+                    protected_pitchf = pitchf[protected]
+                    # Same as the single request path: 1 where pitch is detected, protect otherwise.
+                    pitchff = torch.where(protected_pitchf < 1, protect, torch.ones_like(protected_pitchf))
+                    protected_feats = self._upscale_protect(feats[protected], feats_orig, pitchff, audio_feats_len)
+
+            feats = self._upscale(feats)[:, :audio_feats_len, :]
+            if protected:
+                feats[protected] = protected_feats
+
+            p_len = torch.full((batch_size,), audio_feats_len, device=self.device, dtype=torch.int64)
+
+            sid = torch.tensor([request.sid for request in requests], device=self.device, dtype=torch.int64)
+            t.record("mid-precess")
+            # 推論実行
+            if self.inferencer.supports_batch:
+                out_audio = self._infer(feats, p_len, pitch, pitchf, sid, skip_head, return_length, formant_length).float()
+            else:
+                out_audio = torch.stack([
+                    self.inferencer.infer(
+                        feats[i : i + 1],
+                        p_len[i : i + 1],
+                        pitch[i : i + 1] if pitch is not None else None,
+                        pitchf[i : i + 1] if pitchf is not None else None,
+                        sid[i : i + 1],
+                        skip_head,
+                        return_length,
+                        formant_length,
+                    ).float()
+                    for i in range(batch_size)
+                ])
+            t.record("infer")
+
+            # Formant shift sample rate adjustment
+            scaled_window = int(np.floor(formant_factor * self.model_window))
+            if scaled_window != self.model_window:
+                resampler = get_resampler(scaled_window, self.model_window, torch.float32, self.device)
+                out_audio = resampler(
+                    out_audio[:, : return_length * scaled_window]
+                )
+        return list(out_audio.unbind(0))
@@ -1,28 +1,55 @@
 import os
-import sys
-import faiss
-import faiss.contrib.torch_utils
 import torch
 from data.ModelSlot import RVCModelSlot
 
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
+from voice_changer.common.IndexLoader import load_compressed_index, load_index
 from voice_changer.embedder.EmbedderManager import EmbedderManager
+from voice_changer.RVC.inferencer.Inferencer import Inferencer
 from voice_changer.RVC.inferencer.InferencerManager import InferencerManager
 from voice_changer.RVC.pipeline.Pipeline import Pipeline
+from voice_changer.RVC.pipeline.IndexSearcher import IndexSearcher, Int8Table, create_index_searcher
 from voice_changer.pitch_extractor.PitchExtractorManager import PitchExtractorManager
 from settings import get_settings
 
 import logging
 logger = logging.getLogger(__name__)
 
-def createPipeline(modelSlot: RVCModelSlot, f0Detector: str, useONNX: bool, force_reload: bool):
-    model_dir = get_settings().model_dir
+def _slotFiles(modelSlot: RVCModelSlot, useONNX: bool) -> tuple[str, str, str | None]:
+    slot_dir = os.path.join(get_settings().model_dir, str(modelSlot.slotIndex))
+    modelPath = os.path.join(slot_dir, os.path.basename(modelSlot.modelFileOnnx if useONNX else modelSlot.modelFile))
+    if modelSlot.indexFileCompressed and modelSlot.indexTableFile:
+        indexPath = os.path.join(slot_dir, os.path.basename(modelSlot.indexFileCompressed))
+        tablePath = os.path.join(slot_dir, os.path.basename(modelSlot.indexTableFile))
+    else:
+        indexPath = os.path.join(slot_dir, os.path.basename(modelSlot.indexFile))
+        tablePath = None
+    return modelPath, indexPath, tablePath
+
+
+def pipelineKey(modelSlot: RVCModelSlot, useONNX: bool) -> tuple:
+    """
+    Identifies what a pipeline was built from: slot files (with modification times, so re-uploaded slots
+    do not match), device and precision. Pipelines with equal keys are interchangeable.
+    """
+    device_manager = DeviceManager.get_instance()
+    files = tuple(
+        (path, os.stat(path).st_mtime_ns if os.path.isfile(path) else None)
+        for path in _slotFiles(modelSlot, useONNX) if path is not None
+    )
+    return (modelSlot.slotIndex, useONNX, files, str(device_manager.device), device_manager.use_fp16(), device_manager.get_compile_mode())
+
+
+def createPipeline(modelSlot: RVCModelSlot, f0Detector: str, useONNX: bool, force_reload: bool, template: Inferencer | None = None):
+    """template is the inferencer of the previous pipeline. If it was loaded from the same file, it is re-targeted to the current device settings instead of reading the file again."""
+    modelPath, indexPath, tablePath = _slotFiles(modelSlot, useONNX)
     # Inferencer 生成
-    if useONNX:
-        modelPath = os.path.join(model_dir, str(modelSlot.slotIndex), os.path.basename(modelSlot.modelFileOnnx))
+    inferencer = template.retarget() if template is not None and template.file == modelPath and not force_reload else None
+    if inferencer is not None:
+        logger.info('Re-targeted inferencer to the current device settings.')
+    elif useONNX:
         inferencer = InferencerManager.getInferencer(modelSlot.modelTypeOnnx, modelPath)
     else:
-        modelPath = os.path.join(model_dir, str(modelSlot.slotIndex), os.path.basename(modelSlot.modelFile))
         inferencer = InferencerManager.getInferencer(modelSlot.modelType, modelPath)
 
     # Embedder 生成
@@ -32,14 +59,16 @@ def createPipeline(modelSlot: RVCModelSlot, f0Detector: str, useONNX: bool, forc
     pitchExtractor = PitchExtractorManager.getPitchExtractor(f0Detector, force_reload)
 
     # index, feature
-    indexPath = os.path.join(model_dir, str(modelSlot.slotIndex), os.path.basename(modelSlot.indexFile))
-    index, index_reconstruct = _loadIndex(indexPath)
+    if tablePath is not None:
+        index_searcher, index_reconstruct = _loadCompressedIndex(indexPath, tablePath)
+    else:
+        index_searcher, index_reconstruct = _loadIndex(indexPath)
 
     pipeline = Pipeline(
         embedder,
         inferencer,
         pitchExtractor,
-        index,
+        index_searcher,
         index_reconstruct,
         modelSlot.f0,
         modelSlot.samplingRate,
@@ -49,7 +78,7 @@ def createPipeline(modelSlot: RVCModelSlot, f0Detector: str, useONNX: bool, forc
     return pipeline
 
 
-def _loadIndex(indexPath: str) -> tuple[faiss.Index | None, torch.Tensor | None]:
+def _loadIndex(indexPath: str) -> tuple[IndexSearcher | None, torch.Tensor | None]:
     dev = DeviceManager.get_instance().device
     # Indexのロード
     logger.info("Loading index...")
@@ -60,21 +89,36 @@ def _loadIndex(indexPath: str) -> tuple[faiss.Index | None, torch.Tensor | None]
 
     logger.info(f"Try loading \"{indexPath}\"...")
     try:
-        index: faiss.IndexIVFFlat = faiss.read_index(indexPath)
+        index, vectors = load_index(indexPath)
         if not index.is_trained:
             logger.error("Invalid index. You MUST use added_xxxx.index, not trained_xxxx.index. Index will not be used.")
             return (None, None)
         if index.ntotal == 0:
             logger.error("Index is empty. Index will not be used.")
             return (None, None)
-        # BUG: faiss-gpu does not support reconstruct on GPU indices
-        # https://github.com/facebookresearch/faiss/issues/2181
-        index_reconstruct = index.reconstruct_n(0, index.ntotal).to(dev)
-        if sys.platform == 'linux' and '+cu' in torch.__version__ and dev.type == 'cuda':
-            index: faiss.GpuIndexIVFFlat = faiss.index_cpu_to_gpus_list(index, gpus=[dev.index])
+        index_reconstruct = torch.from_numpy(vectors).to(dev)
+        index_searcher = create_index_searcher(index, index_reconstruct, dev)
     except Exception as e: # NOQA
         logger.error("Load index failed. Index will not be used.")
         logger.exception(e)
         return (None, None)
 
-    return index, index_reconstruct
+    return index_searcher, index_reconstruct
+
+
+def _loadCompressedIndex(indexPath: str, tablePath: str) -> tuple[IndexSearcher | None, torch.Tensor | Int8Table | None]:
+    dev = DeviceManager.get_instance().device
+    logger.info(f"Try loading compressed index \"{indexPath}\"...")
+    try:
+        index, table = load_compressed_index(indexPath, tablePath)
+        if "scale" in table:
+            index_reconstruct = Int8Table(table["table"].to(dev), table["scale"].to(dev))
+        else:
+            index_reconstruct = table["table"].to(dev)
+        index_searcher = create_index_searcher(index, index_reconstruct, dev, compressed=True)
+    except Exception as e: # NOQA
+        logger.error("Load compressed index failed. Index will not be used.")
+        logger.exception(e)
+        return (None, None)
+
+    return index_searcher, index_reconstruct
@@ -0,0 +1,137 @@
+import os
+import threading
+import torch
+from collections import OrderedDict
+from typing import Callable
+
+from voice_changer.RVC.pipeline.Pipeline import Pipeline
+from voice_changer.RVC.pipeline.IndexSearcher import Int8Table
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def estimate_memory(pipeline: Pipeline) -> int:
+    """Bytes held by the slot specific parts of a pipeline: inferencer weights and index vectors. Embedder and pitch extractor are shared."""
+    model = pipeline.inferencer.model
+    if isinstance(model, torch.nn.Module):
+        size = sum(tensor.numel() * tensor.element_size() for tensor in (*model.parameters(), *model.buffers()))
+    else:
+        # ONNX sessions keep roughly one copy of the model file.
+        size = os.path.getsize(pipeline.inferencer.file)
+
+    vectors = pipeline.index_reconstruct
+    if isinstance(vectors, Int8Table):
+        vectors = (vectors.codes, vectors.scale)
+    elif vectors is not None:
+        vectors = (vectors,)
+    return size + sum(tensor.numel() * tensor.element_size() for tensor in vectors or ())
+
+
+class PoolEntry:
+    def __init__(self, pipeline: Pipeline, size: int):
+        self.pipeline = pipeline
+        self.size = size
+        # Number of models using the pipeline (the active one and one loading in the background).
+        self.pins = 0
+
+
+class PipelinePool:
+    """
+    Initialized pipelines of recently used slots, so switching back to a slot skips loading entirely.
+
+    acquire pins a pipeline until the model using it releases it on deactivation. Pinned pipelines are never
+    evicted. Unpinned ones are kept in LRU order until the estimated memory exceeds the budget, so a budget
+    of 0 keeps only the pipelines in use.
+
+    The pool is used from the device worker and the slot loader thread. Pipelines are created outside the lock,
+    so a slot loading in the background never blocks the worker.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.budget = 0
+        self.entries: OrderedDict[tuple, PoolEntry] = OrderedDict()
+        # Pinned entries dropped by clear. They are released once unpinned.
+        self.retired: list[PoolEntry] = []
+        self.lock = threading.RLock()
+
+    def set_budget(self, budget: int):
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+    def acquire(self, key: tuple, create: Callable[[], Pipeline]) -> Pipeline:
+        """Returns the pipeline for key, creating it if it is not pooled, and pins it until release."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                logger.info(f'Reusing pooled pipeline of slot {key[0]}.')
+                return self._pin(key, entry)
+
+        pipeline = create()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                # Created concurrently by another thread.
+                pipeline.release()
+            else:
+                entry = PoolEntry(pipeline, estimate_memory(pipeline))
+                self.entries[key] = entry
+            return self._pin(key, entry)
+
+    def _pin(self, key: tuple, entry: PoolEntry) -> Pipeline:
+        self.entries.move_to_end(key)
+        entry.pins += 1
+        self._evict()
+        return entry.pipeline
+
+    def release(self, pipeline: Pipeline):
+        """Unpins a pipeline that is no longer active. It stays pooled while it fits the budget."""
+        with self.lock:
+            for entry in (*self.entries.values(), *self.retired):
+                if entry.pipeline is pipeline:
+                    entry.pins = max(entry.pins - 1, 0)
+                    break
+            for entry in [entry for entry in self.retired if entry.pins == 0]:
+                self.retired.remove(entry)
+                entry.pipeline.release()
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.pins > 0:
+                    self.retired.append(entry)
+                else:
+                    entry.pipeline.release()
+            self.entries.clear()
+
+    def memory(self) -> int:
+        with self.lock:
+            return sum(entry.size for entry in self.entries.values())
+
+    def get_info(self) -> dict:
+        with self.lock:
+            return {
+                "slots": [key[0] for key in self.entries],
+                "pinned": [key[0] for key, entry in self.entries.items() if entry.pins > 0],
+                "memory": self.memory(),
+                "budget": self.budget,
+            }
+
+    def _evict(self):
+        for key in list(self.entries):
+            if self.memory() <= self.budget:
+                break
+            entry = self.entries[key]
+            if entry.pins == 0:
+                del self.entries[key]
+                entry.pipeline.release()
+                logger.info(f'Evicted pooled pipeline of slot {key[0]}.')
@@ -0,0 +1,144 @@
+import threading
+import torch
+from concurrent.futures import Future
+from queue import Queue, Empty
+from time import perf_counter
+from typing import Any, Callable
+
+from voice_changer.common.deviceManager.DeviceManager import DeviceManager
+from voice_changer.RVC.pipeline.Pipeline import Pipeline, PipelineRequest
+
+import logging
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 32
+
+
+class PipelineJob:
+    def __init__(self, pipeline: Pipeline, request: PipelineRequest):
+        self.pipeline = pipeline
+        self.request = request
+        self.enqueued_at = perf_counter()
+        self.future: Future[tuple[torch.Tensor, float]] = Future()
+
+
+class CallJob:
+    def __init__(self, fn: Callable[..., Any], args: tuple):
+        self.fn = fn
+        self.args = args
+        self.future: Future[Any] = Future()
+
+
+class PipelineScheduler:
+    """
+    Per-device inference worker.
+
+    A single thread per device owns all pipeline execution for that device. Pipeline requests
+    from concurrent sessions are queued and run as micro-batches: the first request in the queue
+    opens a batch window of max_wait seconds, and requests arriving within the window
+    (up to max_batch_size) are grouped by pipeline and geometry and executed with Pipeline.exec_batch.
+    Other work submitted to the worker (e.g. settings updates) runs in queue order with inference.
+    The queue is bounded, so producers block when the device cannot keep up.
+    """
+    _instances: dict[str, "PipelineScheduler"] = {}
+    # Workers are created from executor, slot loader and REST threads. Guards against two workers per device.
+    _instances_lock = threading.Lock()
+
+    max_batch_size: int = 1
+    max_wait: float = 0.003
+
+    @classmethod
+    def get_instance(cls, device: torch.device | None = None):
+        if device is None:
+            device = DeviceManager.get_instance().device
+        key = str(device)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(key)
+            return cls._instances[key]
+
+    @classmethod
+    def set_policy(cls, max_batch_size: int, max_wait: float):
+        cls.max_batch_size = max_batch_size
+        cls.max_wait = max_wait
+        logger.info(f'Pipeline batching policy: max batch size {max_batch_size}, max wait {max_wait * 1000:.1f}ms')
+
+    def __init__(self, name: str):
+        self.queue: Queue[PipelineJob | CallJob] = Queue(maxsize=QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, name=f'PipelineScheduler-{name}', daemon=True)
+        self.thread.start()
+
+    def in_worker(self) -> bool:
+        return threading.current_thread() is self.thread
+
+    def submit(self, fn: Callable[..., Any], *args) -> Future:
+        """Runs fn on the worker thread in order with queued inference."""
+        if self.in_worker():
+            # Nested submission from the worker itself, e.g. settings that update other settings.
+            future = Future()
+            with torch.no_grad():
+                future.set_result(fn(*args))
+            return future
+        job = CallJob(fn, args)
+        self.queue.put(job)
+        return job.future
+
+    def exec(self, pipeline: Pipeline, request: PipelineRequest) -> tuple[torch.Tensor, float]:
+        """Returns the converted audio and the time in seconds the request spent waiting in the queue."""
+        if self.in_worker():
+            # E.g. warm-up runs from realloc. no_grad rather than inference_mode, since buffers
+            # allocated on the worker are written in place by executor threads.
+            with torch.no_grad():
+                return pipeline.exec(*request), 0.0
+        job = PipelineJob(pipeline, request)
+        self.queue.put(job)
+        return job.future.result()
+
+    def _run(self):
+        pending: PipelineJob | CallJob | None = None
+        while True:
+            job = pending if pending is not None else self.queue.get()
+            pending = None
+            if isinstance(job, CallJob):
+                self._call(job)
+                continue
+
+            jobs = [job]
+            deadline = job.enqueued_at + self.max_wait
+            while len(jobs) < self.max_batch_size:
+                timeout = deadline - perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    next_job = self.queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if isinstance(next_job, CallJob):
+                    # Keep ordering: run the batch collected so far before the call.
+                    pending = next_job
+                    break
+                jobs.append(next_job)
+            self._dispatch(jobs)
+
+    @torch.no_grad()
+    def _call(self, job: CallJob):
+        try:
+            job.future.set_result(job.fn(*job.args))
+        except Exception as e:
+            job.future.set_exception(e)
+
+    @torch.no_grad()
+    def _dispatch(self, jobs: list[PipelineJob]):
+        groups: dict[tuple, list[PipelineJob]] = {}
+        for job in jobs:
+            groups.setdefault((id(job.pipeline), job.request.geometry()), []).append(job)
+
+        for group in groups.values():
+            started = perf_counter()
+            try:
+                results = group[0].pipeline.exec_batch([job.request for job in group])
+                for job, result in zip(group, results):
+                    job.future.set_result((result, started - job.enqueued_at))
+            except Exception as e:
+                for job in group:
+                    job.future.set_exception(e)
@@ -0,0 +1,37 @@
+from voice_changer.RVC.consts import WINDOW_SIZE
+
+
+class PitchCache:
+    """
+    Per-stream state for incremental pitch extraction.
+
+    The pitch ring buffers already hold f0 for the previous window, so only frames for the audio written
+    since then have to be extracted. Writes that are not a multiple of the pitch hop advance the history
+    by the nearest whole frame and carry the remainder over to later writes.
+    """
+
+    def __init__(self):
+        self.primed = False
+        # Samples written to the convert buffer since the last extraction.
+        self.shift = 0
+        self.residual = 0
+
+    def advance(self, samples: int):
+        self.shift += samples
+
+    def clear(self):
+        self.primed = False
+        self.shift = 0
+        self.residual = 0
+
+    def prime(self):
+        self.primed = True
+        self.shift = 0
+        self.residual = 0
+
+    def take_frames(self) -> int:
+        shift = self.shift + self.residual
+        frames = round(shift / WINDOW_SIZE)
+        self.residual = shift - frames * WINDOW_SIZE
+        self.shift = 0
+        return frames
@@ -1,7 +1,9 @@
+import asyncio
 import json
 import os
 import sys
 import shutil
+import threading
 import numpy as np
 from downloader.SampleDownloader import downloadSample, getSampleInfos
 import logging
@@ -9,7 +11,7 @@ from voice_changer.Local.ServerAudio import ServerAudio, ServerAudioCallbacks
 from voice_changer.ModelSlotManager import ModelSlotManager
 from voice_changer.RVC.RVCModelMerger import RVCModelMerger
 from const import STORED_SETTING_FILE, UPLOAD_DIR
-from voice_changer.VoiceChangerSettings import VoiceChangerSettings
+from voice_changer.VoiceChangerSettings import SessionSettings, VoiceChangerSettings
 from voice_changer.VoiceChangerV2 import VoiceChangerV2
 from voice_changer.utils.LoadModelParams import LoadModelParamFile, LoadModelParams
 from voice_changer.utils.ModelMerger import MergeElement, ModelMergerRequest
@@ -21,13 +23,31 @@ from Exceptions import (
     VoiceChangerIsNotSelectedException,
 )
 from traceback import format_exc
-from typing import Callable, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any, Literal
 
+from data.ModelSlot import RVCModelSlot
 from voice_changer.RVC.RVCr2 import RVCr2
+from voice_changer.RVC.pipeline.PipelineScheduler import PipelineScheduler
 from voice_changer.RVC.RVCModelSlotGenerator import RVCModelSlotGenerator  # 起動時にインポートするとパラメータが取れない。
 
 logger = logging.getLogger(__name__)
 
+# Slot switches load a new model in the background. 'warming' runs one conversion before the model is swapped in.
+SlotState = Literal['loading', 'warming', 'active']
+# Settings that rebuild the pipeline. A slot loaded before they changed is stale.
+PIPELINE_KEYS = {'gpu', 'forceFp32', 'disableJit', 'compileMode', 'useONNX'}
+# Closed session ids remembered to drop their late chunks.
+CLOSED_SESSIONS_KEPT = 1024
+
+
+class SessionQueue:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Chunks of the session that are being converted or waiting for conversion.
+        self.pending = 0
+
 
 class VoiceChangerManager(ServerAudioCallbacks):
     _instance = None
@@ -61,9 +81,24 @@ class VoiceChangerManager(ServerAudioCallbacks):
 
         self.device_manager = DeviceManager.get_instance()
         self.devices = self.device_manager.list_devices()
-        self.device_manager.initialize(self.settings.gpu, self.settings.forceFp32, self.settings.disableJit)
+        self.device_manager.initialize(self.settings.gpu, self.settings.forceFp32, self.settings.disableJit, self.settings.compileMode)
+
+        PipelineScheduler.set_policy(self.settings.batchMaxSize, self.settings.batchMaxWait)
 
         self.vc = VoiceChangerV2(self.settings)
+        # Per-client voice changers keyed by Socket.IO sid or REST client id.
+        # They share the pipeline loaded by self.vc and only own streaming state.
+        self.sessions: dict[str, VoiceChangerV2] = {}
+        # Sessions are created by executor threads and iterated by REST threads and the device worker.
+        self.sessions_lock = threading.Lock()
+        self.closed_sessions: OrderedDict[str, None] = OrderedDict()
+        self.session_queues: dict[str | None, SessionQueue] = {}
+        self.executor = ThreadPoolExecutor(max_workers=self.settings.conversionThreads, thread_name_prefix='VoiceConversion')
+        # The current model keeps converting while a new slot loads.
+        self.slot_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='SlotLoader')
+        self.slot_state: SlotState = 'active'
+        # Incremented on every slot switch. Loads of superseded switches are discarded.
+        self.slot_generation = 0
         self.server_audio = ServerAudio(self, self.settings)
 
         logger.info("Initialized.")
@@ -129,6 +164,7 @@ class VoiceChangerManager(ServerAudioCallbacks):
         data["voiceChangerParams"] = self.params
 
         data["status"] = "OK"
+        data["slotState"] = self.slot_state
 
         info = self.server_audio.get_info()
         data.update(info)
@@ -136,8 +172,54 @@ class VoiceChangerManager(ServerAudioCallbacks):
         info = self.vc.get_info()
         data.update(info)
 
+        with self.sessions_lock:
+            sessions = list(self.sessions.items())
+        data["sessions"] = [
+            {"id": session_id, **session.get_session_info()}
+            for session_id, session in sessions
+        ]
+
         return data
 
+    def get_session(self, session_id: str | None) -> VoiceChangerV2 | None:
+        """Returns the session, creating it on first use. Returns None for closed sessions."""
+        if session_id is None:
+            return self.vc
+        with self.sessions_lock:
+            if session_id in self.closed_sessions:
+                return None
+            session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+
+        # Initialization waits for the device worker, so it runs outside the lock.
+        logger.info(f"Creating session {session_id}")
+        session = VoiceChangerV2(SessionSettings(self.settings), record_io=False, shared_io_recorder=self.vc.io_recorder)
+        self._initialize_session(session)
+        with self.sessions_lock:
+            if session_id in self.closed_sessions:
+                return None
+            return self.sessions.setdefault(session_id, session)
+
+    def close_session(self, session_id: str):
+        self.session_queues.pop(session_id, None)
+        with self.sessions_lock:
+            self.closed_sessions[session_id] = None
+            while len(self.closed_sessions) > CLOSED_SESSIONS_KEPT:
+                self.closed_sessions.popitem(last=False)
+            closed = self.sessions.pop(session_id, None)
+        if closed is not None:
+            logger.info(f"Closed session {session_id}")
+
+    def session_list(self) -> list[VoiceChangerV2]:
+        with self.sessions_lock:
+            return list(self.sessions.values())
+
+    def _initialize_session(self, session: VoiceChangerV2):
+        if self.vc.vcmodel is None:
+            return
+        session.initialize(self.vc.vcmodel.create_session(session.settings))
+
     def initialize(self, val: int):
         slotInfo = self.modelSlotManager.get_slot_info(val)
         if slotInfo is None or slotInfo.voiceChangerType is None:
@@ -158,8 +240,95 @@ class VoiceChangerManager(ServerAudioCallbacks):
             self.vc.initialize(RVCr2(slotInfo, self.settings))
         else:
             logger.error(f"Unknown voice changer model: {slotInfo.voiceChangerType}")
+            return
+
+        for session in self.session_list():
+            self._initialize_session(session)
+
+    def switch_slot(self, val: int):
+        slotInfo = self.modelSlotManager.get_slot_info(val)
+        if slotInfo is None or slotInfo.voiceChangerType != "RVC":
+            logger.warning(f"Model slot is not found {val}")
+            return
+        self.slot_generation += 1
+        self.slot_state = 'loading'
+        self.slot_loader.submit(self._load_slot, slotInfo, self.slot_generation)
+
+    def _load_slot(self, slotInfo: RVCModelSlot, generation: int):
+        vcmodel: RVCr2 | None = None
+        try:
+            logger.info(f"Loading model slot {slotInfo.slotIndex} in the background...")
+            frames = self.vc.frames()
+            vcmodel = RVCr2(slotInfo, self.settings)
+            vcmodel.realloc(*frames)
+            vcmodel.initialize()
+            if vcmodel.pipeline is None:
+                raise PipelineNotInitializedException()
+            if generation != self.slot_generation:
+                vcmodel.release()
+                return
+
+            self.slot_state = 'warming'
+            vcmodel.warmup()
+            self._activate_slot(slotInfo, vcmodel, frames, generation)
+        except Exception as e:
+            logger.error(f"Failed to load model slot {slotInfo.slotIndex}.")
+            logger.exception(e)
+            if vcmodel is not None and vcmodel is not self.vc.vcmodel:
+                vcmodel.release()
+            PipelineScheduler.get_instance().submit(self._restore_slot, generation)
+
+    def _activate_slot(self, slotInfo: RVCModelSlot, vcmodel: RVCr2, frames: tuple[int, int, int, int], generation: int):
+        # Runs on the slot loader thread. Each voice changer is switched under its lock, so the switch happens between
+        # two chunks of the session. Not on the device worker: executor threads hold session locks while they wait for it.
+        if generation != self.slot_generation:
+            vcmodel.release()
+            return
+        self.settings.set_properties({
+            'tran': slotInfo.defaultTune,
+            'formantShift': slotInfo.defaultFormantShift,
+            'indexRatio': slotInfo.defaultIndexRatio,
+            'protect': slotInfo.defaultProtect
+        })
+        with self.vc.lock:
+            self.vc.handover(vcmodel, frames)
+        for session in self.session_list():
+            with session.lock:
+                self._initialize_session(session)
+        self.slot_state = 'active'
+        logger.info(f"Model slot {slotInfo.slotIndex} is active.")
+
+    def _restore_slot(self, generation: int):
+        # Keep serving the current model and point the setting back to it.
+        if generation != self.slot_generation:
+            return
+        if self.vc.vcmodel is not None:
+            self.settings.modelSlotIndex = self.vc.vcmodel.slotInfo.slotIndex
+            self.store_setting()
+        self.slot_state = 'active'
+
+    def update_session_settings(self, session_id: str, key: str, val: Any):
+        logger.info(f"update session {session_id} configuration {key}: {val}")
+        session = self.get_session(session_id)
+        if session is None:
+            return self.get_info()
+        error, old_value = session.settings.set_property(key, val)
+        if error:
+            return self.get_info()
+        val = session.settings.get_property(key)
+        if old_value == val:
+            return self.get_info()
+
+        session.update_settings(key, val, old_value)
+
+        return self.get_info()
+
+    def update_settings(self, key: str, val: Any, session_id: str | None = None):
+        # Runs on the caller thread. Only device and model changes are submitted to the device worker
+        # (see VoiceChangerV2.update_settings), so server audio and get_info never block inference.
+        if session_id is not None:
+            return self.update_session_settings(session_id, key, val)
 
-    def update_settings(self, key: str, val: Any):
         logger.info(f"update configuration {key}: {val}")
         error, old_value = self.settings.set_property(key, val)
         if error:
@@ -173,13 +342,21 @@ class VoiceChangerManager(ServerAudioCallbacks):
 
         if key == "modelSlotIndex":
             logger.info(f"Model slot is changed {old_value} -> {val}")
-            self.initialize(val)
+            self.switch_slot(val)
         elif key == 'gpu':
-            self.device_manager.set_device(val)
+            PipelineScheduler.get_instance().submit(self.device_manager.set_device, val).result()
         elif key == 'forceFp32':
-            self.device_manager.set_force_fp32(val)
+            PipelineScheduler.get_instance().submit(self.device_manager.set_force_fp32, val).result()
         elif key == 'disableJit':
-            self.device_manager.set_disable_jit(val)
+            PipelineScheduler.get_instance().submit(self.device_manager.set_disable_jit, val).result()
+        elif key == 'compileMode':
+            PipelineScheduler.get_instance().submit(self.device_manager.set_compile_mode, val).result()
+        elif key in {'batchMaxSize', 'batchMaxWait'}:
+            PipelineScheduler.set_policy(self.settings.batchMaxSize, self.settings.batchMaxWait)
+        elif key == 'conversionThreads':
+            # Running conversions finish on the old executor.
+            self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=val, thread_name_prefix='VoiceConversion')
         # FIXME: This is a very counter-intuitive handling of audio modes...
         # Map "serverAudioSampleRate" to "inputSampleRate" and "outputSampleRate"
         # since server audio can have its sample rate configured.
@@ -195,21 +372,32 @@ class VoiceChangerManager(ServerAudioCallbacks):
             self.update_settings('inputSampleRate', self.settings.serverAudioSampleRate)
             self.update_settings('outputSampleRate', self.settings.serverAudioSampleRate)
 
+        if key in PIPELINE_KEYS and self.slot_state != 'active':
+            # Restart the pending load with the new device or model settings.
+            self.switch_slot(self.settings.modelSlotIndex)
+
         self.server_audio.update_settings(key, val, old_value)
         self.vc.update_settings(key, val, old_value)
+        for session in self.session_list():
+            if not session.settings.is_overridden(key):
+                session.update_settings(key, val, old_value)
 
         return self.get_info()
 
-    def change_voice(self, receivedData: AudioInOutFloat) -> tuple[AudioInOutFloat, tuple, tuple | None]:
-        if self.settings.passThrough:  # パススルー
+    def change_voice(self, receivedData: AudioInOutFloat, session_id: str | None = None) -> tuple[AudioInOutFloat, tuple, tuple | None]:
+        vc = self.get_session(session_id)
+        if vc is None:
+            # Late chunk of a closed session.
+            return np.zeros_like(receivedData), 0, [0, 0, 0], None
+        if vc.settings.passThrough:  # パススルー
             vol = float(np.sqrt(
                 np.square(receivedData).mean(dtype=np.float32)
             ))
             return receivedData, vol, [0, 0, 0], None
 
         try:
-            with self.device_manager.lock:
-                audio, vol, perf = self.vc.on_request(receivedData)
+            with vc.lock:
+                audio, vol, perf = vc.on_request(receivedData)
             return audio, vol, perf, None
         except VoiceChangerIsNotSelectedException as e:
             logger.exception(e)
@@ -221,9 +409,48 @@ class VoiceChangerManager(ServerAudioCallbacks):
             logger.exception(e)
             return np.zeros(1, dtype=np.float32), 0, [0, 0, 0], ('Exception', format_exc())
 
+    def skip_voice(self, receivedData: AudioInOutFloat, session_id: str | None, merge: bool) -> tuple[AudioInOutFloat, tuple, tuple | None]:
+        vc = self.get_session(session_id)
+        vol = float(np.sqrt(
+            np.square(receivedData).mean(dtype=np.float32)
+        ))
+        if merge and vc is not None and not vc.settings.passThrough:
+            try:
+                with vc.lock:
+                    vc.skip(receivedData)
+            except Exception as e:
+                logger.exception(e)
+        return np.zeros_like(receivedData), vol, [0, 0, 0], None
+
+    async def change_voice_async(self, receivedData: AudioInOutFloat, session_id: str | None = None) -> tuple[AudioInOutFloat, tuple, tuple | None]:
+        # Conversion waits for the device worker, so it runs on the executor instead of the event loop.
+        # Chunks of one session are converted in arrival order. When more than maxPendingChunks chunks
+        # are waiting behind a chunk, it is stale: it is either dropped or merged into the conversion
+        # context of the following chunks without being converted.
+        with self.sessions_lock:
+            closed = session_id in self.closed_sessions
+        if closed:
+            # Late chunk of a closed session. Do not recreate its queue.
+            return np.zeros_like(receivedData), 0, [0, 0, 0], None
+        queue = self.session_queues.setdefault(session_id, SessionQueue())
+        loop = asyncio.get_running_loop()
+        queue.pending += 1
+        try:
+            async with queue.lock:
+                if queue.pending > self.settings.maxPendingChunks and self.settings.staleChunkPolicy != 'none':
+                    merge = self.settings.staleChunkPolicy == 'merge'
+                    return await loop.run_in_executor(self.executor, self.skip_voice, receivedData, session_id, merge)
+                return await loop.run_in_executor(self.executor, self.change_voice, receivedData, session_id)
+        finally:
+            queue.pending -= 1
+
     def export2onnx(self):
         return self.vc.export2onnx()
 
+    def compress_index(self, mode: str, table_dtype: str) -> dict:
+        report = self.vc.compress_index(mode, table_dtype)
+        return {"report": report, "info": self.get_info()}
+
     async def merge_models(self, request: str) -> str | None:
         # self.vc.merge_models(request)
         req = json.loads(request)
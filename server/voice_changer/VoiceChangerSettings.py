@@ -6,6 +6,12 @@ logger = logging.getLogger(__name__)
 
 IGNORED_KEYS = { 'version' }
 STATEFUL_KEYS = [ 'serverAudioStated', 'passThrough', 'recordIO' ]
+# Settings that can be overridden per client session. Everything else affects shared model state.
+SESSION_KEYS = {
+    'inputSampleRate', 'outputSampleRate', 'serverReadChunkSize', 'extraConvertSize', 'crossFadeOverlapSize',
+    'passThrough', 'dstId', 'tran', 'formantShift', 'silentThreshold', 'indexRatio', 'protect', 'silenceFront',
+    'indexTopK',
+}
 
 def _js_bool_to_bool(value: str) -> bool:
     return value == 'true'
@@ -30,7 +36,7 @@ class VoiceChangerSettings:
     def get_properties(self) -> dict:
         return {
             key: value.fget(self)
-            for key, value in self.__class__.__dict__.items()
+            for key, value in VoiceChangerSettings.__dict__.items()
             if isinstance(value, property)
         }
 
@@ -41,7 +47,7 @@ class VoiceChangerSettings:
         ]
 
     def set_property(self, key, value) -> SetPropertyResult:
-        cls = self.__class__
+        cls = VoiceChangerSettings
         if key in IGNORED_KEYS:
             return SetPropertyResult(error=False, old_value=None)
         if key not in cls.__dict__:
@@ -79,10 +85,21 @@ class VoiceChangerSettings:
     _gpu: int = -1
     _forceFp32: int = 0
     _disableJit: int = 0
+    # How torch models are optimized: 'eager', 'jit' (TorchScript) or 'compile' (torch.compile). disableJit forces eager.
+    _compileMode: str = 'jit'
 
     _passThrough: bool = False
     _recordIO: int = 0
 
+    # Cross-session micro-batching. Batch size of 1 disables batching.
+    _batchMaxSize: int = 1
+    _batchMaxWait: float = 0.003
+
+    # Conversion executor and back-pressure for client audio.
+    _conversionThreads: int = 4
+    _maxPendingChunks: int = 4
+    _staleChunkPolicy: str = 'none'  # 'drop', 'merge' or 'none'. 'none' converts every chunk, as before back-pressure existed.
+
     @property
     def modelSlotIndex(self):
         return self._modelSlotIndex
@@ -155,6 +172,46 @@ class VoiceChangerSettings:
     def crossFadeOverlapSize(self, size: str):
         self._crossFadeOverlapSize = float(size)
 
+    @property
+    def batchMaxSize(self):
+        return self._batchMaxSize
+
+    @batchMaxSize.setter
+    def batchMaxSize(self, size: str):
+        self._batchMaxSize = int(size)
+
+    @property
+    def batchMaxWait(self):
+        return self._batchMaxWait
+
+    @batchMaxWait.setter
+    def batchMaxWait(self, wait: str):
+        self._batchMaxWait = float(wait)
+
+    @property
+    def conversionThreads(self):
+        return self._conversionThreads
+
+    @conversionThreads.setter
+    def conversionThreads(self, threads: str):
+        self._conversionThreads = max(int(threads), 1)
+
+    @property
+    def maxPendingChunks(self):
+        return self._maxPendingChunks
+
+    @maxPendingChunks.setter
+    def maxPendingChunks(self, size: str):
+        self._maxPendingChunks = int(size)
+
+    @property
+    def staleChunkPolicy(self):
+        return self._staleChunkPolicy
+
+    @staleChunkPolicy.setter
+    def staleChunkPolicy(self, policy: str):
+        self._staleChunkPolicy = policy
+
     @property
     def forceFp32(self):
         return self._forceFp32
@@ -171,6 +228,14 @@ class VoiceChangerSettings:
     def disableJit(self, enable: str):
         self._disableJit = int(enable)
 
+    @property
+    def compileMode(self):
+        return self._compileMode
+
+    @compileMode.setter
+    def compileMode(self, mode: str):
+        self._compileMode = mode
+
     # Server Audio settings
     _serverAudioStated: int = 0
     _enableServerAudio: int = 0
@@ -320,8 +385,24 @@ class VoiceChangerSettings:
     _useONNX: int = 0
 
     _silentThreshold: int = -90
+    # What to run while the input is silent: 'full' pipeline, a small 'kernel' every idleKernelInterval seconds, or 'none'.
+    # Whatever runs, converted audio fades out when the input turns silent and fades in from silence when speech resumes.
+    _idleStrategy: str = 'full'
+    _idleKernelInterval: float = 0.1
+    # Re-embed only the new audio plus embedderMargin frames (20ms each) of context instead of the whole convert buffer.
+    _incrementalEmbedding: int = 0
+    _embedderMargin: int = 25
+    # Extract f0 only for new audio and keep the rest of the pitch history. Needs an extractor with a known context size.
+    _incrementalPitch: int = 0
+    # Capture inference into CUDA graphs and replay them for every chunk of the same geometry.
+    _cudaGraph: int = 0
+    # Memory budget (MB) for initialized pipelines of recently used slots. Switching to a pooled slot skips loading.
+    _pipelinePoolMemory: int = 0
 
     _indexRatio: float = 0
+    _indexTopK: int = 8
+    # Reuse search results for feature frames seen in recent chunks. Pays off with incrementalEmbedding.
+    _indexResultCache: int = 0
     _protect: float = 0.5
     _silenceFront: int = 1
 
@@ -373,6 +454,62 @@ class VoiceChangerSettings:
     def silentThreshold(self, threshold: str):
         self._silentThreshold = int(threshold)
 
+    @property
+    def idleStrategy(self):
+        return self._idleStrategy
+
+    @idleStrategy.setter
+    def idleStrategy(self, strategy: str):
+        self._idleStrategy = strategy
+
+    @property
+    def idleKernelInterval(self):
+        return self._idleKernelInterval
+
+    @idleKernelInterval.setter
+    def idleKernelInterval(self, interval: str):
+        self._idleKernelInterval = float(interval)
+
+    @property
+    def cudaGraph(self):
+        return self._cudaGraph
+
+    @cudaGraph.setter
+    def cudaGraph(self, enabled: str):
+        self._cudaGraph = int(enabled)
+
+    @property
+    def pipelinePoolMemory(self):
+        return self._pipelinePoolMemory
+
+    @pipelinePoolMemory.setter
+    def pipelinePoolMemory(self, megabytes: str):
+        self._pipelinePoolMemory = max(int(megabytes), 0)
+
+    @property
+    def incrementalEmbedding(self):
+        return self._incrementalEmbedding
+
+    @incrementalEmbedding.setter
+    def incrementalEmbedding(self, enabled: str):
+        self._incrementalEmbedding = int(enabled)
+
+    @property
+    def embedderMargin(self):
+        return self._embedderMargin
+
+    @embedderMargin.setter
+    def embedderMargin(self, frames: str):
+        self._embedderMargin = int(frames)
+
+    @property
+    def incrementalPitch(self):
+        return self._incrementalPitch
+
+    @incrementalPitch.setter
+    def incrementalPitch(self, enabled: str):
+        self._incrementalPitch = int(enabled)
+
     @property
     def indexRatio(self):
         return self._indexRatio
@@ -381,6 +518,22 @@ class VoiceChangerSettings:
     def indexRatio(self, ratio: str):
         self._indexRatio = float(ratio)
 
+    @property
+    def indexTopK(self):
+        return self._indexTopK
+
+    @indexTopK.setter
+    def indexTopK(self, k: str):
+        self._indexTopK = max(int(k), 1)
+
+    @property
+    def indexResultCache(self):
+        return self._indexResultCache
+
+    @indexResultCache.setter
+    def indexResultCache(self, enabled: str):
+        self._indexResultCache = int(enabled)
+
     @property
     def protect(self):
         return self._protect
@@ -396,3 +549,32 @@ class VoiceChangerSettings:
     @silenceFront.setter
     def silenceFront(self, enable: str):
         self._silenceFront = int(enable)
+
+
+class SessionSettings(VoiceChangerSettings):
+    """
+    Per-session view of the settings. Reads fall through to the base settings
+    unless the key was overridden for this session with set_property.
+    """
+
+    def __init__(self, base: VoiceChangerSettings):
+        self._base = base
+        self._overrides: set[str] = set()
+
+    def __getattribute__(self, name: str):
+        if name.startswith('_') and not name.startswith('__') and name not in { '_base', '_overrides' }:
+            if name[1:] not in object.__getattribute__(self, '_overrides'):
+                return getattr(object.__getattribute__(self, '_base'), name)
+        return object.__getattribute__(self, name)
+
+    def set_property(self, key, value) -> SetPropertyResult:
+        if key not in SESSION_KEYS:
+            logger.error(f'Failed to set session setting: {key} is shared between sessions.')
+            return SetPropertyResult(error=True, old_value=None)
+        result = super().set_property(key, value)
+        if not result.error:
+            self._overrides.add(key)
+        return result
+
+    def is_overridden(self, key: str) -> bool:
+        return key in self._overrides
@@ -1,3 +1,5 @@
+import threading
+from time import perf_counter
 from typing import Any, Union
 
 from torch.functional import F
@@ -15,11 +17,13 @@ from Exceptions import (
     VoiceChangerIsNotSelectedException,
 )
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
+from voice_changer.common.TorchUtils import tensor_nbytes
+from voice_changer.RVC.pipeline.PipelineScheduler import PipelineScheduler
 
 logger = logging.getLogger(__name__)
 
 class VoiceChangerV2:
-    def __init__(self, settings: VoiceChangerSettings):
+    def __init__(self, settings: VoiceChangerSettings, record_io: bool = True, shared_io_recorder: IORecorder | None = None):
         # 初期化
         self.settings = settings
 
@@ -31,16 +35,41 @@ class VoiceChangerV2:
         self.vcmodel: VoiceChangerModel | None = None
         self.device_manager = DeviceManager.get_instance()
         self.sola_buffer: torch.Tensor | None = None
+        self.sola_active = False
+        self.last_request_at: float | None = None
+        # Serializes requests that share this voice changer's streaming state.
+        self.lock = threading.Lock()
+        # Recording files are global, so only the primary voice changer owns a recorder and reopens it
+        # on sample rate changes. Client sessions record into the recorder of the primary voice changer.
+        self.owns_io_recorder = record_io
         self.io_recorder = IORecorder(
             self.settings.inputSampleRate,
             self.settings.outputSampleRate,
-        )
+        ) if record_io else shared_io_recorder
         self._generate_strength()
 
     def initialize(self, vcmodel: VoiceChangerModel):
+        vcmodel.realloc(*self.frames())
+        vcmodel.initialize()
+        self.handover(vcmodel, self.frames())
+
+    def frames(self) -> tuple[int, int, int, int]:
+        return self.block_frame, self.extra_frame, self.crossfade_frame, self.sola_search_frame
+
+    def handover(self, vcmodel: VoiceChangerModel, frames: tuple[int, int, int, int]):
+        """
+        Replaces the model with one initialized for frames. The SOLA buffer keeps the tail of the previous model
+        output, so the first chunk of the new model is aligned and crossfaded with it.
+        """
+        if frames != self.frames():
+            # Buffer sizes changed while the model was loading.
+            vcmodel.realloc(*self.frames())
+        previous = self.vcmodel
+        if previous is not None and previous.voiceChangerType == vcmodel.voiceChangerType:
+            vcmodel.handover(previous)
         self.vcmodel = vcmodel
-        self.vcmodel.realloc(self.block_frame, self.extra_frame, self.crossfade_frame, self.sola_search_frame)
-        self.vcmodel.initialize()
+        if previous is not None and previous is not vcmodel:
+            previous.release()
 
     def set_slot_info(self, slot_info: ModelSlots):
         self.vcmodel.set_slot_info(slot_info)
@@ -52,27 +81,40 @@ class VoiceChangerV2:
         return self.vcmodel.voiceChangerType
 
     def set_input_sample_rate(self):
-        self.io_recorder.open(self.settings.inputSampleRate, self.settings.outputSampleRate)
+        if self.owns_io_recorder:
+            self.io_recorder.open(self.settings.inputSampleRate, self.settings.outputSampleRate)
 
         self.extra_frame = int(self.settings.extraConvertSize * self.settings.inputSampleRate)
         self.crossfade_frame = int(self.settings.crossFadeOverlapSize * self.settings.inputSampleRate)
         self.sola_search_frame = self.settings.inputSampleRate // 100
         self._generate_strength()
 
-        self.vcmodel.set_sampling_rate(self.settings.inputSampleRate, self.settings.outputSampleRate)
-        self.vcmodel.realloc(self.block_frame, self.extra_frame, self.crossfade_frame, self.sola_search_frame)
-
     def set_output_sample_rate(self):
-        self.io_recorder.open(self.settings.inputSampleRate, self.settings.outputSampleRate)
-
-        self.vcmodel.set_sampling_rate(self.settings.inputSampleRate, self.settings.outputSampleRate)
+        if self.owns_io_recorder:
+            self.io_recorder.open(self.settings.inputSampleRate, self.settings.outputSampleRate)
 
     def get_info(self):
         if self.vcmodel is not None:
             return self.vcmodel.get_info()
         return {}
 
+    def get_session_info(self) -> dict:
+        """Returns the size in bytes of the streaming state owned by this voice changer and its scheduling stats."""
+        info = self.vcmodel.get_session_info() if self.vcmodel is not None else {"stateMemory": 0}
+        info["stateMemory"] += tensor_nbytes(self.sola_buffer) + tensor_nbytes(self.fade_in_window) + tensor_nbytes(self.fade_out_window)
+        return info
+
     def update_settings(self, key: str, val: Any, old_val: Any):
+        """
+        Applies a settings change under the session lock, so it never interleaves with a chunk being converted.
+        Model changes run on the device worker in order with queued inference.
+        """
+        with self.lock:
+            self._update_state(key, val)
+            if self.vcmodel is not None:
+                PipelineScheduler.get_instance().submit(self._update_model, key, val, old_val).result()
+
+    def _update_state(self, key: str, val: Any):
         if key == "serverReadChunkSize":
             self.block_frame = self.settings.serverReadChunkSize * 128
         elif key == 'gpu':
@@ -88,10 +130,12 @@ class VoiceChangerV2:
             self.crossfade_frame = int(val * self.settings.inputSampleRate)
             self._generate_strength()
 
-        if self.vcmodel is not None:
-            self.vcmodel.update_settings(key, val, old_val)
-            if key in {'gpu', 'serverReadChunkSize', 'extraConvertSize', 'crossFadeOverlapSize', 'silenceFront', 'forceFp32'}:
-                self.vcmodel.realloc(self.block_frame, self.extra_frame, self.crossfade_frame, self.sola_search_frame)
+    def _update_model(self, key: str, val: Any, old_val: Any):
+        if key in {'inputSampleRate', 'outputSampleRate'}:
+            self.vcmodel.set_sampling_rate(self.settings.inputSampleRate, self.settings.outputSampleRate)
+        self.vcmodel.update_settings(key, val, old_val)
+        if key in {'gpu', 'serverReadChunkSize', 'extraConvertSize', 'crossFadeOverlapSize', 'silenceFront', 'forceFp32', 'inputSampleRate'}:
+            self.vcmodel.realloc(self.block_frame, self.extra_frame, self.crossfade_frame, self.sola_search_frame)
 
 
     def _generate_strength(self):
@@ -113,6 +157,7 @@ class VoiceChangerV2:
 
         # ひとつ前の結果とサイズが変わるため、記録は消去する。
         self.sola_buffer = torch.zeros(self.crossfade_frame, device=self.device_manager.device, dtype=torch.float32)
+        self.sola_active = False
         logger.info(f'Allocated SOLA buffer size: {self.crossfade_frame}')
 
     def get_processing_sampling_rate(self) -> int:
@@ -120,38 +165,53 @@ class VoiceChangerV2:
             return 0
         return self.vcmodel.get_processing_sampling_rate()
 
-    def process_audio(self, audio_in: AudioInOutFloat) -> tuple[AudioInOutFloat, float]:
+    def process_audio(self, audio_in: AudioInOutFloat) -> tuple[AudioInOutFloat, float, bool]:
         block_size = audio_in.shape[0]
 
         audio, vol = self.vcmodel.inference(audio_in)
 
         if audio is None:
             # In case there's an actual silence - send full block with zeros
-            return np.zeros(block_size, dtype=np.float32), vol
-
-        # SOLA algorithm from https://github.com/yxlllc/DDSP-SVC, https://github.com/liujing04/Retrieval-based-Voice-Conversion-WebUI
-        conv_input = audio[
-            None, None, : self.crossfade_frame + self.sola_search_frame
-        ]
-        cor_nom = F.conv1d(conv_input, self.sola_buffer[None, None, :])
-        cor_den = torch.sqrt(
-            F.conv1d(
-                conv_input ** 2,
-                torch.ones(1, 1, self.crossfade_frame, device=self.device_manager.device),
+            audio_out = np.zeros(block_size, dtype=np.float32)
+            if self.sola_active:
+                # Fade out the tail of the last converted block instead of cutting it,
+                # and let SOLA fade in from silence once speech resumes.
+                tail = (self.sola_buffer * self.fade_out_window)[: block_size].detach().cpu().numpy()
+                audio_out[: tail.shape[0]] = tail
+                self.sola_buffer.zero_()
+                self.sola_active = False
+            return audio_out, vol, False
+
+        if self.sola_active:
+            # SOLA algorithm from https://github.com/yxlllc/DDSP-SVC, https://github.com/liujing04/Retrieval-based-Voice-Conversion-WebUI
+            conv_input = audio[
+                None, None, : self.crossfade_frame + self.sola_search_frame
+            ]
+            cor_nom = F.conv1d(conv_input, self.sola_buffer[None, None, :])
+            cor_den = torch.sqrt(
+                F.conv1d(
+                    conv_input ** 2,
+                    torch.ones(1, 1, self.crossfade_frame, device=self.device_manager.device),
+                )
+                + 1e-8
             )
-            + 1e-8
-        )
-        sola_offset = torch.argmax(cor_nom[0, 0] / cor_den[0, 0])
+            sola_offset = torch.argmax(cor_nom[0, 0] / cor_den[0, 0])
 
-        audio = audio[sola_offset:]
-        audio[: self.crossfade_frame] *= self.fade_in_window
-        audio[: self.crossfade_frame] += (
-            self.sola_buffer * self.fade_out_window
-        )
+            audio = audio[sola_offset:]
+            audio[: self.crossfade_frame] *= self.fade_in_window
+            audio[: self.crossfade_frame] += (
+                self.sola_buffer * self.fade_out_window
+            )
+        else:
+            # Speech resumes after silence (or a reallocation). The tail of the last converted block was
+            # already played out when the input went silent, so there is nothing to align to: skip the
+            # correlation search and fade in from silence.
+            audio[: self.crossfade_frame] *= self.fade_in_window
 
         self.sola_buffer[:] = audio[block_size : block_size + self.crossfade_frame]
+        self.sola_active = True
 
-        return audio[: block_size].detach().cpu().numpy(), vol
+        return audio[: block_size].detach().cpu().numpy(), vol, True
 
     @torch.no_grad()
     def on_request(self, audio_in: AudioInOutFloat) -> tuple[AudioInOutFloat, list[Union[int, float]]]:
@@ -159,20 +219,42 @@ class VoiceChangerV2:
             raise VoiceChangerIsNotSelectedException("Voice Changer is not selected.")
 
         with Timer2("main-process", True) as t:
-            result, vol = self.process_audio(audio_in)
+            result, vol, converted = self.process_audio(audio_in)
 
         mainprocess_time = t.secs
 
+        # Share of wall time spent on idle work (see idleStrategy) while the input is silent.
+        now = perf_counter()
+        idle_utilization = 0
+        if not converted and self.last_request_at is not None:
+            idle_utilization = min(mainprocess_time / max(now - self.last_request_at, 1e-6), 1)
+        self.last_request_at = now
+
         # 後処理
-        if self.settings.recordIO:
-            self.io_recorder.write_input((audio_in * 32767).astype(np.int16).tobytes())
-            self.io_recorder.write_output((result * 32767).astype(np.int16).tobytes())
+        if self.settings.recordIO and self.io_recorder is not None:
+            self.io_recorder.write(
+                (audio_in * 32767).astype(np.int16).tobytes(),
+                (result * 32767).astype(np.int16).tobytes(),
+                self.settings.inputSampleRate,
+                self.settings.outputSampleRate,
+            )
 
-        return result, vol, [0, mainprocess_time, 0]
+        index_cache_hit_rate = self.vcmodel.get_session_info().get("indexCacheHitRate", 0)
+
+        return result, vol, [0, mainprocess_time, 0, idle_utilization, index_cache_hit_rate]
+
+    @torch.no_grad()
+    def skip(self, audio_in: AudioInOutFloat):
+        if self.vcmodel is None:
+            raise VoiceChangerIsNotSelectedException("Voice Changer is not selected.")
+        self.vcmodel.skip(audio_in)
 
     @torch.no_grad()
     def export2onnx(self):
         return self.vcmodel.export2onnx()
 
+    def compress_index(self, mode: str, table_dtype: str) -> dict:
+        return self.vcmodel.compress_index(mode, table_dtype)
+
     def get_current_model_settings(self) -> dict:
         return self.vcmodel.get_model_current()
@@ -0,0 +1,102 @@
+import torch
+from collections import OrderedDict
+from typing import Callable
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Eager runs of a new geometry before it is captured. Lets lazy initialization (cuDNN autotuning, JIT profiling) settle.
+WARMUP_RUNS = 3
+# Captured geometries kept alive. Each graph holds its own memory pool.
+MAX_GRAPHS = 4
+# Geometries counted towards capture. Geometries that stop recurring (e.g. chunk sizes tried while tuning) are forgotten.
+MAX_WARMUPS = 16
+
+
+def graph_key(tensors: tuple[torch.Tensor | None, ...], static: tuple) -> tuple:
+    """
+    Identifies what a captured graph depends on: shape, dtype and device of every tensor input and the values of
+    static (non-tensor) arguments. A graph can only be replayed for inputs with an equal key.
+    """
+    return (
+        tuple(None if tensor is None else (tuple(tensor.shape), tensor.dtype, tensor.device) for tensor in tensors),
+        static,
+    )
+
+
+class CapturedGraph:
+    def __init__(self, fn: Callable[..., torch.Tensor], tensors: tuple[torch.Tensor | None, ...], static: tuple):
+        self.inputs = tuple(None if tensor is None else tensor.clone() for tensor in tensors)
+
+        # Warm up on a side stream as required for capture.
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            fn(*self.inputs, *static)
+        torch.cuda.current_stream().wait_stream(stream)
+
+        self.graph = torch.cuda.CUDAGraph()
+        # Executor threads keep running CUDA work (resampling, SOLA) during capture. Only check this thread.
+        with torch.cuda.graph(self.graph, capture_error_mode='thread_local'):
+            self.output = fn(*self.inputs, *static)
+
+    def replay(self, tensors: tuple[torch.Tensor | None, ...]) -> torch.Tensor:
+        for captured, tensor in zip(self.inputs, tensors):
+            if captured is not None:
+                captured.copy_(tensor)
+        self.graph.replay()
+        # Output memory is reused by the next replay.
+        return self.output.clone()
+
+
+class CudaGraphRunner:
+    """
+    Runs fn(*tensors, *static) through captured CUDA graphs, one per input geometry (see graph_key).
+
+    A geometry runs eagerly for WARMUP_RUNS calls, is captured on the next one and replayed afterwards.
+    A new geometry (e.g. after buffers are reallocated or settings change) is captured the same way,
+    and least recently used graphs and warmup counts are dropped. Inputs that are not on a CUDA device and geometries that
+    fail to capture run eagerly.
+    """
+
+    def __init__(self, fn: Callable[..., torch.Tensor]):
+        self.fn = fn
+        self.graphs: OrderedDict[tuple, CapturedGraph | None] = OrderedDict()
+        self.warmups: OrderedDict[tuple, int] = OrderedDict()
+
+    def invalidate(self):
+        self.graphs.clear()
+        self.warmups.clear()
+
+    def __call__(self, tensors: tuple[torch.Tensor | None, ...], *static) -> torch.Tensor:
+        if any(tensor is not None and tensor.device.type != 'cuda' for tensor in tensors):
+            return self.fn(*tensors, *static)
+
+        key = graph_key(tensors, static)
+        if key not in self.graphs:
+            runs = self.warmups.get(key, 0)
+            if runs < WARMUP_RUNS:
+                self.warmups[key] = runs + 1
+                self.warmups.move_to_end(key)
+                while len(self.warmups) > MAX_WARMUPS:
+                    self.warmups.popitem(last=False)
+                return self.fn(*tensors, *static)
+            del self.warmups[key]
+            self.graphs[key] = self._capture(tensors, static)
+            while len(self.graphs) > MAX_GRAPHS:
+                self.graphs.popitem(last=False)
+
+        self.graphs.move_to_end(key)
+        graph = self.graphs[key]
+        if graph is None:
+            return self.fn(*tensors, *static)
+        return graph.replay(tensors)
+
+    def _capture(self, tensors: tuple[torch.Tensor | None, ...], static: tuple) -> CapturedGraph | None:
+        try:
+            graph = CapturedGraph(self.fn, tensors, static)
+            logger.info(f'Captured CUDA graph for {[None if tensor is None else tuple(tensor.shape) for tensor in tensors]}, {static}')
+            return graph
+        except Exception as e:
+            logger.warning(f'CUDA graph capture failed, running eagerly: {e}')
+            return None
@@ -0,0 +1,73 @@
+import faiss
+import numpy as np
+import os
+import re
+import torch
+from functools import lru_cache
+from safetensors.torch import load_file
+from xxhash import xxh128
+from utils.hasher import compute_hash
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Number of indexes kept loaded in the process, so pipeline rebuilds of recently used slots skip loading entirely.
+INDEX_CACHE_SIZE = 4
+
+
+def load_index(fpath: str) -> tuple[faiss.Index, np.ndarray | None]:
+    """
+    Returns the index and its reconstructed vectors, or None for vectors if the index is untrained or empty.
+    Vectors are memory-mapped from a cache file next to the index, keyed by the index file hash.
+    """
+    stat = os.stat(fpath)
+    return _load_index(fpath, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _load_index(fpath: str, mtime_ns: int, size: int) -> tuple[faiss.Index, np.ndarray | None]:
+    index = faiss.read_index(fpath)
+    if not index.is_trained or index.ntotal == 0:
+        return index, None
+    return index, load_cached_vectors(fpath, index)
+
+
+def load_compressed_index(fpath: str, table_fpath: str) -> tuple[faiss.Index, dict[str, torch.Tensor]]:
+    """Returns an index written by compress_index and its vector table (with per-dimension scale for int8 tables)."""
+    index_stat = os.stat(fpath)
+    table_stat = os.stat(table_fpath)
+    return _load_compressed_index(fpath, table_fpath, index_stat.st_mtime_ns, table_stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _load_compressed_index(fpath: str, table_fpath: str, index_mtime_ns: int, table_mtime_ns: int) -> tuple[faiss.Index, dict[str, torch.Tensor]]:
+    return faiss.read_index(fpath), load_file(table_fpath)
+
+
+def load_cached_vectors(fpath: str, index: faiss.Index) -> np.ndarray:
+    with open(fpath, 'rb') as f:
+        computed_hash = compute_hash(f, xxh128())
+    dirname = os.path.dirname(fpath)
+    fname, _ = os.path.splitext(os.path.basename(fpath))
+    cache_fpath = os.path.join(dirname, f'{fname}.{computed_hash}.npy')
+    if not os.path.exists(cache_fpath):
+        _remove_stale_caches(dirname, fname)
+        logger.info('Caching reconstructed index vectors...')
+        # BUG: faiss-gpu does not support reconstruct on GPU indices
+        # https://github.com/facebookresearch/faiss/issues/2181
+        vectors = np.asarray(index.reconstruct_n(0, index.ntotal), dtype=np.float32)
+        tmp_fpath = f'{cache_fpath}.tmp'
+        with open(tmp_fpath, 'wb') as f:
+            np.save(f, vectors)
+        os.replace(tmp_fpath, cache_fpath)
+        logger.info('Done!')
+    # Copy-on-write mapping gives writable arrays without reading the file upfront.
+    return np.load(cache_fpath, mmap_mode='c')
+
+
+def _remove_stale_caches(dirname: str, fname: str):
+    pattern = re.compile(rf'{re.escape(fname)}\.[0-9a-f]{{32}}\.npy')
+    for entry in os.listdir(dirname):
+        if pattern.fullmatch(entry):
+            logger.info(f'Removing stale index cache {entry}')
+            os.remove(os.path.join(dirname, entry))
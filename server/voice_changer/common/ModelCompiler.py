@@ -0,0 +1,26 @@
+import torch
+from typing import Literal
+
+import logging
+logger = logging.getLogger(__name__)
+
+CompileMode = Literal['eager', 'jit', 'compile']
+
+
+def compile_model(model: torch.nn.Module, mode: CompileMode, methods: tuple[str, ...] = ('forward',)) -> torch.nn.Module:
+    """
+    Optimizes the inference methods of model.
+
+    'jit' scripts the model with TorchScript. 'compile' wraps methods with torch.compile and static shapes,
+    so every buffer geometry (see RVCr2.realloc) gets its own specialized kernels. Compilation is lazy and happens
+    on the first call with a new geometry. Compiled kernels are cached on disk and reused across restarts,
+    the cache directory (TORCHINDUCTOR_CACHE_DIR) is set at startup in main.py.
+    """
+    if mode == 'jit':
+        logger.info('Compiling JIT model...')
+        return torch.jit.optimize_for_inference(torch.jit.script(model), other_methods=[method for method in methods if method != 'forward'])
+    if mode == 'compile':
+        logger.info('Compiling model with torch.compile...')
+        for method in methods:
+            setattr(model, method, torch.compile(getattr(model, method), dynamic=False))
+    return model
@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, TypeVar
+
+from voice_changer.common.deviceManager.DeviceManager import DeviceManager
+
+import logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def device_key() -> tuple:
+    """What a loaded model depends on besides its type: device, precision, compile mode and ONNX providers."""
+    device_manager = DeviceManager.get_instance()
+    providers, _ = device_manager.get_onnx_execution_provider()
+    return (
+        str(device_manager.device),
+        device_manager.use_fp16(),
+        device_manager.is_int8_avalable(),
+        device_manager.get_compile_mode(),
+        tuple(providers),
+    )
+
+
+class RegistryEntry(Generic[T]):
+    def __init__(self, instance: T, size: int):
+        self.instance = instance
+        self.size = size
+        self.refs = 0
+
+
+class ModelRegistry(Generic[T]):
+    """
+    Shared model instances keyed by what they were loaded for (see device_key).
+
+    acquire returns the shared instance for a key, loading it on first use, and counts a reference.
+    release drops the reference. Instances without references stay loaded in LRU order until
+    their estimated size exceeds the memory cap, so switching back to them is free.
+
+    Reference counts are updated under a lock, since the worker, the slot loader and REST threads share instances.
+    Models are loaded outside the lock, so a slow load does not block releases on the worker.
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.entries: OrderedDict[tuple, RegistryEntry[T]] = OrderedDict()
+        # Number of loads so far. Lets callers tell whether an operation reused instances.
+        self.loads = 0
+        self.lock = threading.RLock()
+
+    def acquire(self, key: tuple, load: Callable[[], T], size: int, force_reload: bool = False) -> T:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and force_reload:
+                # Current holders keep the old instance until they release it.
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                logger.info(f'Reusing {self.name}.')
+                return self._reference(key, entry)
+
+        instance = load()
+        with self.lock:
+            self.loads += 1
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = RegistryEntry(instance, size)
+                self.entries[key] = entry
+            # Otherwise loaded concurrently by another thread. The duplicate is dropped.
+            return self._reference(key, entry)
+
+    def _reference(self, key: tuple, entry: RegistryEntry[T]) -> T:
+        entry.refs += 1
+        self.entries.move_to_end(key)
+        self._evict()
+        return entry.instance
+
+    def release(self, instance: T):
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.instance is instance:
+                    entry.refs = max(entry.refs - 1, 0)
+                    break
+            self._evict()
+
+    def memory(self) -> int:
+        with self.lock:
+            return sum(entry.size for entry in self.entries.values())
+
+    def get_info(self) -> dict:
+        with self.lock:
+            return {
+                "loaded": len(self.entries),
+                "referenced": sum(1 for entry in self.entries.values() if entry.refs > 0),
+                "memory": self.memory(),
+                "capacity": self.capacity,
+                "loads": self.loads,
+            }
+
+    def _evict(self):
+        for key in list(self.entries):
+            if self.memory() <= self.capacity:
+                break
+            if self.entries[key].refs == 0:
+                logger.info(f'Unloading unused {self.name} {key[0]}.')
+                del self.entries[key]
@@ -0,0 +1,199 @@
+import threading
+import numpy as np
+import onnxruntime
+import torch
+import torch.utils.dlpack
+from collections import OrderedDict
+from contextlib import contextmanager
+from onnx import ModelProto
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Specialized geometries kept alive per model, besides the dynamic session. Each session holds its own copy of the weights.
+SESSION_CACHE_SIZE = 2
+# Bindings kept alive per model. A geometry can have several if scalar inputs change the output shape.
+BINDING_CACHE_SIZE = 4
+
+_specializing = threading.local()
+
+
+@contextmanager
+def specialize_sessions():
+    """
+    Lets StaticShapeSession build sessions specialized to the shapes of runs on this thread inside the block.
+    Used at warm-up (see RVCr2.warmup), so sessions are never built on the realtime path.
+    """
+    _specializing.active = True
+    try:
+        yield
+    finally:
+        _specializing.active = False
+
+
+def _is_specializing() -> bool:
+    return getattr(_specializing, 'active', False)
+
+
+NUMPY_DTYPES = {
+    torch.float32: np.float32,
+    torch.float16: np.float16,
+    torch.int64: np.int64,
+}
+
+
+def ortvalue_to_torch(value: onnxruntime.OrtValue) -> torch.Tensor:
+    """Shares the memory of an ORT allocated value through DLPack if this ORT build supports it. Copies through host memory otherwise."""
+    to_dlpack = getattr(value._ortvalue, 'to_dlpack', None)
+    if to_dlpack is not None:
+        return torch.utils.dlpack.from_dlpack(to_dlpack())
+    return torch.from_numpy(value.numpy())
+
+
+def bind_tensor(binding: onnxruntime.IOBinding, name: str, tensor: torch.Tensor, output: bool = False):
+    """Binds tensor memory (host or CUDA) to a session input or output by pointer, without copying."""
+    bind = binding.bind_output if output else binding.bind_input
+    bind(
+        name,
+        device_type=tensor.device.type,
+        device_id=tensor.device.index or 0,
+        element_type=NUMPY_DTYPES[tensor.dtype],
+        shape=tuple(tensor.shape),
+        buffer_ptr=tensor.data_ptr(),
+    )
+
+
+class OutputBinding:
+    """
+    Persistent IO binding of a session. Outputs are written into preallocated buffers bound by pointer:
+    torch tensors on CUDA, numpy arrays (shared with torch) on other devices.
+    Runs return the buffers themselves, so they are only valid until the next run of the binding.
+    """
+
+    def __init__(self, session: onnxruntime.InferenceSession, outputs: list[str], device: torch.device):
+        self.session = session
+        self.outputs = outputs
+        self.device_type = 'cuda' if device.type == 'cuda' else 'cpu'
+        self.device_id = device.index or 0
+        self.binding = session.io_binding()
+        self.buffers: list[torch.Tensor] | None = None
+
+    def run(self, tensors: dict[str, torch.Tensor], arrays: dict[str, np.ndarray]) -> list[torch.Tensor]:
+        for name, tensor in tensors.items():
+            bind_tensor(self.binding, name, tensor)
+        for name, array in arrays.items():
+            self.binding.bind_cpu_input(name, array)
+
+        if self.buffers is None:
+            # Output shapes are only known after the first run. ORT allocates the outputs once.
+            for name in self.outputs:
+                self.binding.bind_output(name, device_type=self.device_type, device_id=self.device_id)
+            self.session.run_with_iobinding(self.binding)
+            results = [ortvalue_to_torch(value) for value in self.binding.get_outputs()]
+            self.buffers = [self._allocate(result) for result in results]
+            for name, buffer in zip(self.outputs, self.buffers):
+                bind_tensor(self.binding, name, buffer, output=True)
+            return [result.to(buffer.device) for result, buffer in zip(results, self.buffers)]
+
+        self.session.run_with_iobinding(self.binding)
+        return self.buffers
+
+    def _allocate(self, like: torch.Tensor) -> torch.Tensor:
+        if self.device_type == 'cuda':
+            return torch.empty(like.shape, dtype=like.dtype, device=torch.device('cuda', self.device_id))
+        return torch.from_numpy(np.empty(tuple(like.shape), dtype=NUMPY_DTYPES[like.dtype]))
+
+
+class StaticShapeSession:
+    """
+    ONNX Runtime sessions specialized to the shapes of their inputs. Symbolic input dimensions are pinned with
+    free dimension overrides, so ORT can plan memory and fuse kernels for the exact chunk geometry.
+
+    Specialized sessions are only built for geometries run inside specialize_sessions, i.e. the geometry of reallocated
+    buffers at warm-up, and least recently used ones are dropped. Any other geometry (incremental tails, skipped chunks)
+    runs on a dynamic session that is kept for the lifetime of the model. The leading (batch) axis always stays dynamic,
+    since micro-batching changes it from call to call.
+    Runs go through persistent bindings (see OutputBinding), so results stay on the device of the inputs.
+    Results are the bound output buffers and are overwritten by the next run with the same geometry. Callers consume
+    them right away and copy only what they keep across runs (e.g. FeatureCache) or hand to other threads.
+    """
+
+    def __init__(self, model: ModelProto, providers: list[str], provider_options: list[dict]):
+        self.model = model.SerializeToString()
+        self.providers = providers
+        self.provider_options = provider_options
+        self.inputs = {input.name: [dim.dim_param for dim in input.type.tensor_type.shape.dim] for input in model.graph.input}
+        self.outputs = [output.name for output in model.graph.output]
+        self.metadata = {prop.key: prop.value for prop in model.metadata_props}
+        self.dynamic = self._create(())
+        self.sessions: OrderedDict[tuple[tuple[str, int], ...], onnxruntime.InferenceSession] = OrderedDict()
+        self.bindings: OrderedDict[tuple, OutputBinding] = OrderedDict()
+
+    def is_dynamic(self, name: str, axis: int) -> bool:
+        dims = self.inputs[name]
+        return axis < len(dims) and bool(dims[axis])
+
+    def get(self, shapes: dict[str, tuple[int, ...]]) -> onnxruntime.InferenceSession:
+        overrides = {}
+        for name, shape in shapes.items():
+            for dim_param, size in zip(self.inputs[name][1:], shape[1:]):
+                if dim_param:
+                    overrides[dim_param] = size
+        key = tuple(sorted(overrides.items()))
+        if not key:
+            return self.dynamic
+
+        session = self.sessions.get(key)
+        if session is None:
+            if not _is_specializing():
+                return self.dynamic
+            session = self._create(key)
+            self.sessions[key] = session
+            while len(self.sessions) > SESSION_CACHE_SIZE:
+                _, evicted = self.sessions.popitem(last=False)
+                self.bindings = OrderedDict((k, binding) for k, binding in self.bindings.items() if binding.session is not evicted)
+        self.sessions.move_to_end(key)
+        return session
+
+    def run(self, tensors: dict[str, torch.Tensor], arrays: dict[str, np.ndarray] | None = None) -> list[torch.Tensor]:
+        """
+        Runs the session for the shapes of tensors and returns all outputs as tensors on the device of the inputs.
+        arrays are small host-side inputs (e.g. scalars). Their values may change the output shapes.
+        """
+        arrays = arrays or {}
+        device = next(iter(tensors.values())).device
+        if device.type not in ('cuda', 'cpu'):
+            # ORT can only read host memory or CUDA memory. Other devices (DirectML, MPS) copy through the host.
+            tensors = {name: tensor.cpu() for name, tensor in tensors.items()}
+        # No-ops for contiguous inputs, which is what the pipeline passes.
+        tensors = {name: tensor.detach().contiguous() for name, tensor in tensors.items()}
+
+        key = (
+            tuple((name, tuple(tensor.shape), tensor.dtype, tensor.device) for name, tensor in tensors.items()),
+            tuple((name, array.tobytes()) for name, array in arrays.items()),
+        )
+        binding = self.bindings.get(key)
+        # A geometry that ran before warm-up is still bound to the dynamic session.
+        if binding is None or (binding.session is self.dynamic and _is_specializing()):
+            session = self.get({name: tuple(tensor.shape) for name, tensor in tensors.items()})
+            binding = OutputBinding(session, self.outputs, device)
+            self.bindings[key] = binding
+            while len(self.bindings) > BINDING_CACHE_SIZE:
+                self.bindings.popitem(last=False)
+        self.bindings.move_to_end(key)
+        outputs = binding.run(tensors, arrays)
+        if device.type not in ('cuda', 'cpu'):
+            outputs = [output.to(device) for output in outputs]
+        return outputs
+
+    def get_providers(self) -> list[str]:
+        return self.dynamic.get_providers()
+
+    def _create(self, overrides: tuple[tuple[str, int], ...]) -> onnxruntime.InferenceSession:
+        so = onnxruntime.SessionOptions()
+        # so.log_severity_level = 3
+        # so.enable_profiling = True
+        for name, size in overrides:
+            so.add_free_dimension_override_by_name(name, size)
+        logger.info(f'Creating ONNX session for {dict(overrides)}')
+        return onnxruntime.InferenceSession(self.model, sess_options=so, providers=self.providers, provider_options=self.provider_options)
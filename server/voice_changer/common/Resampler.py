@@ -0,0 +1,88 @@
+import math
+import torch
+import torch.nn.functional as F
+from functools import lru_cache
+from torchaudio import transforms as tat
+
+RESAMPLER_CACHE_SIZE = 32
+# Filter of torchaudio's default sinc_interp_hann resampling.
+LOWPASS_FILTER_WIDTH = 6
+ROLLOFF = 0.99
+
+
+@lru_cache(maxsize=RESAMPLER_CACHE_SIZE)
+def get_resampler(orig_freq: int, new_freq: int, dtype: torch.dtype, device: torch.device) -> tat.Resample:
+    """
+    Returns a process-wide shared resampler. Resample kernels are computed once per
+    (orig_freq, new_freq, dtype, device) and least recently used kernels are evicted.
+    Resample is stateless, so instances can be shared between sessions and threads.
+    """
+    return tat.Resample(
+        orig_freq=orig_freq,
+        new_freq=new_freq,
+        dtype=dtype
+    ).to(device)
+
+
+class StreamingResampler:
+    """
+    Resamples a continuous stream chunk by chunk with the windowed sinc filter of torchaudio's Resample.
+
+    Input history is carried between chunks, so each output sample is computed once, with its full
+    filter support, instead of every chunk being zero-padded at both edges.
+
+    A chunk of n samples always yields n * new_freq // orig_freq samples, the size realloc allocates
+    buffers for. When that is not the exact rate (e.g. 4096-sample chunks at 44.1 kHz make 1486.08
+    samples), the chunk is resampled at the rate of the emitted length instead: 0.005% off, where a
+    variable output length would change the conversion geometry from chunk to chunk. Outputs are
+    aligned to the chunk, so the stream is delayed by the filter width only, 18 input samples
+    (0.4 ms) at 44.1 kHz.
+    """
+
+    def __init__(self, orig_freq: int, new_freq: int, dtype: torch.dtype, device: torch.device):
+        self.passthrough = orig_freq == new_freq
+        self.orig_freq = orig_freq
+        self.new_freq = new_freq
+        self.dtype = dtype
+        self.device = device
+        self.chunk_size = 0
+        # Input index (flattened) and weight of every non-zero filter tap: (output size, 2 * width + 2)
+        self.taps: torch.Tensor | None = None
+        self.weights: torch.Tensor | None = None
+        self.history = torch.zeros(0, dtype=dtype, device=device)
+
+    def _set_chunk_size(self, chunk_size: int):
+        output_size = chunk_size * self.new_freq // self.orig_freq
+        gcd = math.gcd(chunk_size, output_size)
+        orig_freq, new_freq = chunk_size // gcd, output_size // gcd
+        # Same filter as torchaudio's sinc_interp_hann kernel for orig_freq -> new_freq.
+        base_freq = min(orig_freq, new_freq) * ROLLOFF
+        width = math.ceil(LOWPASS_FILTER_WIDTH * orig_freq / base_freq)
+
+        # Output j lies at input position j * orig_freq / new_freq + width + 1 of history and chunk. Only
+        # 2 * width + 2 taps from width + 1 samples before it are within the filter support. The polyphase kernel
+        # of torchaudio would also multiply the zeros in between, (new_freq, 2 * width + orig_freq) per stride.
+        j = torch.arange(output_size)
+        k = torch.arange(2 * width + 2)
+        self.taps = ((j * orig_freq // new_freq)[:, None] + k).view(-1).to(self.device)
+        t = k.double() - width - (j * orig_freq % new_freq).double()[:, None] / new_freq
+        t = (t * base_freq / orig_freq).clamp_(-LOWPASS_FILTER_WIDTH, LOWPASS_FILTER_WIDTH)
+        window = torch.cos(t * math.pi / LOWPASS_FILTER_WIDTH / 2) ** 2
+        t *= math.pi
+        weights = torch.where(t == 0, 1.0, torch.sin(t) / t) * window * base_freq / orig_freq
+        self.weights = weights.to(self.dtype).to(self.device)
+        self.chunk_size = chunk_size
+
+        # Keep the most recent input as the context of the new filter.
+        context = 2 * width + 1
+        self.history = F.pad(self.history[-context:], (max(context - self.history.shape[0], 0), 0))
+
+    def __call__(self, chunk: torch.Tensor) -> torch.Tensor:
+        if self.passthrough:
+            return chunk
+
+        if chunk.shape[0] != self.chunk_size:
+            self._set_chunk_size(chunk.shape[0])
+        waveform = torch.cat((self.history, chunk.to(self.dtype)))
+        self.history = waveform[chunk.shape[0]:]
+        return (waveform.index_select(0, self.taps).view(self.weights.shape) * self.weights).sum(dim=1)
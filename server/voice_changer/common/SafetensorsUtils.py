@@ -1,16 +1,103 @@
 import json
+import mmap
 import os
+import struct
 import torch
 import torch.nn
 from typing import Tuple, List, Any
 from safetensors.torch import _remove_duplicate_names, load_file, save_file
 
+SAFETENSORS_DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool,
+}
 
-def load_model(model: torch.nn.Module, f: dict[str, Any], strict=True) -> Tuple[List[str], List[str]]:
+
+class MappedSafetensors:
+    """
+    Drop-in for safetensors.safe_open on CPU. Tensors are views of a private memory map of the file instead of copies,
+    so pages are only read when touched and tensors that are not modified share memory with the page cache.
+    """
+
+    def __init__(self, file: str):
+        with open(file, 'rb') as f:
+            # Copy-on-write, so tensors stay writable without changing the file.
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        header_size, = struct.unpack('<Q', self.map[:8])
+        self.header: dict[str, dict] = json.loads(self.map[8:8 + header_size])
+        self._metadata: dict[str, str] = self.header.pop('__metadata__', None) or {}
+        self.data_offset = 8 + header_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # Tensors keep the map alive, it is unmapped once all of them are gone.
+        pass
+
+    def keys(self) -> list[str]:
+        return list(self.header)
+
+    def metadata(self) -> dict[str, str]:
+        return self._metadata
+
+    def get_tensor(self, name: str) -> torch.Tensor:
+        info = self.header[name]
+        dtype = SAFETENSORS_DTYPES[info['dtype']]
+        start, end = info['data_offsets']
+        if start == end:
+            return torch.empty(info['shape'], dtype=dtype)
+        tensor = torch.frombuffer(self.map, dtype=dtype, count=(end - start) // dtype.itemsize, offset=self.data_offset + start)
+        return tensor.view(info['shape'])
+
+
+def load_checkpoint(file: str) -> dict[str, Any]:
+    """Loads a torch checkpoint on CPU. Tensors are memory mapped if the file uses the zip format."""
+    try:
+        return torch.load(file, map_location='cpu', mmap=True)
+    except RuntimeError:
+        # Legacy (pre zip) format cannot be mapped.
+        return torch.load(file, map_location='cpu')
+
+
+def cast_state_dict(model: torch.nn.Module, state_dict: dict[str, torch.Tensor], dtype: torch.dtype | None = None) -> dict[str, torch.Tensor]:
+    """
+    Casts floating point tensors to dtype, or to the dtype of the model tensor they replace. Tensors are cast one by one,
+    so loading with assign=True holds at most one copy of the weights besides the (mapped) source.
+    """
+    model_state_dict = model.state_dict()
+    casted = {}
+    for k, tensor in state_dict.items():
+        target = model_state_dict.get(k)
+        if tensor.is_floating_point() and (dtype is not None or target is not None):
+            tensor = tensor.to(dtype or target.dtype)
+        casted[k] = tensor
+    return casted
+
+
+def load_state_dict(model: torch.nn.Module, state_dict: dict[str, torch.Tensor], strict=True, dtype: torch.dtype | None = None, cast=True):
+    """
+    Assigns state_dict tensors to model instead of copying them into the existing parameters (see cast_state_dict).
+    With cast=False tensors are assigned as they are, e.g. memory mapped in the dtype of the checkpoint.
+    """
+    if cast:
+        state_dict = cast_state_dict(model, state_dict, dtype)
+    return model.load_state_dict(state_dict, strict=strict, assign=True)
+
+
+def load_model(model: torch.nn.Module, f: dict[str, Any], strict=True, dtype: torch.dtype | None = None, cast=True) -> Tuple[List[str], List[str]]:
     state_dict = { k: f.get_tensor(k) for k in f.keys() }
     model_state_dict = model.state_dict()
     to_removes = _remove_duplicate_names(model_state_dict, preferred_names=state_dict.keys())
-    missing, unexpected = model.load_state_dict(state_dict, strict=False)
+    missing, unexpected = load_state_dict(model, state_dict, strict=False, dtype=dtype, cast=cast)
     missing = set(missing)
     for to_remove_group in to_removes.values():
         for to_remove in to_remove_group:
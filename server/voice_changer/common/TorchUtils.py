@@ -1,7 +1,63 @@
 import torch
 
-def circular_write(new_data: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
-    offset = new_data.shape[0]
-    target[: -offset] = target[offset :].detach().clone()
-    target[-offset :] = new_data
-    return target
+
+def tensor_nbytes(tensor: torch.Tensor | None) -> int:
+    if tensor is None:
+        return 0
+    return tensor.element_size() * tensor.nelement()
+
+
+class RingBuffer:
+    """
+    Fixed-size FIFO of the most recent samples along the first dimension.
+
+    Storage is allocated twice the logical size and every write is mirrored into both halves,
+    so the logical (oldest-first) contents are always available as a contiguous slice without copying.
+    Each write touches only 2x the written length, regardless of the buffer size.
+    """
+
+    def __init__(self, size: int, dtype: torch.dtype, device: torch.device):
+        self.size = size
+        self.head = 0
+        self.buffer = torch.zeros(size * 2, dtype=dtype, device=device)
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return self.buffer.dtype
+
+    @property
+    def device(self) -> torch.device:
+        return self.buffer.device
+
+    @property
+    def nbytes(self) -> int:
+        return tensor_nbytes(self.buffer)
+
+    def write(self, new_data: torch.Tensor) -> torch.Tensor:
+        offset = new_data.shape[0]
+        if offset >= self.size:
+            # Incoming data overwrites the whole buffer. Keep only the tail.
+            new_data = new_data[-self.size :]
+            self.buffer[: self.size] = new_data
+            self.buffer[self.size :] = new_data
+            self.head = 0
+            return self.as_linear()
+
+        start = self.head
+        end = start + offset
+        self.buffer[start : end] = new_data
+        if end <= self.size:
+            self.buffer[start + self.size : end + self.size] = new_data
+        else:
+            wrap = self.size - start
+            self.buffer[start + self.size :] = new_data[:wrap]
+            self.buffer[: offset - wrap] = new_data[wrap:]
+        self.head = end % self.size
+        return self.as_linear()
+
+    def as_linear(self) -> torch.Tensor:
+        return self.buffer[self.head : self.head + self.size]
+
+    def clear(self):
+        self.buffer.zero_()
+        self.head = 0
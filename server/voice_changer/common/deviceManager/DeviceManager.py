@@ -1,7 +1,6 @@
 import torch
 import onnxruntime
 import re
-import threading
 from typing import TypedDict, Literal
 from enum import IntFlag
 
@@ -10,6 +9,8 @@ try:
 except ImportError:
     import voice_changer.common.deviceManager.DummyDML as torch_directml
 
+from voice_changer.common.ModelCompiler import CompileMode
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -48,16 +49,17 @@ class DeviceManager(object):
         self.fp16_available = False
         self.force_fp32 = False
         self.disable_jit = False
-        self.lock = threading.Lock()
+        self.compile_mode: CompileMode = 'jit'
         logger.info('Initialized DeviceManager. Backend statuses:')
         logger.info(f'* DirectML: {self.dml_enabled}, device count: {torch_directml.device_count()}')
         logger.info(f'* CUDA: {self.cuda_enabled}, device count: {torch.cuda.device_count()}')
         logger.info(f'* MPS: {self.mps_enabled}')
 
-    def initialize(self, device_id: int, force_fp32: bool, disable_jit: bool):
+    def initialize(self, device_id: int, force_fp32: bool, disable_jit: bool, compile_mode: CompileMode):
         self.set_device(device_id)
         self.force_fp32 = force_fp32
         self.disable_jit = disable_jit
+        self.compile_mode = compile_mode
 
     def set_device(self, id: int):
         if self.mps_enabled:
@@ -75,8 +77,13 @@ class DeviceManager(object):
         return self.fp16_available and not self.force_fp32
 
     def use_jit_compile(self):
+        return self.get_compile_mode() == 'jit'
+
+    def get_compile_mode(self) -> CompileMode:
         # FIXME: DirectML backend seems to have issues with JIT. Disable it for now.
-        return self.device_metadata['backend'] != 'directml' and not self.disable_jit
+        if self.device_metadata['backend'] == 'directml' or self.disable_jit:
+            return 'eager'
+        return self.compile_mode
 
     # TODO: This function should also accept backend type
     def _get_device(self, dev_id: int) -> tuple[torch.device, DevicePresentation]:
@@ -140,6 +147,13 @@ class DeviceManager(object):
             torch.cuda.empty_cache()
         self.disable_jit = disable_jit
 
+    def set_compile_mode(self, compile_mode: CompileMode):
+        if self.mps_enabled:
+            torch.mps.empty_cache()
+        elif self.cuda_enabled:
+            torch.cuda.empty_cache()
+        self.compile_mode = compile_mode
+
     def set_force_fp32(self, force_fp32: bool):
         if self.mps_enabled:
             torch.mps.empty_cache()
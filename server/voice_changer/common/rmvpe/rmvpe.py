@@ -6,6 +6,7 @@ import torch
 import numpy as np
 from safetensors import safe_open
 from voice_changer.common.SafetensorsUtils import load_model
+from voice_changer.common.ModelCompiler import CompileMode, compile_model
 from librosa.filters import mel
 
 logger = logging.getLogger(__file__)
@@ -328,7 +329,7 @@ class MelSpectrogram(torch.nn.Module):
 
 
 class RMVPE:
-    def __init__(self, model_path: str, is_half: bool, use_jit_compile: bool, device: torch.device):
+    def __init__(self, model_path: str, is_half: bool, compile_mode: CompileMode, device: torch.device):
         model = E2E(4, 1, (2, 2))
         if model_path.endswith('.safetensors'):
             with safe_open(model_path, 'pt', device=str(device) if device.type == 'cuda' else 'cpu') as cpt:
@@ -341,12 +342,8 @@ class RMVPE:
         if is_half:
             model = model.half()
 
-        self.use_jit_eager = not use_jit_compile
-        if use_jit_compile:
-            logger.info('Compiling JIT model...')
-            model = torch.jit.optimize_for_inference(torch.jit.script(model))
-
-        self.model = model
+        self.use_jit_eager = compile_mode != 'jit'
+        self.model = compile_model(model, compile_mode)
 
         self.mel_extractor = MelSpectrogram(
             is_half, 128, 16000, 1024, 160, None, 30, 8000
@@ -15,6 +15,8 @@ class Embedder(EmbedderProtocol):
         self.dev: device
 
         self.model: Any | None = None
+        # Whether extract_features() accepts a batch of equally sized audio rows.
+        self.supports_batch: bool = False
 
     def load_model(self, file: str):
         ...
@@ -1,4 +1,6 @@
+import os
 from const import EmbedderType
+from voice_changer.common.ModelRegistry import ModelRegistry, device_key
 from voice_changer.embedder.Embedder import Embedder
 from voice_changer.embedder.OnnxEmbedder import OnnxEmbedder
 from settings import ServerSettings, get_settings
@@ -6,32 +8,40 @@ import logging
 logger = logging.getLogger(__name__)
 
 class EmbedderManager:
-    embedder: Embedder | None = None
+    registry: ModelRegistry[Embedder] | None = None
     params: ServerSettings
 
     @classmethod
     def initialize(cls):
         cls.params = get_settings()
+        if cls.registry is None:
+            cls.registry = ModelRegistry('embedder', cls.params.shared_model_memory * 1024 ** 2)
 
     @classmethod
     def get_embedder(cls, embedder_type: EmbedderType, force_reload: bool = False) -> Embedder:
-        if cls.embedder is not None \
-            and cls.embedder == embedder_type \
-            and not force_reload:
-            logger.info('Reusing embedder.')
-            return cls.embedder
-        cls.embedder = cls.load_embedder(embedder_type)
-        return cls.embedder
+        """Returns a shared embedder. Callers release it with release_embedder when they no longer use it."""
+        file = cls.get_file(embedder_type)
+        # hubert_base and contentvec share the same model file, so the instance is keyed by file.
+        return cls.registry.acquire(
+            (file, *device_key()),
+            lambda: cls.load_embedder(embedder_type, file),
+            os.path.getsize(file) if os.path.isfile(file) else 0,
+            force_reload,
+        )
 
     @classmethod
-    def load_embedder(cls, embedder_type: EmbedderType) -> Embedder:
-        logger.info(f'Loading embedder {embedder_type}')
+    def release_embedder(cls, embedder: Embedder):
+        cls.registry.release(embedder)
 
+    @classmethod
+    def get_file(cls, embedder_type: EmbedderType) -> str:
         if embedder_type == "spin_base":
-            file = cls.params.spin_onnx
-            return OnnxEmbedder().load_model(file)
+            return cls.params.spin_onnx
         elif embedder_type not in ["hubert_base", "contentvec"]:
             raise RuntimeError(f'Unsupported embedder type: {embedder_type}')
-        file = cls.params.content_vec_500_onnx
-        return OnnxEmbedder().load_model(file)
+        return cls.params.content_vec_500_onnx
 
+    @classmethod
+    def load_embedder(cls, embedder_type: EmbedderType, file: str) -> Embedder:
+        logger.info(f'Loading embedder {embedder_type}')
+        return OnnxEmbedder().load_model(file)
@@ -1,13 +1,18 @@
 import numpy as np
+import onnx
 import torch
-import onnxruntime
+import torch.nn.functional as F
 from const import PitchExtractorType, F0_MIN, F0_MAX
+from voice_changer.common.OnnxSession import StaticShapeSession
+from voice_changer.common.Resampler import get_resampler
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
 from voice_changer.pitch_extractor.PitchExtractor import PitchExtractor
 from voice_changer.pitch_extractor import onnxcrepe
 
 
 class CrepeOnnxPitchExtractor(PitchExtractor):
+    # 10 ms frames, as onnxcrepe.predict(precision=10.0).
+    hop_length = onnxcrepe.SAMPLE_RATE // 100
 
     def __init__(self, type: PitchExtractorType, file: str):
         self.type = type
@@ -17,9 +22,12 @@ class CrepeOnnxPitchExtractor(PitchExtractor):
             onnxProviderOptions,
         ) = DeviceManager.get_instance().get_onnx_execution_provider()
 
-        self.onnx_session = onnxruntime.InferenceSession(
-            file, providers=onnxProviders, provider_options=onnxProviderOptions
-        )
+        # NOTE: Crepe ONNX model is FP32. Conversion was not tested so keeping the model in FP32.
+        self.onnx_session = StaticShapeSession(onnx.load(file), onnxProviders, onnxProviderOptions)
+
+        self.min_bin = int(onnxcrepe.convert.frequency_to_bins(F0_MIN))
+        self.max_bin = int(onnxcrepe.convert.frequency_to_bins(F0_MAX, np.ceil))
+        self.cents = onnxcrepe.convert.bins_to_cents(torch.arange(onnxcrepe.PITCH_BINS, dtype=torch.float32))
 
     def extract(
         self,
@@ -27,21 +35,42 @@ class CrepeOnnxPitchExtractor(PitchExtractor):
         sr: int,
         window: int,
     ) -> torch.Tensor:
-        # NOTE: Crepe ONNX model is FP32. Conversion was not tested so keeping input in FP32.
-        audio_num = audio.float().detach().cpu().numpy()
-        onnx_f0, onnx_pd = onnxcrepe.predict(
-            self.onnx_session,
-            audio_num,
-            sr,
-            precision=10.0,
-            fmin=F0_MIN,
-            fmax=F0_MAX,
-            return_periodicity=True,
-            decoder=onnxcrepe.decode.weighted_argmax,
-        )
-
-        f0: np.ndarray = onnxcrepe.filter.median(onnx_f0, 3)
-        pd: np.ndarray = onnxcrepe.filter.median(onnx_pd, 3)
+        audio = audio.float()
+        if sr != onnxcrepe.SAMPLE_RATE:
+            audio = get_resampler(sr, onnxcrepe.SAMPLE_RATE, torch.float32, audio.device)(audio)
+
+        # Same framing as onnxcrepe.preprocess. Normalization is part of the ONNX model.
+        total_frames = 1 + audio.shape[0] // self.hop_length
+        pad = onnxcrepe.WINDOW_SIZE // 2
+        frames = F.pad(audio, (pad, pad)).unfold(0, onnxcrepe.WINDOW_SIZE, self.hop_length)[:total_frames]
+
+        # (time, 360). Bound output buffer of the session, only read here.
+        probabilities = self.onnx_session.run({'frames': frames})[0]
+        f0, pd = self._decode(probabilities)
+
+        f0 = self._median(f0, 3)
+        pd = self._median(pd, 3)
 
         f0[pd < 0.1] = 0
-        return torch.as_tensor(f0, dtype=torch.float32, device=audio.device).squeeze()
+        return f0.to(audio.device)
+
+    def _decode(self, probabilities: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        # onnxcrepe.postprocess with decode.weighted_argmax, vectorized over frames.
+        bins = probabilities[:, self.min_bin:self.max_bin].argmax(dim=1) + self.min_bin
+        periodicity = probabilities.gather(1, bins[:, None]).squeeze(1)
+
+        # Weighted mean of the cents around the argmax, probabilities are clamped as with ReLU.
+        index = torch.arange(onnxcrepe.PITCH_BINS, device=probabilities.device)
+        start = (bins - 4).clamp(min=self.min_bin)
+        end = (bins + 5).clamp(max=self.max_bin)
+        mask = (index >= start[:, None]) & (index < end[:, None])
+        probs = torch.where(mask, probabilities.clamp(min=0), 0)
+        cents = (probs * self.cents.to(probs.device)).sum(dim=1) / probs.sum(dim=1)
+        return onnxcrepe.convert.cents_to_frequency(cents), periodicity
+
+    @staticmethod
+    def _median(signal: torch.Tensor, win_length: int) -> torch.Tensor:
+        # onnxcrepe.filter.median: nan-aware, windows are truncated at the edges.
+        pad = win_length // 2
+        windows = F.pad(signal[None], (pad, pad), value=float('nan'))[0].unfold(0, win_length, 1)
+        return torch.nanquantile(windows, 0.5, dim=1)
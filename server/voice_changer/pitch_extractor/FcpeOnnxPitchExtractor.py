@@ -1,13 +1,14 @@
 import numpy as np
 import torch
-import onnxruntime
 from const import PitchExtractorType
 from voice_changer.pitch_extractor.PitchExtractor import PitchExtractor
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
 from voice_changer.common.OnnxLoader import load_onnx_model
+from voice_changer.common.OnnxSession import StaticShapeSession
 from voice_changer.common.MelExtractorFcpe import Wav2MelModule
 
 class FcpeOnnxPitchExtractor(PitchExtractor):
+    context_frames = 32
 
     def __init__(self, file: str):
         super().__init__()
@@ -30,9 +31,6 @@ class FcpeOnnxPitchExtractor(PitchExtractor):
 
         self.threshold = np.array(0.006, dtype=self.fp_dtype_np)
 
-        so = onnxruntime.SessionOptions()
-        # so.log_severity_level = 3
-        # so.enable_profiling = True
         self.mel_extractor = Wav2MelModule(
             sr=16000,
             n_mels=128,
@@ -44,7 +42,7 @@ class FcpeOnnxPitchExtractor(PitchExtractor):
             clip_val=1e-05,
             is_half=self.is_half
         ).to(device_manager.device)
-        self.onnx_session = onnxruntime.InferenceSession(model.SerializeToString(), sess_options=so, providers=onnxProviders, provider_options=onnxProviderOptions)
+        self.onnx_session = StaticShapeSession(model, onnxProviders, onnxProviderOptions)
 
     def extract(
         self,
@@ -54,25 +52,6 @@ class FcpeOnnxPitchExtractor(PitchExtractor):
     ) -> torch.Tensor:
         mel = self.mel_extractor(audio.unsqueeze(0).float())
 
-        if audio.device.type == 'cuda':
-            binding = self.onnx_session.io_binding()
-
-            binding.bind_input('mel', device_type='cuda', device_id=audio.device.index, element_type=self.fp_dtype_np, shape=tuple(mel.shape), buffer_ptr=mel.contiguous().data_ptr())
-            binding.bind_cpu_input('threshold', self.threshold)
-
-            binding.bind_output('pitchf', device_type='cuda', device_id=audio.device.index)
-
-            self.onnx_session.run_with_iobinding(binding)
-
-            output = [output.numpy() for output in binding.get_outputs()]
-        else:
-            output: list[np.ndarray] = self.onnx_session.run(
-                ["pitchf"],
-                {
-                    "mel": mel.detach().cpu().numpy(),
-                    "threshold": self.threshold,
-                },
-            )
-        # self.onnx_session.end_profiling()
+        output = self.onnx_session.run({'mel': mel}, {'threshold': self.threshold})
 
         return torch.as_tensor(output[0], dtype=self.fp_dtype_t, device=audio.device).squeeze()
\ No newline at end of file
@@ -7,6 +7,7 @@ from voice_changer.common.FCPE import spawn_infer_model_from_pt
 from voice_changer.common.MelExtractorFcpe import Wav2MelModule
 
 class FcpePitchExtractor(PitchExtractor):
+    context_frames = 32
 
     def __init__(self, file: str):
         super().__init__()
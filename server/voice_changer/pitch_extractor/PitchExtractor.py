@@ -4,6 +4,9 @@ import torch
 
 class PitchExtractor(Protocol):
     type: str
+    # Frames (10ms) of preceding audio the extractor needs to produce stable f0 for new frames.
+    # None if the extractor does not support incremental extraction.
+    context_frames: int | None = None
 
     def extract(
         self,
@@ -16,4 +19,5 @@ class PitchExtractor(Protocol):
     def getPitchExtractorInfo(self):
         return {
             "pitchExtractorType": self.type,
+            "contextFrames": self.context_frames,
         }
@@ -1,3 +1,4 @@
+import os
 from typing import Protocol
 from const import PitchExtractorType
 from voice_changer.pitch_extractor.CrepeOnnxPitchExtractor import CrepeOnnxPitchExtractor
@@ -7,31 +8,51 @@ from voice_changer.pitch_extractor.RMVPEOnnxPitchExtractor import RMVPEOnnxPitch
 from voice_changer.pitch_extractor.RMVPEPitchExtractor import RMVPEPitchExtractor
 from voice_changer.pitch_extractor.FcpePitchExtractor import FcpePitchExtractor
 from voice_changer.pitch_extractor.FcpeOnnxPitchExtractor import FcpeOnnxPitchExtractor
+from voice_changer.common.ModelRegistry import ModelRegistry, device_key
 from settings import ServerSettings, get_settings
 import logging
 logger = logging.getLogger(__name__)
 
 class PitchExtractorManager(Protocol):
-    pitch_extractor: PitchExtractor | None = None
+    registry: ModelRegistry[PitchExtractor] | None = None
     params: ServerSettings
 
     @classmethod
     def initialize(cls):
         cls.params = get_settings()
+        if cls.registry is None:
+            cls.registry = ModelRegistry('pitch extractor', cls.params.shared_model_memory * 1024 ** 2)
 
     @classmethod
     def getPitchExtractor(cls, pitch_extractor: PitchExtractorType, force_reload: bool) -> PitchExtractor:
-        cls.pitch_extractor = cls.loadPitchExtractor(pitch_extractor, force_reload)
-        return cls.pitch_extractor
+        """Returns a shared pitch extractor. Callers release it with releasePitchExtractor when they no longer use it."""
+        file = cls.getFile(pitch_extractor)
+        return cls.registry.acquire(
+            (pitch_extractor, *device_key()),
+            lambda: cls.loadPitchExtractor(pitch_extractor),
+            os.path.getsize(file) if os.path.isfile(file) else 0,
+            force_reload,
+        )
 
     @classmethod
-    def loadPitchExtractor(cls, pitch_extractor: PitchExtractorType, force_reload: bool) -> PitchExtractor:
-        if cls.pitch_extractor is not None \
-            and pitch_extractor == cls.pitch_extractor.type \
-            and not force_reload:
-            logger.info('Reusing pitch extractor.')
-            return cls.pitch_extractor
+    def releasePitchExtractor(cls, pitch_extractor: PitchExtractor):
+        cls.registry.release(pitch_extractor)
 
+    @classmethod
+    def getFile(cls, pitch_extractor: PitchExtractorType) -> str:
+        return {
+            'crepe_tiny': cls.params.crepe_tiny,
+            'crepe_full': cls.params.crepe_full,
+            'crepe_tiny_onnx': cls.params.crepe_onnx_tiny,
+            'crepe_full_onnx': cls.params.crepe_onnx_full,
+            'rmvpe': cls.params.rmvpe,
+            'rmvpe_onnx': cls.params.rmvpe_onnx,
+            'fcpe': cls.params.fcpe,
+            'fcpe_onnx': cls.params.fcpe_onnx,
+        }.get(pitch_extractor, cls.params.rmvpe_onnx)
+
+    @classmethod
+    def loadPitchExtractor(cls, pitch_extractor: PitchExtractorType) -> PitchExtractor:
         logger.info(f'Loading pitch extractor {pitch_extractor}')
         try:
             if pitch_extractor == 'crepe_tiny':
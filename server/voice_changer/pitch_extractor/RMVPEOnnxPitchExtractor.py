@@ -1,13 +1,14 @@
 import numpy as np
 import torch
-import onnxruntime
 from const import PitchExtractorType
 from voice_changer.common.OnnxLoader import load_onnx_model
+from voice_changer.common.OnnxSession import StaticShapeSession
 from voice_changer.pitch_extractor.PitchExtractor import PitchExtractor
 from voice_changer.common.deviceManager.DeviceManager import DeviceManager
 from voice_changer.common.MelExtractor import MelSpectrogram
 
 class RMVPEOnnxPitchExtractor(PitchExtractor):
+    context_frames = 64
 
     def __init__(self, file: str):
         super().__init__()
@@ -28,13 +29,10 @@ class RMVPEOnnxPitchExtractor(PitchExtractor):
 
         self.threshold = np.array(0.05, dtype=self.fp_dtype_np)
 
-        so = onnxruntime.SessionOptions()
-        # so.log_severity_level = 3
-        # so.enable_profiling = True
         self.mel_extractor = MelSpectrogram(
             self.is_half, 128, 16000, 1024, 160, mel_fmin=30, mel_fmax=8000
         ).to(device_manager.device)
-        self.onnx_session = onnxruntime.InferenceSession(model.SerializeToString(), sess_options=so, providers=onnxProviders, provider_options=onnxProviderOptions)
+        self.onnx_session = StaticShapeSession(model, onnxProviders, onnxProviderOptions)
 
     def extract(
         self,
@@ -44,25 +42,6 @@ class RMVPEOnnxPitchExtractor(PitchExtractor):
     ) -> torch.Tensor:
         mel = self.mel_extractor(audio.unsqueeze(0).float())
 
-        if audio.device.type == 'cuda':
-            binding = self.onnx_session.io_binding()
-
-            binding.bind_input('mel', device_type='cuda', device_id=audio.device.index, element_type=self.fp_dtype_np, shape=tuple(mel.shape), buffer_ptr=mel.data_ptr())
-            binding.bind_cpu_input('threshold', self.threshold)
-
-            binding.bind_output('pitchf', device_type='cuda', device_id=audio.device.index)
-
-            self.onnx_session.run_with_iobinding(binding)
-
-            output = [output.numpy() for output in binding.get_outputs()]
-        else:
-            output: list[np.ndarray] = self.onnx_session.run(
-                ["pitchf"],
-                {
-                    "mel": mel.detach().cpu().numpy(),
-                    "threshold": self.threshold,
-                },
-            )
-        # self.onnx_session.end_profiling()
+        output = self.onnx_session.run({'mel': mel}, {'threshold': self.threshold})
 
         return torch.as_tensor(output[0], dtype=self.fp_dtype_t, device=audio.device).squeeze()
\ No newline at end of file
@@ -6,13 +6,14 @@ import torch
 
 
 class RMVPEPitchExtractor(PitchExtractor):
+    context_frames = 64
 
     def __init__(self, file: str):
         super().__init__()
         self.type: PitchExtractorType = "rmvpe"
 
         device_manager = DeviceManager.get_instance()
-        self.rmvpe = RMVPE(model_path=file, is_half=device_manager.use_fp16(), use_jit_compile=device_manager.use_jit_compile(), device=device_manager.device)
+        self.rmvpe = RMVPE(model_path=file, is_half=device_manager.use_fp16(), compile_mode=device_manager.get_compile_mode(), device=device_manager.device)
 
     def extract(
         self,
@@ -25,23 +25,48 @@ class VoiceChangerModel(Protocol):
     def get_info(self) -> dict[str, Any]:
         ...
 
+    def get_session_info(self) -> dict[str, Any]:
+        ...
+
+    def create_session(self, settings: VoiceChangerSettings) -> "VoiceChangerModel":
+        ...
+
     def convert(self, data: torch.Tensor, sample_rate: int) -> torch.Tensor:
         ...
 
     def inference(self, data: tuple[Any, ...]) -> torch.Tensor:
         ...
 
+    def skip(self, data: AudioInOutFloat):
+        """Appends input to the conversion context without converting it."""
+        ...
+
     def update_settings(self, key: str, val: Any, old_val: Any):
         ...
 
     def set_sampling_rate(self, inputSampleRate: int, outputSampleRate: int):
         ...
 
+    def warmup(self):
+        """Runs a conversion of the current (silent) buffers, so the next chunk does not pay for lazy initialization."""
+        ...
+
+    def handover(self, previous: "VoiceChangerModel"):
+        """Takes over the streaming state of the model that is being replaced."""
+        ...
+
+    def release(self):
+        """Called once the model is deactivated (replaced or discarded), so pooled resources can be evicted."""
+        ...
+
     def realloc(self, block_frame: int, extra_frame: int, crossfade_frame: int, sola_search_frame: int):
         ...
 
     def export2onnx() -> Any:
         ...
 
+    def compress_index(self, mode: str, table_dtype: str) -> dict:
+        ...
+
     def get_model_current(self) -> dict:
         ...